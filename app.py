@@ -1,48 +1,73 @@
-from flask import Flask, render_template
+from flask import Flask, jsonify, render_template
+from flask.cli import AppGroup
+import click
+import json
 import logging
 import os
+import shutil
+import tempfile
+import time
 from db.schema import init_db
-from db import check_db_file
+from db import check_db_file, close_connections, configure_pool, get_pool_stats, get_read_connection, get_writer, READ
+from db.integrity import get_integrity_status, run_integrity_check, startup_integrity_check
 from routes.deck_routes import deck_bp
 from routes.word_routes import word_bp
 from routes.fsrs_routes import fsrs_bp
+from routes.metrics_routes import metrics_bp
+from utils import metrics
+from utils.log_utils import setup_console_logging, setup_logging
+
+def initialize():
+    """
+    One-time startup work: logging, the database file check and schema
+    creation or migration. In a pre-forking server this runs once, in the
+    master process.
+    """
+    # 配置日志：日志经队列交给后台线程写入控制台和按大小轮转的日志文件
+    setup_logging()
+
+    # 检查数据库文件（只检查能否打开，完整性检查见 db.integrity）
+    check_db_file()
+
+    # Initialize database
+    init_db()
+
+def create_app(setup=True):
+    """
+    Create the Flask application.
+
+    Args:
+        setup (bool, optional): Run ``initialize()`` first. Server workers pass
+                                False, as the master already did. Defaults to True.
+
+    Returns:
+        flask.Flask: The application.
+    """
+    if setup:
+        initialize()
+
+    # Create Flask app
+    app = Flask(__name__)
+
+    # 启用详细日志
+    app.logger.setLevel(logging.INFO)
+
+    # Register blueprints
+    app.register_blueprint(deck_bp)
+    app.register_blueprint(word_bp)
+    app.register_blueprint(fsrs_bp)
+    app.register_blueprint(metrics_bp)
+
+    app.add_url_rule('/', view_func=index)
+    app.add_url_rule('/db_stats', view_func=db_stats, methods=['GET'])
+    app.add_url_rule('/health', view_func=health, methods=['GET'])
+
+    app.cli.add_command(serve_command)
+    for command in commands.commands.values():
+        app.cli.add_command(command)
+
+    return app
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('app.log')
-    ]
-)
-
-# 检查数据库文件
-check_db_file()
-
-# Create Flask app
-app = Flask(__name__)
-
-# 启用详细日志
-app.logger.setLevel(logging.INFO)
-
-# 检查临时目录
-temp_dir = os.path.join(os.getcwd(), 'temp')
-if not os.path.exists(temp_dir):
-    os.makedirs(temp_dir)
-    logging.info(f"Created temporary directory: {temp_dir}")
-else:
-    logging.info(f"Temporary directory already exists: {temp_dir}")
-
-# Register blueprints
-app.register_blueprint(deck_bp)
-app.register_blueprint(word_bp)
-app.register_blueprint(fsrs_bp)
-
-# Initialize database
-init_db()
-
-@app.route('/')
 def index():
     """
     Render the index page.
@@ -52,5 +77,248 @@ def index():
     """
     return render_template('index.html')
 
+def db_stats():
+    """
+    Get usage statistics of the read and write connection pools and the database writer.
+
+    Returns:
+        flask.Response: A JSON response containing the pool and writer counters.
+    """
+    return jsonify({'pools': get_pool_stats(), 'writer': get_writer().stats()})
+
+def health():
+    """
+    Report whether the service can reach the database, and the result of the
+    latest integrity check.
+
+    The integrity check does not gate readiness: while it is pending or
+    running the service is healthy; a failed check reports ``degraded``.
+
+    Returns:
+        flask.Response: A JSON response with the status, the database check
+                        time in milliseconds and the latest integrity check;
+                        503 if the database cannot be queried.
+    """
+    start = time.perf_counter()
+    try:
+        conn = get_read_connection()
+        try:
+            integrity = get_integrity_status(conn.cursor())
+        finally:
+            conn.close()
+    except Exception as e:
+        logging.error(f"Health check failed: {str(e)}")
+        return jsonify({'status': 'unavailable', 'error': '无法连接数据库'}), 503
+
+    status = 'degraded' if integrity['status'] in ('failed', 'error') else 'ok'
+    return jsonify({
+        'status': status,
+        'database_ms': round((time.perf_counter() - start) * 1000, 3),
+        'integrity': integrity
+    })
+
+# 维护命令，由 create_app 注册到 flask 命令行
+commands = AppGroup('commands')
+
+@commands.command('verify-due-cache')
+@click.option('--url', default='http://127.0.0.1:5000', show_default=True, help='Address of the running server.')
+@click.option('--deck-id', type=int, multiple=True, help='Deck to check (repeatable). Defaults to all cached decks.')
+def verify_due_cache_command(url, deck_id):
+    """
+    Diff the running server's due-queue cache against the database.
+
+    The cache lives in the server process, so the check is run there through
+    ``/due_cache/verify`` and its report printed here.
+    """
+    import urllib.request
+    from urllib.parse import urlencode
+
+    query = urlencode([('deck_id', d) for d in deck_id])
+    with urllib.request.urlopen(f"{url.rstrip('/')}/due_cache/verify?{query}") as response:
+        report = json.load(response)
+
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+    if not report.get('consistent'):
+        raise SystemExit(1)
+
+@commands.command('check-db')
+@click.option('--full', is_flag=True, help='Run PRAGMA integrity_check instead of the faster quick_check.')
+def check_db_command(full):
+    """
+    Check the database file for corruption and record the result for /health.
+
+    The check reads the whole file, so it takes time proportional to its size.
+    """
+    result = run_integrity_check('full' if full else 'quick')
+    if result['status'] != 'ok':
+        raise click.ClickException(f"Integrity check {result['status']}: {result['problems']}")
+    click.echo(f"Integrity check passed in {result['finished_at'] - result['started_at']} ms")
+
+@commands.command('reschedule-deck')
+@click.argument('deck_id', type=int)
+def reschedule_deck_command(deck_id):
+    """
+    Recompute the schedule of every card in a deck, e.g. after the FSRS parameters change.
+    """
+    from models.fsrs import reschedule_deck
+
+    changed = reschedule_deck(deck_id)
+    if changed is None:
+        raise click.ClickException(f'Failed to reschedule deck {deck_id}')
+    click.echo(f'Rescheduled {changed} cards in deck {deck_id}')
+
+@commands.command('optimize-fsrs')
+@click.option('--deck-id', type=int, default=None, help='Fit on one deck only. Defaults to all decks.')
+@click.option('--iterations', type=int, default=50, show_default=True, help='Number of gradient steps.')
+@click.option('--workers', type=int, default=None, help='Worker processes. Defaults to the CPU count.')
+@click.option('--activate', is_flag=True, help='Activate the fitted parameters right away.')
+def optimize_fsrs_command(deck_id, iterations, workers, activate):
+    """
+    Fit the FSRS weights to the review log and store them as a new parameter set.
+    """
+    from models.fsrs import save_fsrs_parameters
+    from models.fsrs_optimizer import optimize_fsrs_parameters
+
+    result = optimize_fsrs_parameters(deck_id, iterations=iterations, workers=workers)
+    if result is None:
+        raise click.ClickException('No reviews to fit on')
+
+    parameter_id = save_fsrs_parameters(
+        result['w'],
+        deck_id=deck_id,
+        request_retention=result['request_retention'],
+        maximum_interval=result['maximum_interval'],
+        loss=result['loss'],
+        review_count=result['review_count'],
+        activate=activate
+    )
+    if parameter_id is None:
+        raise click.ClickException('Failed to save the fitted parameters')
+
+    click.echo(f"Loss {result['initial_loss']:.5f} -> {result['loss']:.5f} on {result['review_count']} reviews")
+    click.echo(f"Saved parameter set {parameter_id}{' (active)' if activate else ''}: {json.dumps(result['w'])}")
+
+@commands.command('simulate-retention')
+@click.argument('deck_id', type=int)
+@click.option('--learners', type=int, default=200, show_default=True, help='Number of virtual learners.')
+@click.option('--days', type=int, default=365, show_default=True, help='Number of days to simulate.')
+@click.option('--new-per-day', type=int, default=20, show_default=True, help='New cards learned per day.')
+@click.option('--workers', type=int, default=None, help='Worker processes. Defaults to the CPU count.')
+@click.option('--seed', type=int, default=0, show_default=True, help='Random seed.')
+def simulate_retention_command(deck_id, learners, days, new_per_day, workers, seed):
+    """
+    Simulate the review load and retention of a deck for a range of target retentions.
+    """
+    from models.fsrs_simulator import simulate_retentions
+
+    result = simulate_retentions(
+        deck_id, learners=learners, days=days, new_per_day=new_per_day, workers=workers, seed=seed
+    )
+    if result is None:
+        raise click.ClickException(f'No cards to simulate in deck {deck_id}')
+
+    click.echo(f"Deck {deck_id}: {result['cards']} cards ({result['sampled_cards']} sampled), "
+               f"{learners} learners, {days} days, {new_per_day} new cards per day")
+    click.echo('retention  reviews/day  memorized  actual  memorized/review')
+    for row in result['results']:
+        marker = ' *' if row['request_retention'] == result['optimal_retention'] else ''
+        click.echo(f"{row['request_retention']:9.2f}  {row['reviews_per_day']:11.1f}  {row['memorized']:9.1f}  "
+                   f"{row['retention']:6.3f}  {row['memorized_per_review']:16.4f}{marker}")
+    click.echo(f"Optimal retention: {result['optimal_retention']:.2f} (current {result['current_retention']:.2f})")
+
+def _post_fork(server, worker):
+    """
+    Prepare a freshly forked worker: restart logging, size the read pool for
+    the worker's threads and disable the caches that only see this process's
+    writes.
+    """
+    from models.due_cache import due_cache
+    from models.forecast import forecast_cache
+
+    # 多进程时日志文件无法安全轮转，工作进程只输出到控制台（由主进程的标准错误收集）
+    setup_logging(log_file=None)
+    configure_pool(sizes={READ: max(worker.cfg.threads, 2)})
+
+    if server.cfg.workers > 1:
+        due_cache.disable()
+        forecast_cache.disable()
+
+    # 定期写入本进程的指标快照，/metrics 汇总所有工作进程的快照
+    metrics.start_snapshots()
+    logging.info(f"Worker {worker.pid} ready with {worker.cfg.threads} threads")
+
+def _worker_exit(server, worker):
+    # 退出前写入最后的指标快照
+    metrics.write_snapshot()
+
+def _child_exit(server, worker):
+    # 已退出的工作进程的计数仍计入总数
+    metrics.retire_worker(worker.pid)
+
+@click.command('serve')
+@click.option('--bind', default='127.0.0.1:5000', show_default=True, help='Address to listen on.')
+@click.option('--workers', type=int, default=None, help='Worker processes. Defaults to the CPU count.')
+@click.option('--threads', type=int, default=4, show_default=True, help='Request threads per worker.')
+@click.option('--timeout', type=int, default=120, show_default=True, help='Worker timeout in seconds.')
+@click.option('--keepalive', type=int, default=75, show_default=True, help='Seconds an idle connection is kept open.')
+@click.option('--connections', type=int, default=1000, show_default=True, help='Open connections per worker.')
+def serve_command(bind, workers, threads, timeout, keepalive, connections):
+    """
+    Serve the application with the pre-forking gunicorn server.
+
+    Startup work has already run in this (master) process when the command
+    line loaded the app. The master then closes its database connections and
+    log listener, and each worker creates its own app and connections after fork.
+
+    ``/metrics`` adds up the metrics of all workers, whichever worker serves
+    the scrape.
+
+    Idle keep-alive connections wait in each worker's poller and
+    only take a thread while a request is being handled, so a worker keeps
+    up to ``--connections`` review sessions open with ``--threads`` threads.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise click.ClickException('gunicorn is not installed (pip install gunicorn); it does not run on Windows')
+
+    options = {
+        'bind': bind,
+        'workers': workers or os.cpu_count() or 1,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'timeout': timeout,
+        'keepalive': keepalive,
+        'worker_connections': connections,
+        'post_fork': _post_fork,
+        'worker_exit': _worker_exit,
+        'child_exit': _child_exit,
+        'on_exit': lambda server: shutil.rmtree(snapshot_dir, ignore_errors=True)
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app(setup=False)
+
+    # 主进程不处理请求，分叉前关闭数据库连接和日志线程。主进程的日志直接输出到控制台，
+    # 日志队列和后台线程在各工作进程中启动（见 _post_fork）
+    close_connections()
+    setup_console_logging()
+
+    # 各工作进程的指标快照保存在本次运行专用的目录中，主进程退出时删除
+    snapshot_dir = tempfile.mkdtemp(prefix='nekowords-metrics-')
+    metrics.enable_multiprocess(snapshot_dir)
+
+    # 完整性检查在主进程中进行，使用独立的连接，结果写入数据库供各工作进程的 /health 读取
+    startup_integrity_check()
+
+    Server().run()
+
 if __name__ == '__main__':
+    app = create_app()
+    startup_integrity_check()
     app.run(debug=True)
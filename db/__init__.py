@@ -1,11 +1,38 @@
+import atexit
 import sqlite3
 import os
 import logging
-import time
+import threading
+from db.pool import ConnectionPool
+from db.writer import DatabaseWriter
+from utils import metrics
 
 # 确保数据库目录存在
 DB_PATH = 'srs_data.db'
 
+# 连接的用途，决定使用哪个连接池
+READ = 'read'
+WRITE = 'write'
+
+# 连接池参数，读写连接池相同
+POOL_SETTINGS = {
+    'timeout': 20.0,                 # 锁等待和借用连接的超时时间（秒）
+    'cached_statements': 256,        # 每个连接缓存的预编译语句数
+    'cache_size': -16000,            # 页缓存大小（负数表示 KiB）
+    'mmap_size': 256 * 1024 * 1024,  # 内存映射大小（字节）
+}
+
+# 各连接池的最大连接数。写入集中在写线程，只需少量读写连接
+POOL_SIZES = {
+    READ: 8,
+    WRITE: 4
+}
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+_writer = None
+
 def check_db_file():
     """
     Check if the database file exists and is writable.
@@ -29,53 +56,206 @@ def check_db_file():
             except Exception as e:
                 logging.error(f"Failed to change permissions of {DB_PATH}: {str(e)}")
 
-        # 检查数据库文件是否被锁定
+        # 检查数据库文件是否可以打开：只读取文件头，耗时与数据库大小无关。
+        # 完整性检查会扫描整个文件，由 db.integrity 在后台或通过命令行执行
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=1.0)
-            conn.execute('PRAGMA quick_check')
+            conn = sqlite3.connect(DB_PATH, timeout=POOL_SETTINGS['timeout'])
+            conn.execute('PRAGMA schema_version')
             conn.close()
-            logging.info(f"Database file {DB_PATH} is accessible and not locked")
+            logging.info(f"Database file {DB_PATH} is accessible")
         except sqlite3.OperationalError as e:
             if "database is locked" in str(e):
-                logging.error(f"Database file {DB_PATH} is locked")
-                # 尝试等待一段时间
-                time.sleep(2.0)
-                try:
-                    conn = sqlite3.connect(DB_PATH, timeout=1.0)
-                    conn.execute('PRAGMA quick_check')
-                    conn.close()
-                    logging.info(f"Database file {DB_PATH} is now accessible")
-                except Exception as e2:
-                    logging.error(f"Database file {DB_PATH} is still locked after waiting: {str(e2)}")
+                logging.error(f"Database file {DB_PATH} is still locked after waiting {POOL_SETTINGS['timeout']} seconds")
             else:
                 logging.error(f"Error checking database file {DB_PATH}: {str(e)}")
     except Exception as e:
         logging.error(f"Error checking database file: {str(e)}")
 
-def get_db_connection():
+def get_pool(operation=WRITE):
     """
-    Get a connection to the SQLite database.
+    Get the process-wide connection pool for an operation type, creating it on first use.
+
+    Args:
+        operation (str, optional): ``READ`` for the read-only pool, ``WRITE`` for the
+                                   read-write pool. Defaults to ``WRITE``.
 
     Returns:
-        sqlite3.Connection: A connection to the database.
+        ConnectionPool: The connection pool.
     """
-    try:
-        # 使用超时参数，避免长时间等待锁
-        conn = sqlite3.connect(DB_PATH, timeout=20.0)
+    pool = _pools.get(operation)
+    if pool is None:
+        if operation not in POOL_SIZES:
+            raise ValueError(f"Unknown operation type: {operation}")
+        with _pool_lock:
+            pool = _pools.get(operation)
+            if pool is None:
+                pool = ConnectionPool(
+                    DB_PATH, max_size=POOL_SIZES[operation], read_only=operation == READ, **POOL_SETTINGS
+                )
+                _pools[operation] = pool
+    return pool
 
-        # 设置数据库为 WAL 模式，减少锁定问题
-        conn.execute('PRAGMA journal_mode=WAL')
+def configure_pool(sizes=None, **settings):
+    """
+    Update the pool settings and replace the current pools.
+
+    Idle connections of the old pools are closed immediately; connections still
+    checked out are closed when they are released.
 
-        # 设置同步模式为 NORMAL，提高性能
-        conn.execute('PRAGMA synchronous=NORMAL')
+    Args:
+        sizes (dict, optional): New maximum sizes by operation type, as in ``POOL_SIZES``.
+        **settings: Any of the keys in ``POOL_SETTINGS``.
+    """
+    unknown = (set(settings) - set(POOL_SETTINGS)) | (set(sizes or ()) - set(POOL_SIZES))
+    if unknown:
+        raise ValueError(f"Unknown pool settings: {', '.join(sorted(unknown))}")
 
-        # 启用外键约束
-        conn.execute('PRAGMA foreign_keys=ON')
+    with _pool_lock:
+        POOL_SETTINGS.update(settings)
+        POOL_SIZES.update(sizes or {})
+        old_pools = list(_pools.values())
+        _pools.clear()
+    for old_pool in old_pools:
+        old_pool.close_all()
 
-        # 设置行工厂
-        conn.row_factory = sqlite3.Row
+def get_pool_stats():
+    """
+    Get usage statistics of the read and write connection pools.
+
+    Returns:
+        dict: Checkouts, waits, opens, current occupancy and utilization of each
+              pool, by operation type.
+    """
+    return {operation: get_pool(operation).stats() for operation in POOL_SIZES}
 
-        return conn
+def get_db_connection(operation=WRITE):
+    """
+    Get a connection to the SQLite database from the pool for an operation type.
+
+    Read-write connections are already configured (WAL, synchronous, foreign
+    keys, cache and mmap sizes); read-only connections are opened with
+    ``mode=ro`` and ``query_only``. Calling ``close()`` on the connection returns
+    it to its pool.
+
+    Args:
+        operation (str, optional): ``READ`` or ``WRITE``. Defaults to ``WRITE``.
+
+    Returns:
+        PooledConnection: A pooled connection to the database.
+    """
+    try:
+        return get_pool(operation).connect()
     except Exception as e:
         logging.error(f"Error connecting to database: {str(e)}")
         raise
+
+def get_read_connection():
+    """
+    Get a read-only connection, for queries that never write.
+
+    Long scans on these connections never hold up the database writer.
+
+    Returns:
+        PooledConnection: A pooled read-only connection to the database.
+    """
+    return get_db_connection(READ)
+
+def get_writer():
+    """
+    Get the process-wide database writer, creating it on first use.
+
+    Returns:
+        DatabaseWriter: The database writer.
+    """
+    global _writer
+    if _writer is None:
+        with _pool_lock:
+            if _writer is None:
+                _writer = DatabaseWriter(get_db_connection)
+                # 退出前提交队列中剩余的写入
+                atexit.register(_writer.stop)
+    return _writer
+
+def close_connections():
+    """
+    Stop the database writer and close every pooled connection.
+
+    Called in a server's master process before it forks workers: SQLite
+    connections must not be shared across ``fork()``, so each worker opens its
+    own on first use.
+    """
+    global _writer
+    with _pool_lock:
+        writer, _writer = _writer, None
+        pools = list(_pools.values())
+        _pools.clear()
+
+    if writer is not None:
+        writer.stop()
+    for pool in pools:
+        pool.close_all()
+
+def submit_write(fn, *args, **kwargs):
+    """
+    Queue a write on the database writer thread.
+
+    Args:
+        fn (callable): The write, called as ``fn(cursor, *args, **kwargs)`` inside
+                       a transaction shared with other queued writes.
+        *args: Positional arguments for ``fn``.
+        **kwargs: Keyword arguments for ``fn``.
+
+    Returns:
+        concurrent.futures.Future: Resolves to the return value of ``fn`` once committed.
+    """
+    return get_writer().submit(fn, *args, **kwargs)
+
+def execute_write(fn, *args, **kwargs):
+    """
+    Run a write on the database writer thread and wait for it to be committed.
+
+    Args:
+        fn (callable): The write, called as ``fn(cursor, *args, **kwargs)``.
+        *args: Positional arguments for ``fn``.
+        **kwargs: Keyword arguments for ``fn``.
+
+    Returns:
+        The return value of ``fn``. Exceptions raised by ``fn`` are re-raised.
+    """
+    return get_writer().execute(fn, *args, **kwargs)
+
+# 抓取指标时只读取已有的连接池和写线程，不为此创建它们，尚未创建时报告 0
+def _pool_metric(key):
+    def collect():
+        with _pool_lock:
+            pools = dict(_pools)
+        return [
+            ((operation,), pools[operation].stats()[key] if operation in pools else 0)
+            for operation in POOL_SIZES
+        ]
+    return collect
+
+def _writer_metric(key):
+    def collect():
+        writer = _writer
+        return [((), writer.stats()[key] if writer is not None else 0)]
+    return collect
+
+# 连接池和写线程的计数在抓取指标时读取
+for _name, _type, _key, _documentation in (
+    ('nekowords_db_pool_checkouts_total', 'counter', 'checkouts', 'Connections checked out of the pool.'),
+    ('nekowords_db_pool_waits_total', 'counter', 'waits', 'Checkouts that had to wait for a free connection.'),
+    ('nekowords_db_pool_wait_seconds_total', 'counter', 'wait_seconds', 'Time spent waiting for a free connection.'),
+    ('nekowords_db_pool_overflows_total', 'counter', 'overflows', 'Temporary connections opened for nested checkouts.'),
+    ('nekowords_db_pool_in_use', 'gauge', 'in_use', 'Connections currently checked out.'),
+    ('nekowords_db_pool_utilization', 'gauge', 'utilization', 'Share of the pool currently checked out.'),
+):
+    metrics.collector(_name, _documentation, _type, ('pool',), _pool_metric(_key))
+
+for _name, _type, _key, _documentation in (
+    ('nekowords_db_write_tasks_total', 'counter', 'tasks', 'Write tasks run by the database writer.'),
+    ('nekowords_db_write_failed_total', 'counter', 'failed', 'Write tasks that raised and were rolled back.'),
+    ('nekowords_db_write_transactions_total', 'counter', 'transactions', 'Transactions committed by the database writer.'),
+    ('nekowords_db_write_queued', 'gauge', 'queued', 'Write tasks waiting in the writer queue.'),
+):
+    metrics.collector(_name, _documentation, _type, (), _writer_metric(_key))
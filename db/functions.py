@@ -0,0 +1,31 @@
+from db.stats import DAY_MS
+
+def retrievability(stability, last_review, now):
+    """
+    Current probability of recalling a card, ``0.9 ** (elapsed_days / stability)``.
+
+    Registered in SQLite as ``fsrs_retrievability(stability, last_review, now)``.
+
+    Args:
+        stability (float): Stability in days.
+        last_review (int): Time of the last review as a millisecond timestamp.
+        now (int): The current time as a millisecond timestamp.
+
+    Returns:
+        float or None: The retrievability, or None for cards that were never
+                       reviewed or have no stability yet.
+    """
+    if not stability or stability <= 0 or not last_review or now is None:
+        return None
+
+    elapsed_days = max(now - last_review, 0) / DAY_MS
+    return 0.9 ** (elapsed_days / stability)
+
+def register_functions(conn):
+    """
+    Register the application's SQL functions on a connection.
+
+    Args:
+        conn (sqlite3.Connection): The connection.
+    """
+    conn.create_function('fsrs_retrievability', 3, retrievability, deterministic=True)
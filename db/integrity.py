@@ -0,0 +1,176 @@
+import logging
+import sqlite3
+import threading
+import time
+from db import DB_PATH, POOL_SETTINGS
+
+# 启动时的完整性检查方式：'background' 在后台线程中检查，不阻塞启动；
+# 'blocking' 在启动时检查完成后再继续；'off' 不检查，只能通过命令行手动检查
+STARTUP_INTEGRITY_CHECK = 'background'
+
+# 检查方式对应的 PRAGMA：quick_check 不检查索引内容，比 integrity_check 快得多
+CHECK_PRAGMAS = {
+    'quick': 'PRAGMA quick_check',
+    'full': 'PRAGMA integrity_check'
+}
+
+# 最多记录的问题条数
+MAX_REPORTED_PROBLEMS = 100
+
+_thread = None
+_thread_lock = threading.Lock()
+
+def create_integrity_tables(c):
+    """
+    Create the table recording integrity check runs.
+
+    Results are kept in the database rather than in memory, so that every
+    worker process and the command line see the same latest check.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS integrity_checks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mode TEXT,                          -- quick, full
+            status TEXT,                        -- running, ok, failed, error, interrupted
+            problems TEXT,                      -- 检查发现的问题（每行一条）或错误信息
+            started_at INTEGER,
+            finished_at INTEGER
+        )
+    ''')
+
+def _connect():
+    # 检查使用独立的连接，不经过连接池和写线程：后台检查可能在主进程分叉工作进程时仍在运行，
+    # 不能让连接池或写线程在分叉前被重新创建
+    return sqlite3.connect(DB_PATH, timeout=POOL_SETTINGS['timeout'])
+
+def run_integrity_check(mode='quick'):
+    """
+    Check the database file for corruption and record the result.
+
+    The check reads the whole file, so it takes time proportional to the
+    database size. It runs in a read transaction and does not block writers,
+    but the WAL file cannot be checkpointed until it finishes.
+
+    Args:
+        mode (str, optional): 'quick' for ``PRAGMA quick_check`` or 'full' for
+                              ``PRAGMA integrity_check``. Defaults to 'quick'.
+
+    Returns:
+        dict: The recorded check, see ``get_integrity_status``.
+    """
+    if mode not in CHECK_PRAGMAS:
+        raise ValueError(f"Unknown integrity check mode: {mode}")
+
+    started_at = int(time.time() * 1000)
+    check_id = None
+    try:
+        conn = _connect()
+    except sqlite3.Error as e:
+        logging.error(f"Cannot open {DB_PATH} for the integrity check: {str(e)}")
+        return {'mode': mode, 'status': 'error', 'problems': str(e), 'started_at': started_at, 'finished_at': None}
+
+    try:
+        with conn:
+            check_id = conn.execute(
+                "INSERT INTO integrity_checks (mode, status, started_at) VALUES (?, 'running', ?)",
+                (mode, started_at)
+            ).lastrowid
+
+        logging.info(f"Running {mode} integrity check of {DB_PATH}")
+        try:
+            rows = conn.execute(f'{CHECK_PRAGMAS[mode]}({MAX_REPORTED_PROBLEMS})').fetchall()
+            problems = [row[0] for row in rows]
+            status = 'ok' if problems == ['ok'] else 'failed'
+            detail = None if status == 'ok' else '\n'.join(problems)
+        except sqlite3.DatabaseError as e:
+            # 文件严重损坏时检查本身也会失败
+            status, detail = 'error', str(e)
+
+        finished_at = int(time.time() * 1000)
+        with conn:
+            conn.execute(
+                'UPDATE integrity_checks SET status = ?, problems = ?, finished_at = ? WHERE id = ?',
+                (status, detail, finished_at, check_id)
+            )
+
+        if status == 'ok':
+            logging.info(f"Integrity check of {DB_PATH} passed in {finished_at - started_at} ms")
+        else:
+            logging.error(f"Integrity check of {DB_PATH} {status}: {detail}")
+
+        return {
+            'id': check_id, 'mode': mode, 'status': status, 'problems': detail,
+            'started_at': started_at, 'finished_at': finished_at
+        }
+    except sqlite3.Error as e:
+        logging.error(f"Error running the integrity check of {DB_PATH}: {str(e)}")
+        return {
+            'id': check_id, 'mode': mode, 'status': 'error', 'problems': str(e),
+            'started_at': started_at, 'finished_at': None
+        }
+    finally:
+        conn.close()
+
+def start_integrity_check(mode='quick'):
+    """
+    Run an integrity check in a background thread, unless one is already running
+    in this process.
+
+    Args:
+        mode (str, optional): 'quick' or 'full'. Defaults to 'quick'.
+
+    Returns:
+        bool: True if a check was started.
+    """
+    global _thread
+    with _thread_lock:
+        if _thread is not None and _thread.is_alive():
+            return False
+        # 守护线程：进程退出时不等待检查完成，未完成的检查在下次启动时标记为中断
+        _thread = threading.Thread(target=run_integrity_check, args=(mode,), name='integrity-check', daemon=True)
+        _thread.start()
+    return True
+
+def get_integrity_status(c):
+    """
+    Get the latest integrity check.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+
+    Returns:
+        dict: The mode, status ('pending' if no check has run yet, 'running',
+              'ok', 'failed', 'error' or 'interrupted'), the problems found and
+              the start and finish times of the latest check.
+    """
+    c.execute('''
+        SELECT id, mode, status, problems, started_at, finished_at
+        FROM integrity_checks ORDER BY id DESC LIMIT 1
+    ''')
+    row = c.fetchone()
+    if row is None:
+        return {'status': 'pending'}
+    return {
+        'id': row[0], 'mode': row[1], 'status': row[2], 'problems': row[3],
+        'started_at': row[4], 'finished_at': row[5]
+    }
+
+def startup_integrity_check(mode=None):
+    """
+    Run the integrity check a server does when it starts, as configured by
+    ``STARTUP_INTEGRITY_CHECK``.
+
+    Args:
+        mode (str, optional): 'background', 'blocking' or 'off'. Defaults to
+                              ``STARTUP_INTEGRITY_CHECK``.
+    """
+    mode = mode or STARTUP_INTEGRITY_CHECK
+    if mode == 'background':
+        start_integrity_check()
+    elif mode == 'blocking':
+        run_integrity_check()
+    elif mode != 'off':
+        raise ValueError(f"Unknown startup integrity check mode: {mode}")
@@ -0,0 +1,334 @@
+import re
+import sqlite3
+import logging
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from db.functions import register_functions
+from utils import metrics
+
+QUERY_SECONDS = metrics.histogram(
+    'nekowords_db_query_seconds', 'Time to execute an SQL statement, by statement kind and table.',
+    ('operation', 'table')
+)
+BUSY_ERRORS = metrics.counter(
+    'nekowords_db_busy_errors_total', 'Statements that failed because the database was locked or busy.'
+)
+
+# 语句所操作的表：FROM / INTO / UPDATE / TABLE 之后的第一个表名
+_TABLE_RE = re.compile(
+    r'\b(?:FROM|INTO|UPDATE(?:\s+OR\s+\w+)?|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)\s+([A-Za-z_]\w*)',
+    re.IGNORECASE
+)
+
+@lru_cache(maxsize=1024)
+def statement_label(sql):
+    """
+    Get the metric labels of an SQL statement.
+
+    Statements are parameterized, so their text repeats and the result is cached.
+
+    Args:
+        sql (str): The statement.
+
+    Returns:
+        tuple: The statement keyword (lower case) and the main table; per-deck
+               table suffixes are replaced by ``_N`` to keep the label set small.
+    """
+    words = sql.split(None, 1)
+    operation = words[0].lower() if words else 'other'
+    match = _TABLE_RE.search(sql)
+    return operation, re.sub(r'_\d+$', '_N', match.group(1)) if match else ''
+
+def _timed(execute, sql):
+    start = time.perf_counter()
+    try:
+        return execute()
+    except sqlite3.OperationalError as e:
+        if 'locked' in str(e) or 'busy' in str(e):
+            BUSY_ERRORS.inc()
+        raise
+    finally:
+        QUERY_SECONDS.observe(time.perf_counter() - start, *statement_label(sql))
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    A cursor that records the execution time of each statement in ``QUERY_SECONDS``.
+
+    For queries this covers preparing the statement and producing the first
+    row; fetching the remaining rows is not included.
+    """
+
+    def execute(self, sql, parameters=()):
+        return _timed(lambda: super(TimedCursor, self).execute(sql, parameters), sql)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _timed(lambda: super(TimedCursor, self).executemany(sql, seq_of_parameters), sql)
+
+class TimedConnection(sqlite3.Connection):
+    """
+    A connection whose cursors, including those of ``execute()``, are ``TimedCursor``.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class PooledConnection:
+    """
+    A thin proxy around a pooled sqlite3 connection.
+
+    Everything is delegated to the underlying connection except ``close()``,
+    which hands the connection back to the pool instead of closing it, so
+    existing ``conn = get_db_connection() ... conn.close()`` code keeps working.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name in ('_pool', '_conn'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        """
+        Return the connection to the pool. Calling it more than once is a no-op.
+        """
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of pre-configured SQLite connections.
+
+    Connections are opened lazily, configured once with the PRAGMAs below and
+    then reused. When all ``max_size`` connections are checked out, callers
+    wait for one to be released, except for a thread that already holds a
+    connection: it gets a temporary overflow connection instead, so nested
+    checkouts can never deadlock.
+
+    A read-only pool opens its connections with ``mode=ro`` and
+    ``query_only``, so they can never take the write lock.
+    """
+
+    def __init__(self, path, max_size=8, timeout=20.0, cached_statements=128,
+                 cache_size=-2000, mmap_size=0, read_only=False):
+        """
+        Args:
+            path (str): The path to the database file.
+            max_size (int, optional): Maximum number of pooled connections. Defaults to 8.
+            timeout (float, optional): SQLite busy timeout and maximum wait for a free
+                                       connection, in seconds. Defaults to 20.0.
+            cached_statements (int, optional): Size of each connection's statement cache.
+            cache_size (int, optional): Value of ``PRAGMA cache_size`` (negative means KiB).
+            mmap_size (int, optional): Value of ``PRAGMA mmap_size`` in bytes.
+            read_only (bool, optional): Open read-only connections. Defaults to False.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.read_only = read_only
+
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+
+        self._checkouts = 0
+        self._waits = 0
+        self._opens = 0
+        self._overflows = 0
+        self._wait_time = 0.0
+
+    def _open(self):
+        """
+        Open and configure a new connection.
+
+        Returns:
+            sqlite3.Connection: The new connection.
+        """
+        # 使用超时参数，避免长时间等待锁
+        conn = sqlite3.connect(
+            f'{Path(self.path).absolute().as_uri()}?mode=ro' if self.read_only else self.path,
+            timeout=self.timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            uri=self.read_only,
+            factory=TimedConnection
+        )
+
+        if self.read_only:
+            # 只读连接，任何写入都会报错
+            conn.execute('PRAGMA query_only=ON')
+        else:
+            # 设置数据库为 WAL 模式，减少锁定问题
+            conn.execute('PRAGMA journal_mode=WAL')
+
+            # 设置同步模式为 NORMAL，提高性能
+            conn.execute('PRAGMA synchronous=NORMAL')
+
+        # 启用外键约束
+        conn.execute('PRAGMA foreign_keys=ON')
+
+        # 页缓存和内存映射大小
+        conn.execute(f'PRAGMA cache_size={int(self.cache_size)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+
+        # 临时表（如导入暂存表）保存在内存中
+        conn.execute('PRAGMA temp_store=MEMORY')
+
+        # 注册自定义 SQL 函数
+        register_functions(conn)
+
+        # 设置行工厂
+        conn.row_factory = sqlite3.Row
+
+        with self._cond:
+            self._opens += 1
+        return conn
+
+    def connect(self):
+        """
+        Check a connection out of the pool.
+
+        Returns:
+            PooledConnection: A proxy whose ``close()`` returns the connection to the pool.
+        """
+        held = getattr(self._local, 'held', 0)
+        deadline = None
+        wait_start = None
+
+        with self._cond:
+            self._checkouts += 1
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size or held:
+                    # 池未满，或当前线程已持有连接（嵌套借用），直接新建连接
+                    if self._size >= self.max_size:
+                        self._overflows += 1
+                    self._size += 1
+                    conn = None
+                    break
+
+                if deadline is None:
+                    self._waits += 1
+                    wait_start = time.monotonic()
+                    deadline = wait_start + self.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._wait_time += time.monotonic() - wait_start
+                    raise sqlite3.OperationalError('Timed out waiting for a pooled database connection')
+                self._cond.wait(remaining)
+
+            if wait_start is not None:
+                self._wait_time += time.monotonic() - wait_start
+
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        self._local.held = held + 1
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """
+        Return a connection to the pool, rolling back any open transaction.
+
+        Args:
+            conn (sqlite3.Connection): The connection to return.
+        """
+        self._local.held = max(getattr(self._local, 'held', 1) - 1, 0)
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logging.warning(f"Discarding broken pooled connection: {str(e)}")
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._size > self.max_size:
+                # 溢出连接用完即关闭
+                self._size -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def close_all(self):
+        """
+        Close all idle connections. Checked-out connections are closed when released.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self.max_size = 0
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """
+        Get pool usage counters.
+
+        Returns:
+            dict: Checkouts, waits and total wait time (seconds), opened connections,
+                  current pool occupancy and the share of connections in use.
+        """
+        with self._cond:
+            return {
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_seconds': self._wait_time,
+                'opens': self._opens,
+                'overflows': self._overflows,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+                'utilization': (self._size - len(self._idle)) / self.max_size if self.max_size else 0.0,
+                'read_only': self.read_only
+            }
@@ -1,13 +1,70 @@
+import json
 import sqlite3
-from db import get_db_connection
+import logging
+from db import execute_write, get_db_connection
+from db.integrity import create_integrity_tables
+from db.stats import create_stats_tables, refresh_deck_stats
+
+# 数据库结构版本，保存在 PRAGMA user_version 中。修改 create_schema 中的表、
+# 索引或迁移时必须加一，否则已是当前版本的数据库启动时不会执行新的修改
+SCHEMA_VERSION = 2
 
 def init_db():
     """
-    Initialize the database by creating the necessary tables.
+    Initialize the database: create or migrate the schema if it is older than
+    ``SCHEMA_VERSION``, then clean up work interrupted by the last shutdown.
+
+    A database already at the current version only costs a few small queries,
+    whatever its size.
     """
     conn = get_db_connection()
     c = conn.cursor()
 
+    c.execute('PRAGMA user_version')
+    version = c.fetchone()[0]
+    if version < SCHEMA_VERSION:
+        logging.info(f"Upgrading database schema from version {version} to {SCHEMA_VERSION}")
+        create_schema(c)
+        conn.commit()
+
+        # 将旧版按词单分表的数据迁移到共用表，全部完成后才记录版本，中断后下次启动继续迁移
+        migrate_legacy_decks(conn)
+        c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    # 服务重启时中断的导入任务标记为失败
+    c.execute('''
+        UPDATE import_jobs SET status = 'failed', result = ?
+        WHERE status IN ('queued', 'running')
+    ''', (json.dumps({'error': '导入任务因服务重启而中断'}, ensure_ascii=False),))
+
+    # 服务重启时中断的记忆保持率模拟任务标记为失败
+    c.execute('''
+        UPDATE retention_jobs SET status = 'failed', result = ?
+        WHERE status IN ('queued', 'running')
+    ''', (json.dumps({'error': '模拟任务因服务重启而中断'}, ensure_ascii=False),))
+
+    # 进程退出时未完成的完整性检查标记为中断
+    c.execute("UPDATE integrity_checks SET status = 'interrupted' WHERE status = 'running'")
+
+    # 为缺少统计数据的词单补建统计
+    c.execute('''
+        SELECT d.id FROM decks d
+        LEFT JOIN deck_stats s ON s.deck_id = d.id
+        WHERE s.deck_id IS NULL
+    ''')
+    for (deck_id,) in c.fetchall():
+        refresh_deck_stats(c, deck_id)
+
+    conn.commit()
+    conn.close()
+
+def create_schema(c):
+    """
+    Create every table and index that does not exist yet.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+    """
     # 词单表
     c.execute('''
         CREATE TABLE IF NOT EXISTS decks (
@@ -17,77 +74,341 @@ def init_db():
         )
     ''')
 
-    conn.commit()
-    conn.close()
+    # 词单统计表
+    create_stats_tables(c)
+
+    # 后台导入任务表，保存在数据库中以便任意工作进程查询进度
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT,                        -- queued, running, done, failed, cancelled
+            files TEXT,                         -- 文件名列表（JSON）
+            rows_parsed INTEGER DEFAULT 0,
+            rows_inserted INTEGER DEFAULT 0,
+            error_count INTEGER DEFAULT 0,
+            result TEXT,                        -- 导入结果（JSON）
+            cancel_requested INTEGER DEFAULT 0,
+            created_at INTEGER,
+            updated_at INTEGER
+        )
+    ''')
+
+    # 记忆保持率模拟任务表，完成的任务保存每个词单、模拟设置和 FSRS 参数下的最新结果
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS retention_jobs (
+            id TEXT PRIMARY KEY,
+            deck_id INTEGER,
+            status TEXT,                        -- queued, running, done, failed, cancelled
+            learners INTEGER,
+            days INTEGER,
+            new_per_day INTEGER,
+            parameters TEXT,                    -- 模拟使用的 FSRS 参数（JSON）
+            retentions_done INTEGER DEFAULT 0,
+            retentions_total INTEGER,
+            result TEXT,                        -- 模拟结果（JSON）
+            cancel_requested INTEGER DEFAULT 0,
+            created_at INTEGER,
+            updated_at INTEGER
+        )
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_retention_jobs_deck
+        ON retention_jobs (deck_id, learners, days, new_per_day)
+    ''')
+
+    # 完整性检查记录表
+    create_integrity_tables(c)
 
-def create_deck_tables(deck_id):
+    # 复习日志表，只追加不修改，与 FSRS 记录的更新在同一事务中写入
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS review_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            deck_id INTEGER,
+            record_id INTEGER,
+            rating INTEGER,
+            reviewed_at INTEGER,                -- 复习时间（毫秒时间戳）
+            elapsed_days REAL,                  -- 距上次复习的天数，首次复习为 0
+            state_before INTEGER,
+            difficulty_before REAL,
+            stability_before REAL,
+            reps_before INTEGER,
+            lapses_before INTEGER,
+            state_after INTEGER,
+            difficulty_after REAL,
+            stability_after REAL,
+            scheduled_days INTEGER
+        )
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_review_log_card
+        ON review_log (deck_id, record_id, reviewed_at)
+    ''')
+
+    # FSRS 参数表，deck_id 为空表示全局参数，每个范围最多一组处于启用状态
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS fsrs_parameters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            deck_id INTEGER,
+            w TEXT,                             -- 权重（JSON）
+            request_retention REAL,
+            maximum_interval INTEGER,
+            active INTEGER DEFAULT 0,
+            loss REAL,                          -- 拟合后的对数损失
+            review_count INTEGER,               -- 拟合使用的复习记录数
+            created_at INTEGER
+        )
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_fsrs_parameters_active
+        ON fsrs_parameters (deck_id) WHERE active = 1
+    ''')
+
+    # 所有词单共用的单词表和FSRS记录表
+    create_card_tables(c)
+
+def create_card_tables(c):
     """
-    Create tables specific to a deck.
+    Create the word and FSRS record tables shared by all decks.
+
+    Rows are keyed by ``deck_id`` so every deck-scoped query uses the same
+    parameterized statement text, whatever the deck.
 
     Args:
-        deck_id (int): The ID of the deck.
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS words (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            deck_id INTEGER NOT NULL,
+            japanese TEXT,
+            kana TEXT,
+            chinese TEXT,
+            is_kana BOOLEAN,
+            FOREIGN KEY (deck_id) REFERENCES decks (id)
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS srs_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            deck_id INTEGER NOT NULL,
+            word_id INTEGER,
+            question TEXT,
+            state INTEGER,              -- 状态: 0=新卡片, 1=学习中, 2=复习中, 3=重新学习中
+            difficulty REAL,            -- 难度: 1-5
+            stability REAL,             -- 稳定性
+            retrievability REAL,        -- 可提取性
+            reps INTEGER,               -- 复习次数
+            lapses INTEGER,             -- 遗忘次数
+            scheduled_days INTEGER,     -- 计划天数
+            next_review INTEGER,        -- 下次复习时间（毫秒时间戳）
+            last_review INTEGER,        -- 上次复习时间（毫秒时间戳）
+            FOREIGN KEY (deck_id) REFERENCES decks (id),
+            FOREIGN KEY (word_id) REFERENCES words (id)
+        )
+    ''')
+
+    create_card_indexes(c)
+
+def create_card_indexes(c):
+    """
+    Create the secondary indexes of the word and FSRS record tables.
+
+    Words are unique by ``(deck_id, japanese, kana, chinese)`` and FSRS records
+    by ``(word_id, question)``, which lets imports rely on ``INSERT OR IGNORE``.
+    The due queue is read by ``(deck_id, next_review)`` and by
+    ``(deck_id, state, next_review)``.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+    """
+    c.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_words_word
+        ON words (deck_id, japanese, kana, chinese)
+    ''')
+    c.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_srs_records_card
+        ON srs_records (word_id, question)
+    ''')
+    create_due_indexes(c)
+
+def create_due_indexes(c):
+    """
+    Create the indexes the due queue is read by.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+    """
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_srs_records_next_review
+        ON srs_records (deck_id, next_review)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_srs_records_state
+        ON srs_records (deck_id, state, next_review)
+    ''')
+
+def drop_due_indexes(c):
+    """
+    Drop the indexes created by ``create_due_indexes``.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+    """
+    c.execute('DROP INDEX IF EXISTS idx_srs_records_next_review')
+    c.execute('DROP INDEX IF EXISTS idx_srs_records_state')
+
+def get_legacy_decks(c):
+    """
+    Get the decks whose cards are still in per-deck tables.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+
+    Returns:
+        list: The IDs of the decks to migrate.
+    """
+    c.execute('''
+        SELECT d.id FROM decks d
+        JOIN sqlite_master m ON m.type = 'table' AND m.name = 'srs_records_' || d.id
+        JOIN sqlite_master mw ON mw.type = 'table' AND mw.name = 'words_' || d.id
+        ORDER BY d.id
+    ''')
+    return [row[0] for row in c.fetchall()]
+
+def migrate_legacy_decks(conn=None):
     """
-    import time
-    import logging
-    import sqlite3
+    Move every deck still stored in ``words_{id}`` / ``srs_records_{id}`` tables
+    into the shared ``words`` and ``srs_records`` tables.
 
-    max_retries = 5
-    retry_delay = 0.1  # 初始延迟时间（秒）
+    Each deck is migrated in its own transaction, so the database stays usable
+    in between and an interrupted migration resumes with the remaining decks.
 
-    for attempt in range(max_retries):
-        conn = None
-        try:
-            conn = get_db_connection()
+    Args:
+        conn (sqlite3.Connection, optional): The connection to migrate with, outside
+                                             of a transaction. Defaults to the database writer.
+
+    Returns:
+        int: The number of migrated decks.
+    """
+    if conn is None:
+        deck_ids = execute_write(get_legacy_decks)
+    else:
+        deck_ids = get_legacy_decks(conn.cursor())
+
+    for deck_id in deck_ids:
+        logging.info(f"Migrating deck {deck_id} to the shared word and FSRS record tables")
+        if conn is None:
+            execute_write(migrate_legacy_deck, deck_id)
+        else:
             c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE')
+            try:
+                migrate_legacy_deck(c, deck_id)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    if deck_ids:
+        logging.info(f"Migrated {len(deck_ids)} decks to the shared word and FSRS record tables")
+    return len(deck_ids)
+
+def migrate_legacy_deck(c, deck_id):
+    """
+    Copy the words and FSRS records of one deck from its own tables into the
+    shared tables, then drop its tables.
+
+    Row IDs are shifted past the IDs already in use, keeping their order, and
+    the review log is updated to the new record IDs. Decks created before the
+    unique constraints existed are deduplicated first.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with, inside a transaction.
+        deck_id (int): The ID of the deck.
+    """
+    deck_id = int(deck_id)
+    word_offset = _next_id_offset(c, 'words')
+    record_offset = _next_id_offset(c, 'srs_records')
+
+    c.execute('SAVEPOINT migrate_deck')
+    try:
+        _copy_legacy_deck(c, deck_id, word_offset, record_offset)
+        c.execute('RELEASE migrate_deck')
+    except sqlite3.IntegrityError:
+        c.execute('ROLLBACK TO migrate_deck')
+        c.execute('RELEASE migrate_deck')
+        logging.warning(f"Removing duplicate words and FSRS records from deck {deck_id}")
+        _deduplicate_legacy_deck(c, deck_id)
+        _copy_legacy_deck(c, deck_id, word_offset, record_offset)
+
+    # 复习日志中的记录 ID 改为共用表中的 ID
+    c.execute('''
+        UPDATE review_log SET record_id = record_id + ?
+        WHERE deck_id = ?
+    ''', (record_offset, deck_id))
+
+    c.execute(f'DROP TABLE srs_records_{deck_id}')
+    c.execute(f'DROP TABLE words_{deck_id}')
+
+    refresh_deck_stats(c, deck_id)
 
-            # 为特定词单创建单词表
-            c.execute(f'''
-                CREATE TABLE IF NOT EXISTS words_{deck_id} (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    japanese TEXT,
-                    kana TEXT,
-                    chinese TEXT,
-                    is_kana BOOLEAN
-                )
-            ''')
-
-            # 为特定词单创建FSRS记录表
-            c.execute(f'''
-                CREATE TABLE IF NOT EXISTS srs_records_{deck_id} (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    word_id INTEGER,
-                    question TEXT,
-                    state INTEGER,              -- 状态: 0=新卡片, 1=学习中, 2=复习中, 3=重新学习中
-                    difficulty REAL,            -- 难度: 1-5
-                    stability REAL,             -- 稳定性
-                    retrievability REAL,        -- 可提取性
-                    reps INTEGER,               -- 复习次数
-                    lapses INTEGER,             -- 遗忘次数
-                    scheduled_days INTEGER,     -- 计划天数
-                    next_review INTEGER,        -- 下次复习时间（毫秒时间戳）
-                    last_review INTEGER,        -- 上次复习时间（毫秒时间戳）
-                    FOREIGN KEY (word_id) REFERENCES words_{deck_id} (id)
-                )
-            ''')
-
-            conn.commit()
-            logging.info(f"Successfully created tables for deck {deck_id}")
-            return True
-
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                # 数据库锁定，等待一段时间后重试
-                wait_time = retry_delay * (2 ** attempt)  # 指数退避策略
-                logging.warning(f"Database is locked, retrying in {wait_time:.2f} seconds (attempt {attempt+1}/{max_retries})")
-                time.sleep(wait_time)
-            else:
-                logging.error(f"Error creating tables after {attempt+1} attempts: {str(e)}")
-                return False
-
-        except Exception as e:
-            logging.error(f"Error creating tables: {str(e)}")
-            return False
-
-        finally:
-            if conn:
-                conn.close()
+def _next_id_offset(c, table):
+    # 自增序列可能大于现有最大 ID（已删除的行），两者取大，保证 ID 不被重用
+    c.execute(f'''
+        SELECT MAX(
+            COALESCE((SELECT MAX(id) FROM {table}), 0),
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0)
+        )
+    ''', (table,))
+    return c.fetchone()[0]
+
+def _copy_legacy_deck(c, deck_id, word_offset, record_offset):
+    c.execute(f'''
+        INSERT INTO words (id, deck_id, japanese, kana, chinese, is_kana)
+        SELECT id + ?, ?, japanese, kana, chinese, is_kana
+        FROM words_{deck_id}
+        ORDER BY id
+    ''', (word_offset, deck_id))
+
+    c.execute(f'''
+        INSERT INTO srs_records (
+            id, deck_id, word_id, question, state, difficulty, stability,
+            retrievability, reps, lapses, scheduled_days, next_review, last_review
+        )
+        SELECT id + ?, ?, word_id + ?, question, state, difficulty, stability,
+               retrievability, reps, lapses, scheduled_days, next_review, last_review
+        FROM srs_records_{deck_id}
+        ORDER BY id
+    ''', (record_offset, deck_id, word_offset))
+
+def _deduplicate_legacy_deck(c, deck_id):
+    """
+    Merge duplicate words and FSRS records in the per-deck tables of a deck,
+    keeping the oldest row.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+        deck_id (int): The ID of the deck.
+    """
+    # 将重复单词的记录指向保留的单词
+    c.execute(f'''
+        UPDATE srs_records_{deck_id} SET word_id = (
+            SELECT MIN(w2.id)
+            FROM words_{deck_id} w1
+            JOIN words_{deck_id} w2
+              ON w2.japanese = w1.japanese AND w2.kana = w1.kana AND w2.chinese = w1.chinese
+            WHERE w1.id = srs_records_{deck_id}.word_id
+        )
+        WHERE word_id NOT IN (
+            SELECT MIN(id) FROM words_{deck_id} GROUP BY japanese, kana, chinese
+        )
+    ''')
+    c.execute(f'''
+        DELETE FROM words_{deck_id}
+        WHERE id NOT IN (SELECT MIN(id) FROM words_{deck_id} GROUP BY japanese, kana, chinese)
+    ''')
+    c.execute(f'''
+        DELETE FROM srs_records_{deck_id}
+        WHERE id NOT IN (SELECT MIN(id) FROM srs_records_{deck_id} GROUP BY word_id, question)
+    ''')
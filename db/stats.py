@@ -0,0 +1,166 @@
+import json
+from collections import Counter
+
+# 一天的毫秒数，复习时间以毫秒时间戳存储
+DAY_MS = 24 * 60 * 60 * 1000
+
+# FSRS 状态对应的统计列
+STATE_COLUMNS = {
+    0: 'new_count',
+    1: 'learning_count',
+    2: 'review_count',
+    3: 'relearning_count'
+}
+
+def create_stats_tables(c):
+    """
+    Create the deck statistics tables.
+
+    ``deck_stats`` holds one row of totals per deck. ``deck_due_histogram``
+    counts the words of a deck by the (UTC) day on which their earliest
+    question becomes due.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS deck_stats (
+            deck_id INTEGER PRIMARY KEY,
+            total_words INTEGER NOT NULL DEFAULT 0,
+            total_cards INTEGER NOT NULL DEFAULT 0,
+            new_count INTEGER NOT NULL DEFAULT 0,
+            learning_count INTEGER NOT NULL DEFAULT 0,
+            review_count INTEGER NOT NULL DEFAULT 0,
+            relearning_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS deck_due_histogram (
+            deck_id INTEGER,
+            due_day INTEGER,            -- 最早到期的问题所在的日期（UTC 天数）
+            word_count INTEGER NOT NULL,
+            PRIMARY KEY (deck_id, due_day)
+        ) WITHOUT ROWID
+    ''')
+
+def refresh_deck_stats(c, deck_id):
+    """
+    Recompute the statistics of a deck from its tables.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+        deck_id (int): The ID of the deck.
+    """
+    delete_deck_stats(c, deck_id)
+
+    c.execute('SELECT COUNT(*) FROM words WHERE deck_id = ?', (deck_id,))
+    total_words = c.fetchone()[0]
+
+    c.execute('SELECT state, COUNT(*) FROM srs_records WHERE deck_id = ? GROUP BY state', (deck_id,))
+    state_counts = {state: count for state, count in c.fetchall()}
+
+    c.execute('''
+        INSERT INTO deck_stats (
+            deck_id, total_words, total_cards,
+            new_count, learning_count, review_count, relearning_count
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        deck_id,
+        total_words,
+        sum(state_counts.values()),
+        *(state_counts.get(state, 0) for state in STATE_COLUMNS)
+    ))
+
+    c.execute('''
+        INSERT INTO deck_due_histogram (deck_id, due_day, word_count)
+        SELECT ?, due / ?, COUNT(*)
+        FROM (
+            SELECT MIN(next_review) AS due
+            FROM srs_records
+            WHERE deck_id = ?
+            GROUP BY word_id
+        )
+        GROUP BY due / ?
+    ''', (deck_id, DAY_MS, deck_id, DAY_MS))
+
+def delete_deck_stats(c, deck_id):
+    """
+    Delete the statistics of a deck.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+        deck_id (int): The ID of the deck.
+    """
+    c.execute('DELETE FROM deck_stats WHERE deck_id = ?', (deck_id,))
+    c.execute('DELETE FROM deck_due_histogram WHERE deck_id = ?', (deck_id,))
+
+def get_word_due_times(c, deck_id, word_ids):
+    """
+    Get the earliest due time of each of the given words.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+        deck_id (int): The ID of the deck.
+        word_ids (iterable): The IDs of the words.
+
+    Returns:
+        dict: A mapping of word ID to its earliest ``next_review``. Words without
+              FSRS records are left out.
+    """
+    # 单词 ID 以 JSON 数组传入，语句文本固定，可以复用缓存的预编译语句
+    c.execute('''
+        SELECT word_id, MIN(next_review)
+        FROM srs_records
+        WHERE deck_id = ? AND word_id IN (SELECT value FROM json_each(?))
+        GROUP BY word_id
+    ''', (deck_id, json.dumps([int(word_id) for word_id in word_ids])))
+
+    return dict(c.fetchall())
+
+def update_deck_stats(c, deck_id, words=0, states=None, due_before=None, due_after=None):
+    """
+    Apply an incremental change to the statistics of a deck.
+
+    Must be called with the same cursor, inside the same transaction, as the
+    change it describes.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+        deck_id (int): The ID of the deck.
+        words (int, optional): Change in the number of words.
+        states (dict, optional): Change in the number of cards per FSRS state.
+        due_before (dict, optional): Earliest due time of each affected word before the change,
+                                     as returned by ``get_word_due_times``.
+        due_after (dict, optional): Earliest due time of the same words after the change.
+    """
+    states = {state: delta for state, delta in (states or {}).items() if delta}
+    cards = sum(states.values())
+
+    if words or states:
+        assignments = ['total_words = total_words + ?', 'total_cards = total_cards + ?']
+        params = [words, cards]
+        for state, delta in states.items():
+            column = STATE_COLUMNS[state]
+            assignments.append(f'{column} = {column} + ?')
+            params.append(delta)
+
+        c.execute('INSERT OR IGNORE INTO deck_stats (deck_id) VALUES (?)', (deck_id,))
+        c.execute(f'''
+            UPDATE deck_stats SET {', '.join(assignments)}
+            WHERE deck_id = ?
+        ''', (*params, deck_id))
+
+    # 计算直方图中每一天的变化量
+    histogram = Counter(due // DAY_MS for due in (due_after or {}).values())
+    histogram.subtract(due // DAY_MS for due in (due_before or {}).values())
+    changes = [(deck_id, day, delta) for day, delta in histogram.items() if delta]
+
+    if changes:
+        c.executemany('''
+            INSERT INTO deck_due_histogram (deck_id, due_day, word_count)
+            VALUES (?, ?, ?)
+            ON CONFLICT (deck_id, due_day) DO UPDATE
+            SET word_count = word_count + excluded.word_count
+        ''', changes)
+        c.execute('DELETE FROM deck_due_histogram WHERE deck_id = ? AND word_count <= 0', (deck_id,))
@@ -0,0 +1,264 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from utils import metrics
+
+# 一个事务中最多合并的写入任务数
+MAX_GROUP_SIZE = 64
+
+QUEUE_SECONDS = metrics.histogram(
+    'nekowords_db_write_queue_seconds', 'Time write tasks waited in the writer queue before their transaction began.'
+)
+TRANSACTION_SECONDS = metrics.histogram(
+    'nekowords_db_write_transaction_seconds', 'Duration of writer transactions, from BEGIN IMMEDIATE to commit.'
+)
+GROUP_SIZE = metrics.histogram(
+    'nekowords_db_write_group_size', 'Number of write tasks committed per transaction.',
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+
+class _WriteTask:
+    __slots__ = ('fn', 'args', 'kwargs', 'future', 'queued_at')
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.queued_at = time.perf_counter()
+
+
+class DatabaseWriter:
+    """
+    A dedicated thread that performs every database write of the process.
+
+    Write tasks are functions taking a cursor as their first argument. They are
+    queued and run in order on the writer's own connection. All tasks waiting
+    in the queue when the writer picks up work are run in one ``BEGIN
+    IMMEDIATE`` transaction, each in its own savepoint, and committed together
+    (group commit): a failing task is rolled back alone and its exception is
+    set on its future, the others are committed. Since only this thread writes,
+    request threads never contend for the write lock or sleep and retry on
+    "database is locked".
+
+    Futures are resolved only after the commit, so callers may update caches
+    once the result is available. If the writer thread dies (for example on
+    ``KeyboardInterrupt`` or ``SystemExit`` raised by a task), the pending
+    futures fail and later submissions raise ``RuntimeError`` instead of
+    waiting forever.
+    """
+
+    def __init__(self, connect, max_group_size=MAX_GROUP_SIZE):
+        """
+        Args:
+            connect (callable): Returns the connection the writer uses.
+            max_group_size (int, optional): Maximum number of tasks per transaction.
+        """
+        self._connect = connect
+        self.max_group_size = max_group_size
+
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._crash = None
+
+        self._tasks = 0
+        self._failed = 0
+        self._transactions = 0
+        self._largest_group = 0
+
+    def _start(self):
+        # 调用方需持有 self._lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue a write task.
+
+        A task submitted from inside another task runs immediately, as part of
+        the current transaction.
+
+        Args:
+            fn (callable): The task, called as ``fn(cursor, *args, **kwargs)``.
+            *args: Positional arguments for the task.
+            **kwargs: Keyword arguments for the task.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the task's return value once committed.
+
+        Raises:
+            RuntimeError: If the writer thread has died.
+        """
+        task = _WriteTask(fn, args, kwargs)
+
+        if threading.current_thread() is self._thread:
+            # 写线程中的嵌套写入直接在当前事务中执行，避免死锁
+            try:
+                task.future.set_result(fn(self._conn.cursor(), *args, **kwargs))
+            except BaseException as e:
+                task.future.set_exception(e)
+            return task.future
+
+        # 加锁后入队，写线程退出时清理队列，不会遗漏任务
+        with self._lock:
+            if self._crash is not None:
+                raise RuntimeError(f'Database writer stopped: {self._crash!r}')
+            self._start()
+            self._queue.put(task)
+        return task.future
+
+    def execute(self, fn, *args, **kwargs):
+        """
+        Run a write task and wait for it to be committed.
+
+        Args:
+            fn (callable): The task, called as ``fn(cursor, *args, **kwargs)``.
+            *args: Positional arguments for the task.
+            **kwargs: Keyword arguments for the task.
+
+        Returns:
+            The task's return value. Exceptions raised by the task are re-raised.
+        """
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _run(self):
+        try:
+            self._conn = self._connect()
+            while True:
+                task = self._queue.get()
+                if task is None:
+                    break
+
+                # 合并队列中已有的写入任务
+                group = [task]
+                stopping = False
+                while len(group) < self.max_group_size:
+                    try:
+                        task = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if task is None:
+                        stopping = True
+                        break
+                    group.append(task)
+
+                self._commit_group(group)
+                if stopping:
+                    break
+        except BaseException as e:
+            logging.critical(f"Database writer thread stopped: {e!r}")
+            with self._lock:
+                self._crash = e
+            raise
+        finally:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._fail_queued()
+
+    def _fail_queued(self):
+        # 写线程已退出，队列中剩余的任务不会再执行
+        while True:
+            try:
+                task = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if task is not None and task.future.set_running_or_notify_cancel():
+                task.future.set_exception(RuntimeError('Database writer stopped'))
+
+    def _commit_group(self, group):
+        """
+        Run a group of tasks in one transaction and resolve their futures.
+
+        Args:
+            group (list): The tasks to run.
+        """
+        group = [task for task in group if task.future.set_running_or_notify_cancel()]
+        if not group:
+            return
+
+        conn = self._conn
+        c = conn.cursor()
+        outcomes = []
+        start = time.perf_counter()
+        for task in group:
+            QUEUE_SECONDS.observe(start - task.queued_at)
+        GROUP_SIZE.observe(len(group))
+        try:
+            try:
+                c.execute('BEGIN IMMEDIATE')
+                for task in group:
+                    c.execute('SAVEPOINT write_task')
+                    try:
+                        outcomes.append((task.fn(conn.cursor(), *task.args, **task.kwargs), None))
+                        c.execute('RELEASE write_task')
+                    except Exception as e:
+                        c.execute('ROLLBACK TO write_task')
+                        c.execute('RELEASE write_task')
+                        outcomes.append((None, e))
+                conn.commit()
+            except BaseException as e:
+                # 事务本身失败时整组任务都失败
+                logging.error(f"Database write transaction of {len(group)} tasks failed: {e!r}")
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+                if not isinstance(e, Exception):
+                    # KeyboardInterrupt、SystemExit 等继续抛出，结束写线程
+                    raise
+                outcomes = [(None, e)] * len(group)
+
+            TRANSACTION_SECONDS.observe(time.perf_counter() - start)
+            with self._lock:
+                self._tasks += len(group)
+                self._failed += sum(1 for _, error in outcomes if error is not None)
+                self._transactions += 1
+                self._largest_group = max(self._largest_group, len(group))
+
+            for task, (result, error) in zip(group, outcomes):
+                if error is None:
+                    task.future.set_result(result)
+                else:
+                    task.future.set_exception(error)
+        finally:
+            # 写线程异常退出时也要完成本组的 future，否则调用方会一直等待
+            for task in group:
+                if not task.future.done():
+                    task.future.set_exception(RuntimeError('Database writer stopped'))
+
+    def stop(self, timeout=None):
+        """
+        Finish the queued tasks and stop the writer thread.
+
+        Args:
+            timeout (float, optional): Maximum time to wait, in seconds.
+        """
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def stats(self):
+        """
+        Get writer counters.
+
+        Returns:
+            dict: Tasks run and failed, transactions, the largest group and the queue depth.
+        """
+        with self._lock:
+            return {
+                'tasks': self._tasks,
+                'failed': self._failed,
+                'transactions': self._transactions,
+                'largest_group': self._largest_group,
+                'queued': self._queue.qsize()
+            }
@@ -1,43 +1,55 @@
 from datetime import datetime
+import logging
 import sqlite3
-from db import get_db_connection
-from db.schema import create_deck_tables
+from db import execute_write, get_read_connection
+from db.stats import DAY_MS, delete_deck_stats
+from models.due_cache import due_cache
+from models.forecast import forecast_cache
 
 def get_decks():
     """
     Get all decks with statistics.
 
+    The statistics are read from the incrementally maintained ``deck_stats``
+    and ``deck_due_histogram`` tables. A word counts as to be reviewed when
+    its earliest question is due now or earlier: the histogram gives the words
+    due before today, and today's words are counted exactly from the due
+    index, so the cost depends on the number of cards due today rather than
+    on deck size.
+
     Returns:
         list: A list of dictionaries containing deck information.
     """
-    conn = get_db_connection()
+    conn = get_read_connection()
     c = conn.cursor()
 
-    # 获取词单基本信息，按照创建时间升序排序（ASC）
-    c.execute('SELECT id, name, created_at FROM decks ORDER BY created_at ASC')
-    decks = c.fetchall()
+    # 当前时间和今天开始的时间（直方图按 UTC 天分组）
+    now = int(datetime.now().timestamp() * 1000)
+    today_start = now // DAY_MS * DAY_MS
+
+    # 获取词单基本信息和统计数据，按照创建时间升序排序（ASC）。
+    # 今天之前到期的单词来自直方图；今天到期的单词只统计已经到期的，
+    # 并排除有其他问题在今天之前到期、已计入直方图的单词
+    c.execute('''
+        SELECT d.id, d.name, COALESCE(s.total_words, 0),
+               COALESCE((
+                   SELECT SUM(h.word_count) FROM deck_due_histogram h
+                   WHERE h.deck_id = d.id AND h.due_day < ?
+               ), 0) + (
+                   SELECT COUNT(DISTINCT sr.word_id) FROM srs_records sr
+                   WHERE sr.deck_id = d.id AND sr.next_review >= ? AND sr.next_review <= ?
+                     AND NOT EXISTS (
+                         SELECT 1 FROM srs_records e
+                         WHERE e.word_id = sr.word_id AND e.next_review < ?
+                     )
+               )
+        FROM decks d
+        LEFT JOIN deck_stats s ON s.deck_id = d.id
+        ORDER BY d.created_at ASC
+    ''', (today_start // DAY_MS, today_start, now, today_start))
 
-    # 计算每个词单的单词总数和已记忆好的单词数
     deck_stats = []
-    for deck in decks:
-        deck_id, name, _ = deck
-
-        # 获取词单中的单词总数
-        c.execute(f'SELECT COUNT(*) FROM words_{deck_id}')
-        total = c.fetchone()[0]
-
-        # 获取当前时间
-        current_time = int(datetime.now().timestamp() * 1000)  # 转换为毫秒
-
-        # 获取需要复习的单词数（一个单词的任何一个问题需要复习，该单词就需要复习）
-        c.execute(f'''
-            SELECT COUNT(DISTINCT w.id)
-            FROM words_{deck_id} w
-            JOIN srs_records_{deck_id} sr ON w.id = sr.word_id
-            WHERE sr.next_review <= ?
-        ''', (current_time,))
-        words_to_review = c.fetchone()[0]
-
+    for deck_id, name, total, words_to_review in c.fetchall():
         # 计算已记忆好的单词数（所有问题都不需要复习的单词）
         memory_cnt = total - words_to_review
 
@@ -61,61 +73,35 @@ def add_deck(name):
     Returns:
         int or None: The ID of the new deck, or None if the deck already exists.
     """
-    import time
-    import logging
-
-    max_retries = 5
-    retry_delay = 0.1  # 初始延迟时间（秒）
-
-    for attempt in range(max_retries):
-        conn = None
-        try:
-            conn = get_db_connection()
-            c = conn.cursor()
-
-            # 检查词单是否已存在
-            c.execute('SELECT id FROM decks WHERE name = ?', (name,))
-            existing_deck = c.fetchone()
-            if existing_deck:
-                logging.info(f"Deck with name '{name}' already exists")
-                return existing_deck[0]
-
-            c.execute('INSERT INTO decks (name, created_at) VALUES (?, ?)',
-                     (name, int(datetime.now().timestamp())))
-            deck_id = c.lastrowid
-            conn.commit()
-
-            # 为新词单创建独立的表
-            create_deck_tables(deck_id)
-
-            logging.info(f"Successfully created deck: id={deck_id}, name={name}")
-            return deck_id
-
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                # 数据库锁定，等待一段时间后重试
-                wait_time = retry_delay * (2 ** attempt)  # 指数退避策略
-                logging.warning(f"Database is locked, retrying in {wait_time:.2f} seconds (attempt {attempt+1}/{max_retries})")
-                time.sleep(wait_time)
-            else:
-                logging.error(f"Error creating deck after {attempt+1} attempts: {str(e)}")
-                return None
-
-        except sqlite3.IntegrityError:
-            logging.warning(f"Deck with name '{name}' already exists (integrity error)")
-            return None
-
-        except Exception as e:
-            logging.error(f"Error creating deck: {str(e)}")
-            return None
-
-        finally:
-            if conn:
-                conn.close()
+    def insert(c):
+        # 检查词单是否已存在
+        c.execute('SELECT id FROM decks WHERE name = ?', (name,))
+        existing_deck = c.fetchone()
+        if existing_deck:
+            logging.info(f"Deck with name '{name}' already exists")
+            return existing_deck[0]
+
+        c.execute('INSERT INTO decks (name, created_at) VALUES (?, ?)',
+                 (name, int(datetime.now().timestamp())))
+        deck_id = c.lastrowid
+
+        logging.info(f"Successfully created deck: id={deck_id}, name={name}")
+        return deck_id
+
+    try:
+        return execute_write(insert)
+
+    except sqlite3.IntegrityError:
+        logging.warning(f"Deck with name '{name}' already exists (integrity error)")
+        return None
+
+    except Exception as e:
+        logging.error(f"Error creating deck: {str(e)}")
+        return None
 
 def delete_deck(deck_id):
     """
-    Delete a deck and its associated tables.
+    Delete a deck with its words and FSRS records.
 
     Args:
         deck_id (int): The ID of the deck to delete.
@@ -123,18 +109,21 @@ def delete_deck(deck_id):
     Returns:
         bool: True if the deck was deleted successfully, False otherwise.
     """
-    conn = get_db_connection()
-    c = conn.cursor()
-    try:
-        # 删除词单特定的表
-        c.execute(f'DROP TABLE IF EXISTS srs_records_{deck_id}')
-        c.execute(f'DROP TABLE IF EXISTS words_{deck_id}')
+    def delete(c):
+        # 删除词单的FSRS记录和单词
+        c.execute('DELETE FROM srs_records WHERE deck_id = ?', (deck_id,))
+        c.execute('DELETE FROM words WHERE deck_id = ?', (deck_id,))
+        # 删除词单统计数据
+        delete_deck_stats(c, deck_id)
         # 删除词单记录
         c.execute('DELETE FROM decks WHERE id = ?', (deck_id,))
-        conn.commit()
+
+    try:
+        execute_write(delete)
+        # 从复习队列缓存和复习量预测中移除
+        due_cache.invalidate(deck_id)
+        forecast_cache.invalidate(deck_id)
         return True
     except Exception as e:
         print(f"Error deleting deck: {str(e)}")
         return False
-    finally:
-        conn.close()
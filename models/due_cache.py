@@ -0,0 +1,470 @@
+import heapq
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from db import get_read_connection
+
+# 所有词单缓存的 FSRS 记录总数上限，超出时淘汰最久未使用的词单
+MAX_CACHED_RECORDS = 200000
+
+# 堆中失效条目超过有效条目的倍数时重建堆
+HEAP_REBUILD_RATIO = 2
+
+# 新卡片状态，与 models.fsrs.STATES['NEW'] 相同
+STATE_NEW = 0
+
+# 复习记录的字段，与 get_fsrs_records_for_review 返回的字典相同
+RECORD_COLUMNS = (
+    'id', 'word_id', 'question', 'state', 'difficulty', 'stability',
+    'retrievability', 'reps', 'lapses', 'scheduled_days', 'next_review',
+    'last_review', 'japanese', 'kana', 'chinese', 'is_kana'
+)
+
+# 复习后会变化的字段
+FSRS_FIELDS = (
+    'state', 'difficulty', 'stability', 'retrievability', 'reps',
+    'lapses', 'scheduled_days', 'next_review', 'last_review'
+)
+
+class DeckDueQueue:
+    """
+    The FSRS records of one deck, ordered by due time.
+
+    Records are kept in a dict by ID and a min-heap of ``(next_review, id)``.
+    Updated records are pushed again rather than moved; heap entries whose due
+    time no longer matches the record are skipped and dropped lazily.
+    """
+
+    def __init__(self, records):
+        self.records = {record['id']: record for record in records}
+        self.heap = [(record['next_review'], record['id']) for record in self.records.values()]
+        heapq.heapify(self.heap)
+        self.max_id = max(self.records, default=0)
+
+        # 设置了复习时间的新卡片，可能在到期前就需要复习（通常为空）
+        self.scheduled_new = {
+            record['id'] for record in self.records.values()
+            if record['state'] == STATE_NEW and record['next_review'] > 0
+        }
+
+    def __len__(self):
+        return len(self.records)
+
+    def _valid(self, entry):
+        record = self.records.get(entry[1])
+        return record is not None and record['next_review'] == entry[0]
+
+    def _track_new(self, record):
+        if record['state'] == STATE_NEW and record['next_review'] > 0:
+            self.scheduled_new.add(record['id'])
+        else:
+            self.scheduled_new.discard(record['id'])
+
+    def _compact(self):
+        if len(self.heap) > (HEAP_REBUILD_RATIO + 1) * max(len(self.records), 1):
+            self.heap = [(record['next_review'], record['id']) for record in self.records.values()]
+            heapq.heapify(self.heap)
+
+    def add(self, record):
+        """
+        Add or replace a record.
+
+        Args:
+            record (dict): The record, with all ``RECORD_COLUMNS``.
+        """
+        self.records[record['id']] = record
+        heapq.heappush(self.heap, (record['next_review'], record['id']))
+        self.max_id = max(self.max_id, record['id'])
+        self._track_new(record)
+
+    def update(self, record_id, fields):
+        """
+        Apply a review to a cached record.
+
+        Args:
+            record_id (int): The ID of the record.
+            fields (dict): The new values of ``FSRS_FIELDS``.
+
+        Returns:
+            bool: False if the record is not cached.
+        """
+        record = self.records.get(record_id)
+        if record is None:
+            return False
+
+        due_changed = fields['next_review'] != record['next_review']
+        record.update((name, fields[name]) for name in FSRS_FIELDS)
+        self._track_new(record)
+        if due_changed:
+            heapq.heappush(self.heap, (record['next_review'], record_id))
+            self._compact()
+        return True
+
+    def due(self, now, limit):
+        """
+        Get the records due for review, as ``get_fsrs_records_for_review`` would.
+
+        A record is due if ``next_review <= now`` or it is new; the result is
+        ordered by ``next_review``.
+
+        Args:
+            now (int): The current time as a millisecond timestamp.
+            limit (int): Maximum number of records to return.
+
+        Returns:
+            list: Copies of the due records.
+        """
+        found = []
+        popped = []
+        heap = self.heap
+
+        while heap and len(found) < limit and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            if self._valid(entry):
+                popped.append(entry)
+                found.append(self.records[entry[1]])
+
+        # 放回仍然有效的条目，失效的条目就此丢弃
+        for entry in popped:
+            heapq.heappush(heap, entry)
+
+        if len(found) < limit and self.scheduled_new:
+            # 新卡片即使尚未到期也需要复习
+            future_new = [
+                self.records[record_id] for record_id in self.scheduled_new
+                if self.records[record_id]['next_review'] > now
+            ]
+            if future_new:
+                found.extend(future_new)
+                found.sort(key=lambda record: record['next_review'])
+                del found[limit:]
+
+        return [dict(record) for record in found]
+
+class DueCache:
+    """
+    A process-local LRU cache of per-deck due queues.
+
+    Decks are loaded lazily on their first review fetch. Writers notify the
+    cache after they commit; a version counter per deck makes sure a load that
+    raced with a write is discarded instead of installed. The total number of
+    cached records is bounded by ``max_records``.
+    """
+
+    def __init__(self, max_records=MAX_CACHED_RECORDS):
+        self.max_records = max_records
+        self.enabled = True
+        self._decks = OrderedDict()
+        self._versions = {}
+        self._too_large = set()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _bump(self, deck_id):
+        self._versions[deck_id] = self._versions.get(deck_id, 0) + 1
+
+    def _install(self, deck_id, queue):
+        old = self._decks.pop(deck_id, None)
+        if old is not None:
+            self._size -= len(old)
+
+        self._decks[deck_id] = queue
+        self._size += len(queue)
+
+        # 淘汰最久未使用的词单
+        while self._size > self.max_records and len(self._decks) > 1:
+            evicted_id, evicted = self._decks.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+            logging.info(f"Evicted deck {evicted_id} from due cache ({len(evicted)} records)")
+
+    def get_due(self, deck_id, limit, now=None):
+        """
+        Get the records of a deck due for review, loading the deck if needed.
+
+        Args:
+            deck_id (int): The ID of the deck.
+            limit (int): Maximum number of records to return.
+            now (int, optional): The current time as a millisecond timestamp.
+
+        Returns:
+            list or None: The due records, or None if the deck cannot be cached
+                          (too large, or the deck does not exist) or the cache
+                          is disabled.
+        """
+        deck_id = int(deck_id)
+        limit = int(limit)
+        if now is None:
+            now = int(datetime.now().timestamp() * 1000)
+
+        with self._lock:
+            if not self.enabled or deck_id in self._too_large:
+                return None
+            queue = self._decks.get(deck_id)
+            if queue is not None:
+                self._decks.move_to_end(deck_id)
+                self.hits += 1
+                return queue.due(now, limit)
+            self.misses += 1
+            version = self._versions.get(deck_id, 0)
+
+        if count_deck_records(deck_id) > self.max_records:
+            # 记住过大的词单，避免每次请求都尝试加载
+            with self._lock:
+                self._too_large.add(deck_id)
+            return None
+
+        records = load_deck_records(deck_id, self.max_records)
+        if records is None:
+            return None
+
+        queue = DeckDueQueue(records)
+        with self._lock:
+            # 加载期间有写入时不安装，下次请求重新加载
+            if self._versions.get(deck_id, 0) == version:
+                self._install(deck_id, queue)
+                logging.info(f"Loaded deck {deck_id} into due cache ({len(queue)} records)")
+        return queue.due(now, limit)
+
+    def update_records(self, deck_id, updates):
+        """
+        Apply committed reviews to a cached deck.
+
+        Args:
+            deck_id (int): The ID of the deck.
+            updates (dict): A mapping of record ID to its new ``FSRS_FIELDS`` values.
+        """
+        deck_id = int(deck_id)
+        with self._lock:
+            self._bump(deck_id)
+            queue = self._decks.get(deck_id)
+            if queue is None:
+                return
+            for record_id, fields in updates.items():
+                if not queue.update(record_id, fields):
+                    # 缓存中缺少该记录，说明缓存已不可信
+                    self._drop(deck_id)
+                    return
+
+    def add_new_records(self, deck_id):
+        """
+        Load records added to a deck since it was cached, e.g. by an import.
+
+        Imports only ever add records, with IDs larger than any cached one.
+
+        Args:
+            deck_id (int): The ID of the deck.
+        """
+        deck_id = int(deck_id)
+        with self._lock:
+            self._bump(deck_id)
+            self._too_large.discard(deck_id)
+            queue = self._decks.get(deck_id)
+            if queue is None:
+                return
+            after_id = queue.max_id
+            version = self._versions[deck_id]
+
+        records = load_deck_records(deck_id, self.max_records, after_id)
+
+        with self._lock:
+            if self._decks.get(deck_id) is not queue:
+                return
+            self._drop(deck_id)
+            if records is None or self._versions[deck_id] != version:
+                return
+
+            for record in records:
+                queue.add(record)
+            if len(queue) > self.max_records:
+                self._too_large.add(deck_id)
+                return
+            self._install(deck_id, queue)
+
+    def disable(self):
+        """
+        Empty the cache and stop caching.
+
+        Used when several processes serve the same database: a process only
+        sees its own writes, so its cached queues could fall behind.
+        """
+        with self._lock:
+            self.enabled = False
+        self.invalidate()
+
+    def _drop(self, deck_id):
+        queue = self._decks.pop(deck_id, None)
+        if queue is not None:
+            self._size -= len(queue)
+
+    def invalidate(self, deck_id=None):
+        """
+        Drop a deck, or every deck, from the cache.
+
+        Args:
+            deck_id (int, optional): The ID of the deck. Defaults to all decks.
+        """
+        with self._lock:
+            if deck_id is None:
+                for cached_id in self._decks:
+                    self._bump(cached_id)
+                self._decks.clear()
+                self._too_large.clear()
+                self._size = 0
+            else:
+                deck_id = int(deck_id)
+                self._bump(deck_id)
+                self._too_large.discard(deck_id)
+                self._drop(deck_id)
+
+    def cached_decks(self):
+        """
+        Get the IDs of the cached decks.
+
+        Returns:
+            list: Deck IDs, least recently used first.
+        """
+        with self._lock:
+            return list(self._decks)
+
+    def snapshot(self, deck_id):
+        """
+        Copy the cached records of a deck.
+
+        Args:
+            deck_id (int): The ID of the deck.
+
+        Returns:
+            dict or None: A mapping of record ID to record, or None if not cached.
+        """
+        with self._lock:
+            queue = self._decks.get(int(deck_id))
+            if queue is None:
+                return None
+            return {record_id: dict(record) for record_id, record in queue.records.items()}
+
+    def stats(self):
+        """
+        Get cache usage counters.
+
+        Returns:
+            dict: Hits, misses, evictions and the number of cached decks and records.
+        """
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'decks': len(self._decks),
+                'records': self._size,
+                'max_records': self.max_records
+            }
+
+def load_deck_records(deck_id, max_records=None, after_id=0):
+    """
+    Load the FSRS records of a deck, joined with their words.
+
+    Args:
+        deck_id (int): The ID of the deck.
+        max_records (int, optional): Give up if the deck has more records than this.
+        after_id (int, optional): Only load records with a larger ID.
+
+    Returns:
+        list or None: Records as dictionaries, or None if the deck is too large
+                      or cannot be read.
+    """
+    conn = get_read_connection()
+    try:
+        c = conn.cursor()
+        c.execute('''
+            SELECT sr.id, sr.word_id, sr.question, sr.state, sr.difficulty,
+                   sr.stability, sr.retrievability, sr.reps, sr.lapses,
+                   sr.scheduled_days, sr.next_review, sr.last_review,
+                   w.japanese, w.kana, w.chinese, w.is_kana
+            FROM srs_records sr
+            JOIN words w ON sr.word_id = w.id
+            WHERE sr.deck_id = ? AND sr.id > ?
+            LIMIT ?
+        ''', (deck_id, after_id, -1 if max_records is None else max_records + 1))
+        rows = c.fetchall()
+    except Exception as e:
+        logging.error(f"Error loading deck {deck_id} into due cache: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+    if max_records is not None and len(rows) > max_records:
+        logging.info(f"Deck {deck_id} is too large for the due cache")
+        return None
+
+    return [dict(zip(RECORD_COLUMNS, row)) for row in rows]
+
+def count_deck_records(deck_id):
+    """
+    Get the number of FSRS records of a deck from its statistics.
+
+    Args:
+        deck_id (int): The ID of the deck.
+
+    Returns:
+        int: The number of records, or 0 if the deck has no statistics.
+    """
+    conn = get_read_connection()
+    try:
+        row = conn.execute('SELECT total_cards FROM deck_stats WHERE deck_id = ?', (deck_id,)).fetchone()
+        return row[0] if row else 0
+    finally:
+        conn.close()
+
+def verify_due_cache(deck_ids=None):
+    """
+    Compare cached decks with their tables.
+
+    Args:
+        deck_ids (iterable, optional): The decks to check. Defaults to all cached decks.
+
+    Returns:
+        dict: A mapping of deck ID to its differences: record IDs missing from the
+              cache, record IDs only in the cache and records whose fields differ.
+              Decks that are not cached are reported with ``cached`` set to False.
+    """
+    report = {}
+    for deck_id in (deck_ids if deck_ids is not None else due_cache.cached_decks()):
+        cached = due_cache.snapshot(deck_id)
+        if cached is None:
+            report[deck_id] = {'cached': False}
+            continue
+
+        records = load_deck_records(deck_id)
+        if records is None:
+            report[deck_id] = {'cached': True, 'error': '无法读取词单'}
+            continue
+        table = {record['id']: record for record in records}
+
+        report[deck_id] = {
+            'cached': True,
+            'missing': sorted(table.keys() - cached.keys()),
+            'extra': sorted(cached.keys() - table.keys()),
+            'mismatched': [
+                {
+                    'id': record_id,
+                    'fields': {
+                        name: {'cache': cached[record_id][name], 'table': table[record_id][name]}
+                        for name in RECORD_COLUMNS
+                        if cached[record_id][name] != table[record_id][name]
+                    }
+                }
+                for record_id in sorted(table.keys() & cached.keys())
+                if cached[record_id] != table[record_id]
+            ]
+        }
+    return report
+
+# 进程内共享的缓存实例
+due_cache = DueCache()
@@ -0,0 +1,174 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from db import get_read_connection
+from db.stats import DAY_MS
+
+# 预测的最大天数，缓存中保存的直方图长度
+MAX_FORECAST_DAYS = 365
+
+# 新卡片状态，与 models.fsrs.STATES['NEW'] 相同
+STATE_NEW = 0
+
+def load_deck_forecast(c, deck_id, today):
+    """
+    Count the reviews of a deck due on each of the next ``MAX_FORECAST_DAYS`` days.
+
+    New cards are not scheduled and are counted separately. Cards that were
+    due before today are counted as overdue.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+        deck_id (int): The ID of the deck.
+        today (int): The current day, in UTC days since the epoch.
+
+    Returns:
+        dict: ``new`` and ``overdue`` counts and the ``due`` histogram, an int64
+              array with one count per day starting today.
+    """
+    # 按 (deck_id, state, next_review) 索引分状态扫描，每天一行
+    c.execute('''
+        SELECT next_review / ? AS due_day, COUNT(*)
+        FROM srs_records
+        WHERE deck_id = ? AND state IN (1, 2, 3) AND next_review < ?
+        GROUP BY due_day
+    ''', (DAY_MS, deck_id, (today + MAX_FORECAST_DAYS) * DAY_MS))
+    rows = c.fetchall()
+
+    days = np.array([row[0] for row in rows], dtype=np.int64) - today
+    counts = np.array([row[1] for row in rows], dtype=np.int64)
+
+    c.execute('SELECT COUNT(*) FROM srs_records WHERE deck_id = ? AND state = ?', (deck_id, STATE_NEW))
+    new_count = c.fetchone()[0]
+
+    upcoming = days >= 0
+    return {
+        'new': new_count,
+        'overdue': int(counts[~upcoming].sum()),
+        'due': np.bincount(days[upcoming], weights=counts[upcoming], minlength=MAX_FORECAST_DAYS).astype(np.int64)
+    }
+
+class ForecastCache:
+    """
+    A process-local cache of the per-deck review forecasts.
+
+    Entries are computed for the current UTC day and dropped when the day
+    changes or when the deck's records change.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._forecasts = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, deck_id, today):
+        """
+        Get the forecast of a deck, computing it on a miss.
+
+        Args:
+            deck_id (int): The ID of the deck.
+            today (int): The current day, in UTC days since the epoch.
+
+        Returns:
+            dict: The forecast, as returned by ``load_deck_forecast``.
+        """
+        deck_id = int(deck_id)
+        with self._lock:
+            entry = self._forecasts.get(deck_id)
+            if entry is not None and entry[0] == today:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            version = self._versions.get(deck_id, 0)
+
+        conn = get_read_connection()
+        try:
+            forecast = load_deck_forecast(conn.cursor(), deck_id, today)
+        finally:
+            conn.close()
+
+        # 计算期间词单有变化时不缓存结果
+        with self._lock:
+            if self.enabled and self._versions.get(deck_id, 0) == version:
+                self._forecasts[deck_id] = (today, forecast)
+        return forecast
+
+    def disable(self):
+        """
+        Empty the cache and compute every forecast from the database.
+
+        Used when several processes serve the same database, since a process
+        is only notified of its own writes.
+        """
+        with self._lock:
+            self.enabled = False
+        self.invalidate()
+
+    def invalidate(self, deck_id=None):
+        """
+        Drop the forecast of a deck, or of every deck.
+
+        Args:
+            deck_id (int, optional): The ID of the deck. Defaults to all decks.
+        """
+        with self._lock:
+            deck_ids = list(self._forecasts) if deck_id is None else [int(deck_id)]
+            for cached_id in deck_ids:
+                self._versions[cached_id] = self._versions.get(cached_id, 0) + 1
+                self._forecasts.pop(cached_id, None)
+
+# 进程内共享的缓存实例
+forecast_cache = ForecastCache()
+
+def get_forecast(deck_id=None, days=30):
+    """
+    Get the daily review workload of a deck, or of all decks.
+
+    Args:
+        deck_id (int, optional): The ID of the deck. Defaults to all decks.
+        days (int, optional): Number of days to forecast, at most ``MAX_FORECAST_DAYS``.
+
+    Returns:
+        dict or None: The first day (UTC date), the number of new and overdue
+                      cards and the ``due`` count of each day; None if the deck
+                      does not exist.
+    """
+    days = max(1, min(int(days), MAX_FORECAST_DAYS))
+    today = int(datetime.now(timezone.utc).timestamp() * 1000) // DAY_MS
+
+    conn = get_read_connection()
+    try:
+        c = conn.cursor()
+        if deck_id is None:
+            c.execute('SELECT id FROM decks ORDER BY id')
+        else:
+            c.execute('SELECT id FROM decks WHERE id = ?', (deck_id,))
+        deck_ids = [row[0] for row in c.fetchall()]
+    finally:
+        conn.close()
+
+    if deck_id is not None and not deck_ids:
+        logging.error(f"Deck {deck_id} not found")
+        return None
+
+    new_count = 0
+    overdue = 0
+    due = np.zeros(MAX_FORECAST_DAYS, dtype=np.int64)
+    for forecast_deck_id in deck_ids:
+        forecast = forecast_cache.get(forecast_deck_id, today)
+        new_count += forecast['new']
+        overdue += forecast['overdue']
+        due += forecast['due']
+
+    return {
+        'deck_id': deck_id,
+        'start_date': (datetime(1970, 1, 1) + timedelta(days=today)).date().isoformat(),
+        'new': new_count,
+        'overdue': overdue,
+        'due': due[:days].tolist()
+    }
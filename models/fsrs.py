@@ -1,8 +1,19 @@
-from db import get_db_connection
+from db import execute_write, get_read_connection
+from db.schema import create_due_indexes, drop_due_indexes
+from db.stats import DAY_MS, get_word_due_times, refresh_deck_stats, update_deck_stats
+from models.due_cache import RECORD_COLUMNS, due_cache
+from models.forecast import forecast_cache
+import json
 import math
 import logging
 import re
+import sqlite3
 from datetime import datetime
+from itertools import chain
+import numpy as np
+
+# 每次请求都会执行的日志使用模块日志器，可以按日志器采样（见 utils.log_utils）
+logger = logging.getLogger(__name__)
 
 # FSRS 状态常量
 STATES = {
@@ -19,6 +30,9 @@ FSRS_PARAMETERS = {
     'w': [0.4, 0.6, 2.4, 5.8, 4.93, 0.94, 0.86, 0.01, 1.49, 0.14, 0.94, 2.18, 0.05, 0.34, 1.26, 0.29, 2.61],
 }
 
+# 重新安排复习时间时，变化的记录数超过该值则重建到期索引而不是逐行维护
+RESCHEDULE_REBUILD_INDEX_ROWS = 100000
+
 # 难度评级映射
 RATING_MAP = {
     '重来': 1,
@@ -35,91 +49,61 @@ def initialize_fsrs_record(word_id, question, deck_id, conn=None):
         word_id (int): The ID of the word.
         question (str): The question text.
         deck_id (int): The ID of the deck.
-        conn (sqlite3.Connection, optional): An existing database connection. If provided, this function
-                                            will not commit the transaction or close the connection.
+        conn (sqlite3.Connection, optional): An existing database connection. If provided, the record
+                                            is inserted in the caller's transaction instead of
+                                            through the database writer.
 
     Returns:
         int: The ID of the new FSRS record.
     """
-    import time
-    import sqlite3
-
-    # 确定是否需要自己管理连接
-    manage_connection = conn is None
-
-    max_retries = 5
-    retry_delay = 0.1  # 初始延迟时间（秒）
-
-    for attempt in range(max_retries):
-        local_conn = None
-        try:
-            if manage_connection:
-                local_conn = get_db_connection()
-                c = local_conn.cursor()
-            else:
-                c = conn.cursor()
-
-            # 检查记录是否已存在
-            c.execute(f'''
-                SELECT id FROM srs_records_{deck_id}
-                WHERE word_id = ? AND question = ?
-            ''', (word_id, question))
-
-            existing_record = c.fetchone()
-            if existing_record:
-                logging.debug(f"FSRS record already exists for word_id={word_id}, question={question}")
-                return existing_record[0]
-
-            # 初始化FSRS记录
-            c.execute(f'''
-                INSERT INTO srs_records_{deck_id} (
-                    word_id, question, state, difficulty, stability,
-                    retrievability, reps, lapses, scheduled_days,
-                    next_review, last_review
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                word_id,
-                question,
-                STATES['NEW'],  # 新卡片
-                3.0,            # 中等难度
-                0.0,            # 初始稳定性
-                1.0,            # 初始可提取性
-                0,              # 复习次数
-                0,              # 遗忘次数
-                0,              # 计划天数
-                0,              # 下次复习时间
-                0               # 上次复习时间
-            ))
-
-            record_id = c.lastrowid
-
-            # 只有当我们自己管理连接时才提交事务
-            if manage_connection:
-                local_conn.commit()
-
-            logging.debug(f"Successfully initialized FSRS record: id={record_id}, word_id={word_id}, question={question}")
-            return record_id
-
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                # 数据库锁定，等待一段时间后重试
-                wait_time = retry_delay * (2 ** attempt)  # 指数退避策略
-                logging.warning(f"Database is locked, retrying in {wait_time:.2f} seconds (attempt {attempt+1}/{max_retries})")
-                time.sleep(wait_time)
-            else:
-                logging.error(f"Error initializing FSRS record after {attempt+1} attempts: {str(e)}")
-                return None
-
-        except Exception as e:
-            logging.error(f"Error initializing FSRS record: {str(e)}")
-            return None
-
-        finally:
-            # 只有当我们自己管理连接时才关闭连接
-            if manage_connection and local_conn:
-                local_conn.close()
-
-def calculate_stability(stability, difficulty, rating, reps):
+    try:
+        if conn is not None:
+            return _initialize_fsrs_record(conn.cursor(), word_id, question, deck_id)
+        return execute_write(_initialize_fsrs_record, word_id, question, deck_id)
+
+    except Exception as e:
+        logging.error(f"Error initializing FSRS record: {str(e)}")
+        return None
+
+def _initialize_fsrs_record(c, word_id, question, deck_id):
+    # 检查记录是否已存在
+    c.execute('''
+        SELECT id FROM srs_records
+        WHERE word_id = ? AND question = ?
+    ''', (word_id, question))
+
+    existing_record = c.fetchone()
+    if existing_record:
+        logger.debug("FSRS record already exists for word_id=%s, question=%s", word_id, question)
+        return existing_record[0]
+
+    # 初始化FSRS记录
+    c.execute('''
+        INSERT INTO srs_records (
+            deck_id, word_id, question, state, difficulty, stability,
+            retrievability, reps, lapses, scheduled_days,
+            next_review, last_review
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        deck_id,
+        word_id,
+        question,
+        STATES['NEW'],  # 新卡片
+        3.0,            # 中等难度
+        0.0,            # 初始稳定性
+        1.0,            # 初始可提取性
+        0,              # 复习次数
+        0,              # 遗忘次数
+        0,              # 计划天数
+        0,              # 下次复习时间
+        0               # 上次复习时间
+    ))
+
+    record_id = c.lastrowid
+    logger.debug("Successfully initialized FSRS record: id=%s, word_id=%s, question=%s", record_id, word_id, question)
+    return record_id
+
+def calculate_stability(stability, difficulty, rating, reps, parameters=FSRS_PARAMETERS):
     """
     Calculate stability based on FSRS algorithm.
 
@@ -128,11 +112,12 @@ def calculate_stability(stability, difficulty, rating, reps):
         difficulty (float): Difficulty factor.
         rating (int): Rating (1-4).
         reps (int): Number of repetitions.
+        parameters (dict, optional): FSRS parameters. Defaults to ``FSRS_PARAMETERS``.
 
     Returns:
         float: New stability.
     """
-    w = FSRS_PARAMETERS['w']
+    w = parameters['w']
 
     if rating == 1:
         # 忘记
@@ -154,18 +139,19 @@ def calculate_stability(stability, difficulty, rating, reps):
 
     return stability
 
-def calculate_difficulty(difficulty, rating):
+def calculate_difficulty(difficulty, rating, parameters=FSRS_PARAMETERS):
     """
     Calculate difficulty based on FSRS algorithm.
 
     Args:
         difficulty (float): Current difficulty.
         rating (int): Rating (1-4).
+        parameters (dict, optional): FSRS parameters. Defaults to ``FSRS_PARAMETERS``.
 
     Returns:
         float: New difficulty.
     """
-    w = FSRS_PARAMETERS['w']
+    w = parameters['w']
 
     if rating == 1:
         # 忘记
@@ -185,18 +171,19 @@ def calculate_difficulty(difficulty, rating):
     # 确保难度在合理范围内
     return min(max(new_difficulty, 1), 5)
 
-def calculate_interval(stability):
+def calculate_interval(stability, parameters=FSRS_PARAMETERS):
     """
     Calculate interval based on FSRS algorithm.
 
     Args:
         stability (float): Stability factor.
+        parameters (dict, optional): FSRS parameters. Defaults to ``FSRS_PARAMETERS``.
 
     Returns:
         int: Interval in days.
     """
-    request_retention = FSRS_PARAMETERS['request_retention']
-    maximum_interval = FSRS_PARAMETERS['maximum_interval']
+    request_retention = parameters['request_retention']
+    maximum_interval = parameters['maximum_interval']
 
     # 计算间隔
     interval = math.ceil(stability * math.log(request_retention) / math.log(0.9))
@@ -204,6 +191,390 @@ def calculate_interval(stability):
     # 确保间隔在合理范围内
     return min(max(interval, 1), maximum_interval)
 
+def get_fsrs_parameters(c, deck_id=None):
+    """
+    Get the FSRS parameters in effect for a deck.
+
+    The active parameter set of the deck wins over the active global set,
+    which wins over ``FSRS_PARAMETERS``. Read on every review, so activating a
+    new set takes effect immediately in every process.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+        deck_id (int, optional): The ID of the deck. Defaults to the global parameters.
+
+    Returns:
+        dict: ``request_retention``, ``maximum_interval`` and ``w``.
+    """
+    c.execute('''
+        SELECT w, request_retention, maximum_interval FROM fsrs_parameters
+        WHERE active = 1 AND (deck_id = ? OR deck_id IS NULL)
+        ORDER BY deck_id IS NULL
+        LIMIT 1
+    ''', (deck_id,))
+    row = c.fetchone()
+    if not row:
+        return FSRS_PARAMETERS
+
+    return {
+        'request_retention': row[1],
+        'maximum_interval': row[2],
+        'w': json.loads(row[0])
+    }
+
+def save_fsrs_parameters(w, deck_id=None, request_retention=None, maximum_interval=None,
+                         loss=None, review_count=None, activate=False):
+    """
+    Store an FSRS parameter set.
+
+    Args:
+        w (list): The 17 weights.
+        deck_id (int, optional): The deck the set is for. Defaults to global.
+        request_retention (float, optional): Defaults to the built-in value.
+        maximum_interval (int, optional): Defaults to the built-in value.
+        loss (float, optional): The log loss of the fit.
+        review_count (int, optional): The number of reviews the set was fitted on.
+        activate (bool, optional): Activate the set right away. Defaults to False.
+
+    Returns:
+        int or None: The ID of the parameter set, or None on failure.
+    """
+    if len(w) != len(FSRS_PARAMETERS['w']):
+        logging.error(f"Expected {len(FSRS_PARAMETERS['w'])} FSRS weights, got {len(w)}")
+        return None
+
+    def insert(c):
+        c.execute('''
+            INSERT INTO fsrs_parameters (
+                deck_id, w, request_retention, maximum_interval, loss, review_count, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            deck_id,
+            json.dumps([float(weight) for weight in w]),
+            request_retention if request_retention is not None else FSRS_PARAMETERS['request_retention'],
+            maximum_interval if maximum_interval is not None else FSRS_PARAMETERS['maximum_interval'],
+            loss,
+            review_count,
+            int(datetime.now().timestamp() * 1000)
+        ))
+        parameter_id = c.lastrowid
+        if activate:
+            _activate_parameters(c, parameter_id, deck_id)
+        return parameter_id
+
+    try:
+        parameter_id = execute_write(insert)
+
+        logging.info(f"Saved FSRS parameter set {parameter_id} for {f'deck {deck_id}' if deck_id else 'all decks'}")
+        return parameter_id
+    except Exception as e:
+        logging.error(f"Error saving FSRS parameters: {str(e)}")
+        return None
+
+def _activate_parameters(c, parameter_id, deck_id):
+    c.execute('''
+        UPDATE fsrs_parameters SET active = (id = ?)
+        WHERE deck_id IS ? AND (active = 1 OR id = ?)
+    ''', (parameter_id, deck_id, parameter_id))
+
+def activate_fsrs_parameters(parameter_id):
+    """
+    Activate an FSRS parameter set, replacing the active set of the same scope.
+
+    Args:
+        parameter_id (int): The ID of the parameter set.
+
+    Returns:
+        bool: True if the set exists and was activated.
+    """
+    def activate(c):
+        c.execute('SELECT deck_id FROM fsrs_parameters WHERE id = ?', (parameter_id,))
+        row = c.fetchone()
+        if not row:
+            return False
+
+        _activate_parameters(c, parameter_id, row[0])
+        return True
+
+    try:
+        if not execute_write(activate):
+            logging.error(f"FSRS parameter set {parameter_id} not found")
+            return False
+
+        logging.info(f"Activated FSRS parameter set {parameter_id}")
+        return True
+    except Exception as e:
+        logging.error(f"Error activating FSRS parameters: {str(e)}")
+        return False
+
+def deactivate_fsrs_parameters(deck_id=None):
+    """
+    Deactivate the active parameter set of a scope, falling back to the next one.
+
+    Args:
+        deck_id (int, optional): The deck whose set to deactivate. Defaults to the global set.
+
+    Returns:
+        bool: True if the operation succeeded.
+    """
+    def deactivate(c):
+        c.execute('UPDATE fsrs_parameters SET active = 0 WHERE deck_id IS ? AND active = 1', (deck_id,))
+
+    try:
+        execute_write(deactivate)
+        return True
+    except Exception as e:
+        logging.error(f"Error deactivating FSRS parameters: {str(e)}")
+        return False
+
+def list_fsrs_parameters(deck_id=None):
+    """
+    List the stored FSRS parameter sets.
+
+    Args:
+        deck_id (int, optional): Only list the sets of this deck and the global sets.
+
+    Returns:
+        list: Parameter sets as dictionaries, newest first.
+    """
+    conn = get_read_connection()
+    try:
+        c = conn.cursor()
+        if deck_id is None:
+            c.execute('''
+                SELECT id, deck_id, w, request_retention, maximum_interval, active, loss, review_count, created_at
+                FROM fsrs_parameters ORDER BY id DESC
+            ''')
+        else:
+            c.execute('''
+                SELECT id, deck_id, w, request_retention, maximum_interval, active, loss, review_count, created_at
+                FROM fsrs_parameters WHERE deck_id = ? OR deck_id IS NULL ORDER BY id DESC
+            ''', (deck_id,))
+
+        return [
+            {
+                'id': row['id'],
+                'deck_id': row['deck_id'],
+                'w': json.loads(row['w']),
+                'request_retention': row['request_retention'],
+                'maximum_interval': row['maximum_interval'],
+                'active': bool(row['active']),
+                'loss': row['loss'],
+                'review_count': row['review_count'],
+                'created_at': row['created_at']
+            }
+            for row in c.fetchall()
+        ]
+    finally:
+        conn.close()
+
+def parse_rating(difficulty_level):
+    """
+    Convert a difficulty level to an FSRS rating.
+
+    Args:
+        difficulty_level (str or int): The difficulty level ('重来', '困难', '良好', or '简单',
+                                       optionally followed by a shortcut hint such as '(D)'),
+                                       or a rating from 1 to 4.
+
+    Returns:
+        int or None: The rating (1-4), or None if the level is unknown.
+    """
+    if isinstance(difficulty_level, int) and not isinstance(difficulty_level, bool):
+        return difficulty_level if 1 <= difficulty_level <= 4 else None
+
+    if not isinstance(difficulty_level, str):
+        return None
+
+    # 去除难度级别中的键盘快捷键提示，例如 "简单(D)" -> "简单"
+    clean_difficulty = re.sub(r'\([A-Z]\)$', '', difficulty_level)
+    return RATING_MAP.get(clean_difficulty)
+
+def _apply_rating(state, difficulty, stability, reps, lapses, scheduled_days, rating, parameters):
+    """
+    Run the FSRS state machine for one review.
+
+    Args:
+        state (int): The current FSRS state.
+        difficulty (float): The current difficulty.
+        stability (float): The current stability.
+        reps (int): The number of repetitions before this review.
+        lapses (int): The number of lapses.
+        scheduled_days (int): The current interval in days.
+        rating (int): The rating (1-4).
+        parameters (dict): FSRS parameters.
+
+    Returns:
+        tuple: The new state, difficulty, stability, reps, lapses and scheduled_days.
+    """
+    # 更新复习次数
+    reps += 1
+
+    # 根据当前状态和评分更新 FSRS 信息
+    if state == STATES['NEW']:
+        # 新卡片
+        if rating == 1:
+            # 忘记
+            state = STATES['LEARNING']
+            stability = 0
+            difficulty = calculate_difficulty(difficulty, rating, parameters)
+            scheduled_days = 0  # 立即复习
+        else:
+            # 记住
+            state = STATES['REVIEW']
+            stability = 1 if rating == 2 else (2 if rating == 3 else 4)  # 根据评分设置初始稳定性
+            difficulty = calculate_difficulty(difficulty, rating, parameters)
+            scheduled_days = calculate_interval(stability, parameters)
+    elif state == STATES['LEARNING'] or state == STATES['RELEARNING']:
+        # 学习中或重新学习中
+        if rating == 1:
+            # 忘记
+            scheduled_days = 0  # 立即复习
+        else:
+            # 记住
+            state = STATES['REVIEW']
+            stability = 1 if rating == 2 else (2 if rating == 3 else 4)  # 根据评分设置初始稳定性
+            difficulty = calculate_difficulty(difficulty, rating, parameters)
+            scheduled_days = calculate_interval(stability, parameters)
+    elif state == STATES['REVIEW']:
+        # 复习中
+        if rating == 1:
+            # 忘记
+            state = STATES['RELEARNING']
+            stability = calculate_stability(stability, difficulty, rating, reps, parameters)
+            difficulty = calculate_difficulty(difficulty, rating, parameters)
+            lapses += 1
+            scheduled_days = 0  # 立即复习
+        else:
+            # 记住
+            stability = calculate_stability(stability, difficulty, rating, reps, parameters)
+            difficulty = calculate_difficulty(difficulty, rating, parameters)
+            scheduled_days = calculate_interval(stability, parameters)
+
+    return state, difficulty, stability, reps, lapses, scheduled_days
+
+def review_fsrs_record(c, deck_id, record_id, rating, now, parameters=None):
+    """
+    Apply one review to an FSRS record, log it and update the deck statistics.
+
+    Runs on the caller's cursor and does not commit.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+        deck_id (int): The ID of the deck.
+        record_id (int): The ID of the FSRS record.
+        rating (int): The rating (1-4).
+        now (int): The review time as a millisecond timestamp.
+        parameters (dict, optional): FSRS parameters. Defaults to the active
+                                     parameters of the deck.
+
+    Returns:
+        dict or None: The new FSRS fields of the record, or None if it was not found.
+    """
+    from models.previews import card_fingerprint, preview_cache
+
+    # 获取当前记录
+    c.execute('''
+        SELECT word_id, state, difficulty, stability, retrievability, reps, lapses, scheduled_days, last_review
+        FROM srs_records
+        WHERE id = ? AND deck_id = ?
+    ''', (record_id, deck_id))
+
+    record = c.fetchone()
+    if not record:
+        logging.error(f"FSRS record with ID {record_id} not found in deck {deck_id}")
+        return None
+
+    if parameters is None:
+        parameters = get_fsrs_parameters(c, deck_id)
+
+    word_id, state, difficulty, stability, retrievability, reps, lapses, scheduled_days, last_review = record
+    before = (state, difficulty, stability, reps, lapses)
+    old_state = state
+    due_before = get_word_due_times(c, deck_id, [word_id])
+
+    # 卡片状态未变时直接使用展示给用户的预览结果
+    fingerprint = card_fingerprint({
+        'state': state, 'difficulty': difficulty, 'stability': stability, 'reps': reps,
+        'lapses': lapses, 'scheduled_days': scheduled_days, 'last_review': last_review
+    }, parameters)
+    outcome = preview_cache.take(deck_id, record_id, rating, fingerprint)
+    if outcome is not None:
+        state, difficulty, stability, reps, lapses, scheduled_days = (
+            outcome['state'], outcome['difficulty'], outcome['stability'],
+            outcome['reps'], outcome['lapses'], outcome['scheduled_days']
+        )
+    else:
+        state, difficulty, stability, reps, lapses, scheduled_days = _apply_rating(
+            state, difficulty, stability, reps, lapses, scheduled_days, rating, parameters
+        )
+
+    # 计算下次复习时间
+    next_review = now + (scheduled_days * 24 * 60 * 60 * 1000)  # 转换为毫秒
+
+    # 计算可提取性
+    retrievability = math.exp(math.log(0.9) * stability)
+
+    # 更新记录
+    c.execute('''
+        UPDATE srs_records
+        SET state = ?, difficulty = ?, stability = ?, retrievability = ?,
+            reps = ?, lapses = ?, scheduled_days = ?, next_review = ?, last_review = ?
+        WHERE id = ? AND deck_id = ?
+    ''', (
+        state,
+        difficulty,
+        stability,
+        retrievability,
+        reps,
+        lapses,
+        scheduled_days,
+        next_review,
+        now,
+        record_id,
+        deck_id
+    ))
+
+    # 检查是否有行被更新
+    if c.rowcount == 0:
+        logging.warning(f"No rows updated for FSRS record {record_id} in deck {deck_id}")
+    else:
+        logger.info("Updated FSRS record %s in deck %s", record_id, deck_id)
+
+    # 在同一事务中写入复习日志
+    c.execute('''
+        INSERT INTO review_log (
+            deck_id, record_id, rating, reviewed_at, elapsed_days,
+            state_before, difficulty_before, stability_before, reps_before, lapses_before,
+            state_after, difficulty_after, stability_after, scheduled_days
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        deck_id, record_id, rating, now,
+        max(now - last_review, 0) / DAY_MS if last_review else 0,
+        *before,
+        state, difficulty, stability, scheduled_days
+    ))
+
+    # 在同一事务中更新词单统计
+    update_deck_stats(
+        c, deck_id,
+        states={old_state: -1, state: 1} if old_state != state else None,
+        due_before=due_before,
+        due_after=get_word_due_times(c, deck_id, [word_id])
+    )
+
+    return {
+        'state': state,
+        'difficulty': difficulty,
+        'stability': stability,
+        'retrievability': retrievability,
+        'reps': reps,
+        'lapses': lapses,
+        'scheduled_days': scheduled_days,
+        'next_review': next_review,
+        'last_review': now
+    }
+
 def update_fsrs_data(record_id, difficulty_level, deck_id):
     """
     Update FSRS data for a record.
@@ -216,227 +587,414 @@ def update_fsrs_data(record_id, difficulty_level, deck_id):
     Returns:
         bool: True if the FSRS data was updated successfully.
     """
-    import time
-    import sqlite3
-
-    logging.info(f"Updating FSRS data: record_id={record_id}, deck_id={deck_id}, difficulty={difficulty_level}")
+    logger.info("Updating FSRS data: record_id=%s, deck_id=%s, difficulty=%s", record_id, deck_id, difficulty_level)
 
     # 检查 record_id 是否有效
     if not record_id:
         logging.error("Invalid FSRS record ID")
         return False
 
-    # 去除难度级别中的键盘快捷键提示，例如 "简单(D)" -> "简单"
-    clean_difficulty = re.sub(r'\([A-Z]\)$', '', difficulty_level)
-
     # 获取评分
-    rating = RATING_MAP.get(clean_difficulty)
+    rating = parse_rating(difficulty_level)
     if not rating:
-        logging.error(f"Unknown difficulty level: {clean_difficulty}")
+        logging.error(f"Unknown difficulty level: {difficulty_level}")
         return False
 
-    max_retries = 5
-    retry_delay = 0.1  # 初始延迟时间（秒）
+    try:
+        # 当前时间
+        now = int(datetime.now().timestamp() * 1000)  # 毫秒时间戳
 
-    for attempt in range(max_retries):
-        conn = None
+        # 由写线程与其他写入合并提交
+        fields = execute_write(review_fsrs_record, deck_id, record_id, rating, now)
+        if not fields:
+            return False
+
+        # 提交后再更新复习队列缓存和复习量预测
+        due_cache.update_records(deck_id, {record_id: fields})
+        forecast_cache.invalidate(deck_id)
+        return True
+
+    except Exception as e:
+        logging.error(f"Error updating FSRS data: {str(e)}")
+        return False
+
+def update_fsrs_batch(reviews):
+    """
+    Apply a batch of reviews in a single transaction.
+
+    Reviews are applied in order, so several ratings of the same card build on
+    each other. Each review runs in its own savepoint: an invalid or failing
+    review is rolled back and reported without affecting the others, and the
+    whole batch is committed once.
+
+    Args:
+        reviews (list): Dictionaries with ``deck_id``, ``record_id``, ``rating``
+                        (a difficulty level or 1-4) and an optional ``reviewed_at``
+                        millisecond timestamp.
+
+    Returns:
+        list or None: One result per review, in order, each with the deck and record
+                      IDs and either ``success`` or ``error``. None if the batch
+                      could not be written at all.
+    """
+    try:
+        results, updates = execute_write(_apply_review_batch, reviews)
+    except Exception as e:
+        logging.error(f"Error updating FSRS batch: {str(e)}")
+        return None
+
+    # 提交后再更新复习队列缓存和复习量预测
+    for deck_id, deck_updates in updates.items():
+        due_cache.update_records(deck_id, deck_updates)
+        forecast_cache.invalidate(deck_id)
+
+    logging.info(f"Applied {sum(1 for result in results if result.get('success'))}/{len(results)} reviews in one batch")
+    return results
+
+def _apply_review_batch(c, reviews):
+    """
+    Write task of ``update_fsrs_batch``.
+
+    Args:
+        c (sqlite3.Cursor): The cursor of the database writer.
+        reviews (list): The reviews to apply.
+
+    Returns:
+        tuple: The per-review results and the new FSRS fields by deck and record ID.
+    """
+    # 当前时间
+    now = int(datetime.now().timestamp() * 1000)  # 毫秒时间戳
+
+    results = []
+    updates = {}
+    parameters = {}
+    for review in reviews:
+        result = {'deck_id': review.get('deck_id'), 'record_id': review.get('record_id')}
+        results.append(result)
+
+        try:
+            deck_id = int(review.get('deck_id'))
+            record_id = int(review.get('record_id'))
+        except (TypeError, ValueError):
+            result['error'] = '缺少词单ID或FSRS记录ID'
+            continue
+
+        rating = parse_rating(review.get('rating'))
+        if not rating:
+            result['error'] = '未知的难度评级'
+            continue
+
+        # 复习时间不能晚于当前时间
+        reviewed_at = review.get('reviewed_at')
+        if not isinstance(reviewed_at, (int, float)) or isinstance(reviewed_at, bool):
+            reviewed_at = now
+        reviewed_at = min(int(reviewed_at), now)
+
+        c.execute('SAVEPOINT review')
         try:
-            conn = get_db_connection()
-            c = conn.cursor()
-
-            # 获取当前记录
-            c.execute(f'''
-                SELECT state, difficulty, stability, retrievability, reps, lapses, scheduled_days
-                FROM srs_records_{deck_id}
-                WHERE id = ?
-            ''', (record_id,))
-
-            record = c.fetchone()
-            if not record:
-                logging.error(f"FSRS record with ID {record_id} not found in deck {deck_id}")
-                return False
-
-            state, difficulty, stability, retrievability, reps, lapses, scheduled_days = record
-
-            # 当前时间
-            now = int(datetime.now().timestamp() * 1000)  # 毫秒时间戳
-
-            # 更新复习次数
-            reps += 1
-
-            # 根据当前状态和评分更新 FSRS 信息
-            if state == STATES['NEW']:
-                # 新卡片
-                if rating == 1:
-                    # 忘记
-                    state = STATES['LEARNING']
-                    stability = 0
-                    difficulty = calculate_difficulty(difficulty, rating)
-                    scheduled_days = 0  # 立即复习
-                else:
-                    # 记住
-                    state = STATES['REVIEW']
-                    stability = 1 if rating == 2 else (2 if rating == 3 else 4)  # 根据评分设置初始稳定性
-                    difficulty = calculate_difficulty(difficulty, rating)
-                    scheduled_days = calculate_interval(stability)
-            elif state == STATES['LEARNING'] or state == STATES['RELEARNING']:
-                # 学习中或重新学习中
-                if rating == 1:
-                    # 忘记
-                    scheduled_days = 0  # 立即复习
-                else:
-                    # 记住
-                    state = STATES['REVIEW']
-                    stability = 1 if rating == 2 else (2 if rating == 3 else 4)  # 根据评分设置初始稳定性
-                    difficulty = calculate_difficulty(difficulty, rating)
-                    scheduled_days = calculate_interval(stability)
-            elif state == STATES['REVIEW']:
-                # 复习中
-                if rating == 1:
-                    # 忘记
-                    state = STATES['RELEARNING']
-                    stability = calculate_stability(stability, difficulty, rating, reps)
-                    difficulty = calculate_difficulty(difficulty, rating)
-                    lapses += 1
-                    scheduled_days = 0  # 立即复习
-                else:
-                    # 记住
-                    stability = calculate_stability(stability, difficulty, rating, reps)
-                    difficulty = calculate_difficulty(difficulty, rating)
-                    scheduled_days = calculate_interval(stability)
-
-            # 计算下次复习时间
-            next_review = now + (scheduled_days * 24 * 60 * 60 * 1000)  # 转换为毫秒
-
-            # 计算可提取性
-            retrievability = math.exp(math.log(0.9) * stability)
-
-            # 更新记录
-            c.execute(f'''
-                UPDATE srs_records_{deck_id}
-                SET state = ?, difficulty = ?, stability = ?, retrievability = ?,
-                    reps = ?, lapses = ?, scheduled_days = ?, next_review = ?, last_review = ?
-                WHERE id = ?
-            ''', (
-                state,
-                difficulty,
-                stability,
-                retrievability,
-                reps,
-                lapses,
-                scheduled_days,
-                next_review,
-                now,
-                record_id
-            ))
-
-            # 检查是否有行被更新
-            if c.rowcount == 0:
-                logging.warning(f"No rows updated for FSRS record {record_id} in deck {deck_id}")
+            if deck_id not in parameters:
+                parameters[deck_id] = get_fsrs_parameters(c, deck_id)
+            fields = review_fsrs_record(c, deck_id, record_id, rating, reviewed_at, parameters[deck_id])
+            if fields:
+                updates.setdefault(deck_id, {})[record_id] = fields
+                result['success'] = True
             else:
-                logging.info(f"Updated FSRS record {record_id} in deck {deck_id}")
+                result['error'] = 'FSRS记录不存在'
+            c.execute('RELEASE review')
+        except sqlite3.Error as e:
+            c.execute('ROLLBACK TO review')
+            c.execute('RELEASE review')
+            logging.error(f"Error applying review of record {record_id} in deck {deck_id}: {str(e)}")
+            result['error'] = f'更新FSRS数据失败: {str(e)}'
 
-            conn.commit()
-            return True
+    return results, updates
 
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                # 数据库锁定，等待一段时间后重试
-                wait_time = retry_delay * (2 ** attempt)  # 指数退避策略
-                logging.warning(f"Database is locked, retrying in {wait_time:.2f} seconds (attempt {attempt+1}/{max_retries})")
-                time.sleep(wait_time)
-            else:
-                logging.error(f"Error updating FSRS data after {attempt+1} attempts: {str(e)}")
-                return False
+def reschedule_deck(deck_id, parameters=None):
+    """
+    Recompute the interval and due time of every card in a deck.
 
-        except Exception as e:
-            logging.error(f"Error updating FSRS data: {str(e)}")
-            return False
+    Used after the FSRS parameters change. Cards in the review state get
+    ``scheduled_days`` from their current stability and are due that many
+    days after their last review; new and learning cards are left alone. The
+    whole deck is computed in one vectorized pass and written in one
+    transaction.
+
+    Args:
+        deck_id (int): The ID of the deck.
+        parameters (dict, optional): FSRS parameters. Defaults to the active
+                                     parameters of the deck.
 
-        finally:
-            if conn:
-                conn.close()
+    Returns:
+        int or None: The number of cards whose schedule changed, or None on failure.
+    """
+    try:
+        changed, total = execute_write(_reschedule_deck, deck_id, parameters)
+    except Exception as e:
+        logging.error(f"Error rescheduling deck {deck_id}: {str(e)}")
+        return None
+
+    if changed:
+        due_cache.invalidate(deck_id)
+        forecast_cache.invalidate(deck_id)
+
+    logging.info(f"Rescheduled {changed} of {total} review cards in deck {deck_id}")
+    return changed
+
+def _reschedule_deck(c, deck_id, parameters):
+    """
+    Write task of ``reschedule_deck``.
+
+    Args:
+        c (sqlite3.Cursor): The cursor of the database writer.
+        deck_id (int): The ID of the deck.
+        parameters (dict or None): FSRS parameters, or None for the active parameters.
 
-def get_fsrs_records_for_review(deck_id, limit=20):
+    Returns:
+        tuple: The number of changed cards and the number of review cards.
+    """
+    from models.fsrs_kernel import interval_batch
+
+    c.row_factory = None  # 直接返回元组，读取大量记录时更快
+
+    # 读取和写入在写线程的同一事务中
+    deck_parameters = parameters or get_fsrs_parameters(c, deck_id)
+
+    # 按主键顺序读取，后续按主键更新时顺序访问页面
+    c.execute('''
+        SELECT id, stability, last_review, scheduled_days, next_review
+        FROM srs_records
+        WHERE deck_id = ? AND state = ?
+        ORDER BY id
+    ''', (deck_id, STATES['REVIEW']))
+    rows = c.fetchall()
+
+    changed = 0
+    if rows:
+        columns = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * 5)
+        columns = columns.reshape(-1, 5).T
+        record_ids = columns[0].astype(np.int64)
+        stability = columns[1]
+        last_review = columns[2].astype(np.int64)
+        scheduled_days = columns[3].astype(np.int64)
+        next_review = columns[4].astype(np.int64)
+
+        new_scheduled_days = interval_batch(stability, deck_parameters)
+        new_next_review = last_review + new_scheduled_days * DAY_MS
+
+        # 只写入变化的记录
+        mask = (new_scheduled_days != scheduled_days) | (new_next_review != next_review)
+        changed = int(mask.sum())
+
+        # 大量更新时先删除到期索引，更新后一次性重建，比逐行维护索引快
+        rebuild_indexes = changed >= RESCHEDULE_REBUILD_INDEX_ROWS
+        if rebuild_indexes:
+            drop_due_indexes(c)
+
+        c.executemany('''
+            UPDATE srs_records
+            SET scheduled_days = ?, next_review = ?
+            WHERE id = ?
+        ''', zip(
+            new_scheduled_days[mask].tolist(),
+            new_next_review[mask].tolist(),
+            record_ids[mask].tolist()
+        ))
+
+        if rebuild_indexes:
+            create_due_indexes(c)
+
+    # 到期时间变化后重新统计
+    if changed:
+        refresh_deck_stats(c, deck_id)
+
+    return changed, len(rows)
+
+def get_fsrs_records_for_review(deck_id, limit=20, order='due'):
     """
     Get FSRS records that need review.
 
     Args:
         deck_id (int): The ID of the deck.
         limit (int, optional): Maximum number of records to return. Defaults to 20.
+        order (str, optional): 'due' returns the earliest due records first.
+                               'retrievability' returns reviewed cards with the lowest
+                               current retrievability first, followed by new cards;
+                               each record then also has ``current_retrievability``.
 
     Returns:
         list: A list of records that need review.
     """
-    import time
-    import sqlite3
-
-    max_retries = 5
-    retry_delay = 0.1  # 初始延迟时间（秒）
-
-    for attempt in range(max_retries):
-        conn = None
-        try:
-            conn = get_db_connection()
-            c = conn.cursor()
-
-            # 获取当前时间
-            now = int(datetime.now().timestamp() * 1000)  # 毫秒时间戳
-
-            # 获取需要复习的记录
-            c.execute(f'''
+    conn = None
+    try:
+        conn = get_read_connection()
+        c = conn.cursor()
+
+        # 获取当前时间
+        now = int(datetime.now().timestamp() * 1000)  # 毫秒时间戳
+
+        if order == 'retrievability':
+            # 已复习过的到期卡片按当前可提取性排序，新卡片排在最后。
+            # 可提取性随时间变化无法建索引，由 SQLite 计算并只保留前 limit 条
+            c.execute('''
                 SELECT sr.id, sr.word_id, sr.question, sr.state, sr.difficulty,
                        sr.stability, sr.retrievability, sr.reps, sr.lapses,
                        sr.scheduled_days, sr.next_review, sr.last_review,
-                       w.japanese, w.kana, w.chinese, w.is_kana
-                FROM srs_records_{deck_id} sr
-                JOIN words_{deck_id} w ON sr.word_id = w.id
-                WHERE sr.next_review <= ? OR sr.state = ?
-                ORDER BY sr.next_review ASC
+                       w.japanese, w.kana, w.chinese, w.is_kana,
+                       due.current_retrievability
+                FROM (
+                    SELECT id, current_retrievability FROM (
+                        SELECT id, fsrs_retrievability(stability, last_review, ?) AS current_retrievability
+                        FROM srs_records
+                        WHERE deck_id = ? AND next_review <= ? AND last_review > 0
+                        ORDER BY current_retrievability IS NULL, current_retrievability ASC
+                        LIMIT ?
+                    )
+                    UNION
+                    SELECT id, NULL FROM (
+                        SELECT id FROM srs_records
+                        WHERE deck_id = ? AND state = ?
+                        ORDER BY next_review ASC
+                        LIMIT ?
+                    )
+                ) due
+                JOIN srs_records sr ON sr.id = due.id
+                JOIN words w ON sr.word_id = w.id
+                ORDER BY due.current_retrievability IS NULL, due.current_retrievability ASC, sr.next_review ASC
                 LIMIT ?
-            ''', (now, STATES['NEW'], limit))
-
-            records = c.fetchall()
-
-            # 转换为字典列表
-            result = []
-            for record in records:
-                result.append({
-                    'id': record[0],
-                    'word_id': record[1],
-                    'question': record[2],
-                    'state': record[3],
-                    'difficulty': record[4],
-                    'stability': record[5],
-                    'retrievability': record[6],
-                    'reps': record[7],
-                    'lapses': record[8],
-                    'scheduled_days': record[9],
-                    'next_review': record[10],
-                    'last_review': record[11],
-                    'japanese': record[12],
-                    'kana': record[13],
-                    'chinese': record[14],
-                    'is_kana': record[15]
-                })
-
-            logging.info(f"Found {len(result)} FSRS records for review in deck {deck_id}")
+            ''', (now, deck_id, now, limit, deck_id, STATES['NEW'], limit, limit))
+
+            result = [
+                dict(zip(RECORD_COLUMNS + ('current_retrievability',), record))
+                for record in c.fetchall()
+            ]
+
+            logger.info("Found %d FSRS records for review in deck %s by retrievability", len(result), deck_id)
             return result
 
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                # 数据库锁定，等待一段时间后重试
-                wait_time = retry_delay * (2 ** attempt)  # 指数退避策略
-                logging.warning(f"Database is locked, retrying in {wait_time:.2f} seconds (attempt {attempt+1}/{max_retries})")
-                time.sleep(wait_time)
-            else:
-                logging.error(f"Error getting FSRS records after {attempt+1} attempts: {str(e)}")
-                return []
+        # 获取需要复习的记录
+        # 将 OR 条件拆成两个各自走索引的有序子查询，每个子查询最多取 limit 条，
+        # 合并后再排序，避免全表扫描和排序
+        c.execute('''
+            SELECT sr.id, sr.word_id, sr.question, sr.state, sr.difficulty,
+                   sr.stability, sr.retrievability, sr.reps, sr.lapses,
+                   sr.scheduled_days, sr.next_review, sr.last_review,
+                   w.japanese, w.kana, w.chinese, w.is_kana
+            FROM (
+                SELECT id FROM (
+                    SELECT id FROM srs_records
+                    WHERE deck_id = ? AND next_review <= ?
+                    ORDER BY next_review ASC
+                    LIMIT ?
+                )
+                UNION
+                SELECT id FROM (
+                    SELECT id FROM srs_records
+                    WHERE deck_id = ? AND state = ?
+                    ORDER BY next_review ASC
+                    LIMIT ?
+                )
+            ) due
+            JOIN srs_records sr ON sr.id = due.id
+            JOIN words w ON sr.word_id = w.id
+            ORDER BY sr.next_review ASC
+            LIMIT ?
+        ''', (deck_id, now, limit, deck_id, STATES['NEW'], limit, limit))
+
+        records = c.fetchall()
+
+        # 转换为字典列表
+        result = []
+        for record in records:
+            result.append({
+                'id': record[0],
+                'word_id': record[1],
+                'question': record[2],
+                'state': record[3],
+                'difficulty': record[4],
+                'stability': record[5],
+                'retrievability': record[6],
+                'reps': record[7],
+                'lapses': record[8],
+                'scheduled_days': record[9],
+                'next_review': record[10],
+                'last_review': record[11],
+                'japanese': record[12],
+                'kana': record[13],
+                'chinese': record[14],
+                'is_kana': record[15]
+            })
+
+        logger.info("Found %d FSRS records for review in deck %s", len(result), deck_id)
+        return result
+
+    except Exception as e:
+        logging.error(f"Error getting FSRS records for review: {str(e)}")
+        return []
+
+    finally:
+        if conn:
+            conn.close()
+
+def get_fsrs_records_for_review_all_decks(limit=20):
+    """
+    Get the FSRS records that need review across all decks.
+
+    Each deck contributes its first ``limit`` due records, read from the deck's
+    due indexes exactly as ``get_fsrs_records_for_review`` does; the per-deck
+    streams are merged by ``next_review`` in the same statement. The cost grows
+    with the number of decks times ``limit``, not with the size of the decks.
 
-        except Exception as e:
-            logging.error(f"Error getting FSRS records for review: {str(e)}")
-            return []
+    Args:
+        limit (int, optional): Maximum number of records to return. Defaults to 20.
 
-        finally:
-            if conn:
-                conn.close()
+    Returns:
+        list: A list of records that need review, each with its ``deck_id``.
+    """
+    conn = None
+    try:
+        conn = get_read_connection()
+        c = conn.cursor()
+
+        # 获取当前时间
+        now = int(datetime.now().timestamp() * 1000)  # 毫秒时间戳
+
+        # 对每个词单执行相关子查询，各自走 (deck_id, ...) 索引最多取 limit 条，
+        # 合并后按到期时间统一排序
+        c.execute('''
+            SELECT sr.deck_id, sr.id, sr.word_id, sr.question, sr.state, sr.difficulty,
+                   sr.stability, sr.retrievability, sr.reps, sr.lapses,
+                   sr.scheduled_days, sr.next_review, sr.last_review,
+                   w.japanese, w.kana, w.chinese, w.is_kana
+            FROM decks d
+            JOIN srs_records sr ON sr.id IN (
+                SELECT id FROM (
+                    SELECT id FROM srs_records
+                    WHERE deck_id = d.id AND next_review <= ?
+                    ORDER BY next_review ASC
+                    LIMIT ?
+                )
+                UNION
+                SELECT id FROM (
+                    SELECT id FROM srs_records
+                    WHERE deck_id = d.id AND state = ?
+                    ORDER BY next_review ASC
+                    LIMIT ?
+                )
+            )
+            JOIN words w ON sr.word_id = w.id
+            ORDER BY sr.next_review ASC, sr.id ASC
+            LIMIT ?
+        ''', (now, limit, STATES['NEW'], limit, limit))
+
+        result = [dict(zip(('deck_id',) + RECORD_COLUMNS, record)) for record in c.fetchall()]
+
+        logger.info("Found %d FSRS records for review across all decks", len(result))
+        return result
+
+    except Exception as e:
+        logging.error(f"Error getting FSRS records for review across all decks: {str(e)}")
+        return []
+
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,156 @@
+import math
+import numpy as np
+from models.fsrs import FSRS_PARAMETERS, STATES
+
+# 各评分对应的初始稳定性（困难、良好、简单）
+INITIAL_STABILITY = np.array([0.0, 0.0, 1.0, 2.0, 4.0])
+
+def stability_batch(stability, difficulty, rating, reps, parameters=FSRS_PARAMETERS):
+    """
+    Vectorized ``calculate_stability``.
+
+    Args:
+        stability (numpy.ndarray): Current stability.
+        difficulty (numpy.ndarray): Current difficulty.
+        rating (numpy.ndarray): Ratings (1-4).
+        reps (numpy.ndarray): Number of repetitions, including this review.
+        parameters (dict, optional): FSRS parameters. Defaults to ``FSRS_PARAMETERS``.
+
+    Returns:
+        numpy.ndarray: New stability.
+    """
+    w = parameters['w']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        forgot = w[0] * np.power(stability, w[1])
+
+        retrievability = np.exp(math.log(0.9) * stability)
+        difficulty_factor = np.exp(w[2] * (difficulty - 3))
+        first = reps <= 1
+
+        # 困难、良好、简单分别使用 w[3:7]、w[7:11]、w[11:15]
+        recalled = np.select(
+            [rating == 2, rating == 3, rating == 4],
+            [
+                stability * (1 + math.exp(w[base]) * np.power(retrievability, w[base + 1])
+                             * np.power(difficulty_factor, w[base + 2]) * np.where(first, 1, w[base + 3]))
+                for base in (3, 7, 11)
+            ],
+            default=stability
+        )
+
+    return np.where(rating == 1, forgot, recalled)
+
+def difficulty_batch(difficulty, rating, parameters=FSRS_PARAMETERS):
+    """
+    Vectorized ``calculate_difficulty``.
+
+    Args:
+        difficulty (numpy.ndarray): Current difficulty.
+        rating (numpy.ndarray): Ratings (1-4).
+        parameters (dict, optional): FSRS parameters. Defaults to ``FSRS_PARAMETERS``.
+
+    Returns:
+        numpy.ndarray: New difficulty.
+    """
+    w = parameters['w']
+
+    # 评分 1-4 对应的难度变化量
+    delta = np.array([0.0, w[15], w[15] / 2, 0.0, -w[16]])
+    valid = (rating >= 1) & (rating <= 4)
+
+    new_difficulty = np.clip(difficulty + delta[np.where(valid, rating, 0)], 1, 5)
+    return np.where(valid, new_difficulty, difficulty)
+
+def interval_batch(stability, parameters=FSRS_PARAMETERS):
+    """
+    Vectorized ``calculate_interval``.
+
+    Args:
+        stability (numpy.ndarray): Stability.
+        parameters (dict, optional): FSRS parameters. Defaults to ``FSRS_PARAMETERS``.
+
+    Returns:
+        numpy.ndarray: Intervals in days, as int64.
+    """
+    request_retention = parameters['request_retention']
+    maximum_interval = parameters['maximum_interval']
+
+    # 与标量版本保持相同的运算顺序，保证结果一致
+    interval = np.ceil(stability * math.log(request_retention) / math.log(0.9))
+    return np.clip(interval, 1, maximum_interval).astype(np.int64)
+
+def review_batch(state, difficulty, stability, reps, lapses, scheduled_days, rating, parameters=FSRS_PARAMETERS):
+    """
+    Apply one review to many cards at once.
+
+    Gives the same results as ``review_fsrs_record`` does card by card.
+
+    Args:
+        state (numpy.ndarray): FSRS states.
+        difficulty (numpy.ndarray): Difficulty.
+        stability (numpy.ndarray): Stability.
+        reps (numpy.ndarray): Number of repetitions.
+        lapses (numpy.ndarray): Number of lapses.
+        scheduled_days (numpy.ndarray): Current intervals in days.
+        rating (numpy.ndarray): Ratings (1-4).
+        parameters (dict, optional): FSRS parameters. Defaults to ``FSRS_PARAMETERS``.
+
+    Returns:
+        dict: New ``state``, ``difficulty``, ``stability``, ``retrievability``,
+              ``reps``, ``lapses`` and ``scheduled_days`` arrays.
+    """
+    state = np.asarray(state, dtype=np.int64)
+    difficulty = np.asarray(difficulty, dtype=np.float64)
+    stability = np.asarray(stability, dtype=np.float64)
+    reps = np.asarray(reps, dtype=np.int64) + 1
+    lapses = np.asarray(lapses, dtype=np.int64)
+    scheduled_days = np.asarray(scheduled_days, dtype=np.int64)
+    rating = np.asarray(rating, dtype=np.int64)
+
+    forgot = rating == 1
+    is_new = state == STATES['NEW']
+    is_learning = (state == STATES['LEARNING']) | (state == STATES['RELEARNING'])
+    is_review = state == STATES['REVIEW']
+
+    new_difficulty = difficulty_batch(difficulty, rating, parameters)
+    initial_stability = INITIAL_STABILITY[np.clip(rating, 0, 4)]
+    review_stability = stability_batch(stability, difficulty, rating, reps, parameters)
+
+    # 新卡片或学习中的卡片记住后进入复习状态
+    graduated = (is_new | is_learning) & ~forgot
+    new_forgot = is_new & forgot
+    lapsed = is_review & forgot
+
+    out_state = np.select(
+        [new_forgot, graduated, lapsed],
+        [STATES['LEARNING'], STATES['REVIEW'], STATES['RELEARNING']],
+        default=state
+    )
+
+    out_stability = np.select(
+        [new_forgot, graduated, is_review],
+        [0.0, initial_stability, review_stability],
+        default=stability
+    )
+
+    # 学习中的卡片忘记时难度不变
+    out_difficulty = np.where(new_forgot | graduated | is_review, new_difficulty, difficulty)
+
+    out_lapses = lapses + lapsed
+
+    out_scheduled_days = np.select(
+        [new_forgot | lapsed | (is_learning & forgot), graduated | is_review],
+        [0, interval_batch(out_stability, parameters)],
+        default=scheduled_days
+    )
+
+    return {
+        'state': out_state,
+        'difficulty': out_difficulty,
+        'stability': out_stability,
+        'retrievability': np.exp(math.log(0.9) * out_stability),
+        'reps': reps,
+        'lapses': out_lapses,
+        'scheduled_days': out_scheduled_days
+    }
@@ -0,0 +1,286 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+import numpy as np
+from db import get_read_connection
+from models.fsrs import FSRS_PARAMETERS, STATES, get_fsrs_parameters
+from models.fsrs_kernel import review_batch
+from utils.process_utils import get_process_context
+
+# 复习日志中用于拟合的列
+LOG_COLUMNS = (
+    'deck_id', 'record_id', 'rating', 'elapsed_days', 'state_before',
+    'difficulty_before', 'stability_before', 'reps_before', 'lapses_before'
+)
+
+# 权重的取值范围
+WEIGHT_BOUNDS = (0.001, 10.0)
+
+# 有限差分的相对步长
+GRADIENT_STEP = 1e-3
+
+# 预测概率的截断范围，避免 log(0)
+PROBABILITY_EPS = 1e-6
+
+# 工作进程中的数据分片，由 _init_worker 设置
+_shards = None
+
+def load_review_history(deck_id=None):
+    """
+    Load the review log, ordered by card and time.
+
+    Args:
+        deck_id (int, optional): Only load the reviews of this deck. Defaults to all decks.
+
+    Returns:
+        dict: One array per column of ``LOG_COLUMNS``.
+    """
+    conn = get_read_connection()
+    try:
+        c = conn.cursor()
+        c.row_factory = None  # 直接返回元组，读取大量记录时更快
+
+        query = f'''
+            SELECT {', '.join(LOG_COLUMNS)} FROM review_log
+            {'WHERE deck_id = ?' if deck_id is not None else ''}
+            ORDER BY deck_id, record_id, reviewed_at, id
+        '''
+        c.execute(query, (deck_id,) if deck_id is not None else ())
+        rows = c.fetchall()
+    finally:
+        conn.close()
+
+    values = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * len(LOG_COLUMNS))
+    columns = values.reshape(-1, len(LOG_COLUMNS)).T
+    return {name: columns[i] for i, name in enumerate(LOG_COLUMNS)}
+
+def build_shards(log, count):
+    """
+    Split the review log into shards of whole cards and group each shard by step.
+
+    Replaying a card's reviews is sequential, but the n-th reviews of all
+    cards are independent, so each step is applied to all cards at once.
+
+    Args:
+        log (dict): The review log, as returned by ``load_review_history``.
+        count (int): The number of shards.
+
+    Returns:
+        list: Shards as dictionaries with the initial card state and, per step,
+              the row and card indices of the reviews.
+    """
+    n = len(log['rating'])
+    if n == 0:
+        return []
+
+    # 为每张卡片编号，日志已按卡片和时间排序
+    new_card = np.ones(n, dtype=bool)
+    new_card[1:] = (log['deck_id'][1:] != log['deck_id'][:-1]) | (log['record_id'][1:] != log['record_id'][:-1])
+    card = np.cumsum(new_card) - 1
+    starts = np.flatnonzero(new_card)
+    step = np.arange(n) - starts[card]
+    card_count = len(starts)
+
+    shards = []
+    for cards in np.array_split(np.arange(card_count), min(count, card_count)):
+        first, last = starts[cards[0]], (starts[cards[-1] + 1] if cards[-1] + 1 < card_count else n)
+        rows = np.arange(first, last)
+        shard_step = step[rows]
+        order = np.argsort(shard_step, kind='stable')
+        bounds = np.searchsorted(shard_step[order], np.arange(shard_step.max() + 2))
+
+        # 每张卡片从第一条日志记录之前的状态开始重放
+        initial = starts[cards]
+        shards.append({
+            'rating': log['rating'][rows].astype(np.int64),
+            'elapsed_days': log['elapsed_days'][rows],
+            'card': card[rows] - cards[0],
+            'steps': [order[bounds[k]:bounds[k + 1]] for k in range(len(bounds) - 1) if bounds[k] < bounds[k + 1]],
+            'state': log['state_before'][initial].astype(np.int64),
+            'difficulty': log['difficulty_before'][initial],
+            'stability': log['stability_before'][initial],
+            'reps': log['reps_before'][initial].astype(np.int64),
+            'lapses': log['lapses_before'][initial].astype(np.int64)
+        })
+
+    return shards
+
+def shard_loss(shard, parameters):
+    """
+    Replay a shard with the given parameters and score the recall predictions.
+
+    Before each review of a card in the review state, the recall probability
+    is predicted as ``0.9 ** (elapsed_days / stability)``; the review counts as
+    recalled unless it was rated 1.
+
+    Args:
+        shard (dict): A shard built by ``build_shards``.
+        parameters (dict): FSRS parameters.
+
+    Returns:
+        tuple: The summed log loss and the number of scored reviews.
+    """
+    state = shard['state'].copy()
+    difficulty = shard['difficulty'].copy()
+    stability = shard['stability'].copy()
+    reps = shard['reps'].copy()
+    lapses = shard['lapses'].copy()
+    scheduled_days = np.zeros_like(reps)
+
+    total = 0.0
+    scored = 0
+
+    for rows in shard['steps']:
+        cards = shard['card'][rows]
+        rating = shard['rating'][rows]
+
+        card_state = state[cards]
+        card_stability = stability[cards]
+
+        # 只对复习状态的卡片计算预测
+        scored_mask = (card_state == STATES['REVIEW']) & (card_stability > 0)
+        if scored_mask.any():
+            elapsed = shard['elapsed_days'][rows][scored_mask]
+            probability = np.power(0.9, elapsed / card_stability[scored_mask])
+            probability = np.clip(probability, PROBABILITY_EPS, 1 - PROBABILITY_EPS)
+            recalled = rating[scored_mask] > 1
+            total -= np.where(recalled, np.log(probability), np.log1p(-probability)).sum()
+            scored += int(scored_mask.sum())
+
+        result = review_batch(
+            card_state, difficulty[cards], card_stability, reps[cards],
+            lapses[cards], scheduled_days[cards], rating, parameters
+        )
+        state[cards] = result['state']
+        difficulty[cards] = result['difficulty']
+        stability[cards] = result['stability']
+        reps[cards] = result['reps']
+        lapses[cards] = result['lapses']
+        scheduled_days[cards] = result['scheduled_days']
+
+    return total, scored
+
+def _init_worker(shards):
+    global _shards
+    _shards = shards
+
+def _shard_losses(index, parameter_sets):
+    """
+    Worker task: evaluate several parameter sets on one shard.
+
+    Args:
+        index (int): The shard index.
+        parameter_sets (list): FSRS parameter dictionaries.
+
+    Returns:
+        list: ``(total, scored)`` per parameter set.
+    """
+    return [shard_loss(_shards[index], parameters) for parameters in parameter_sets]
+
+def optimize_fsrs_parameters(deck_id=None, iterations=50, learning_rate=0.02, workers=None):
+    """
+    Fit the FSRS weights to the review log.
+
+    Minimizes the log loss of the recall predictions with Adam. Gradients are
+    estimated by forward differences: each iteration evaluates the current
+    weights and one perturbation per weight, all replayed with the vectorized
+    kernel. The log is split into shards of whole cards, and every worker
+    process evaluates all parameter sets on its shard.
+
+    Args:
+        deck_id (int, optional): Fit on the reviews of this deck. Defaults to all decks.
+        iterations (int, optional): Number of gradient steps. Defaults to 50.
+        learning_rate (float, optional): Adam step size. Defaults to 0.02.
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+
+    Returns:
+        dict or None: The fitted ``w``, the initial and final loss, the number of
+                      scored reviews and of log rows; None if there is nothing to fit.
+    """
+    log = load_review_history(deck_id)
+    row_count = len(log['rating'])
+    if row_count == 0:
+        logging.warning(f"No reviews to fit FSRS parameters on{f' in deck {deck_id}' if deck_id else ''}")
+        return None
+
+    conn = get_read_connection()
+    try:
+        base = get_fsrs_parameters(conn.cursor(), deck_id)
+    finally:
+        conn.close()
+
+    workers = max(1, workers or os.cpu_count() or 1)
+    shards = build_shards(log, workers)
+    log = None
+
+    def with_weights(w):
+        return dict(base, w=w.tolist())
+
+    executor = ProcessPoolExecutor(
+        max_workers=len(shards), mp_context=get_process_context(), initializer=_init_worker, initargs=(shards,)
+    ) if len(shards) > 1 else None
+    if executor is None:
+        _init_worker(shards)
+
+    def evaluate(weight_sets):
+        parameter_sets = [with_weights(w) for w in weight_sets]
+        if executor is None:
+            parts = [_shard_losses(0, parameter_sets)]
+        else:
+            parts = list(executor.map(_shard_losses, range(len(shards)), [parameter_sets] * len(shards)))
+
+        totals = np.array([[total for total, _ in part] for part in parts]).sum(axis=0)
+        scored = np.array([[count for _, count in part] for part in parts]).sum(axis=0)
+        return totals / np.maximum(scored, 1), int(scored[0])
+
+    try:
+        w = np.array(base['w'], dtype=np.float64)
+        m = np.zeros_like(w)
+        v = np.zeros_like(w)
+        beta1, beta2 = 0.9, 0.999
+
+        (initial_loss,), scored = evaluate([w])
+        if scored == 0:
+            logging.warning("No reviews in the review state to fit FSRS parameters on")
+            return None
+
+        loss = initial_loss
+        logging.info(f"Fitting FSRS parameters on {scored} reviews ({row_count} log rows), initial loss {loss:.5f}")
+
+        for iteration in range(1, iterations + 1):
+            steps = GRADIENT_STEP * np.maximum(np.abs(w), 0.1)
+            perturbed = [w] + [w + np.eye(len(w))[i] * steps[i] for i in range(len(w))]
+            losses, _ = evaluate(perturbed)
+
+            loss = losses[0]
+            gradient = (losses[1:] - loss) / steps
+
+            # Adam 更新，并把权重限制在合理范围内
+            m = beta1 * m + (1 - beta1) * gradient
+            v = beta2 * v + (1 - beta2) * gradient ** 2
+            m_hat = m / (1 - beta1 ** iteration)
+            v_hat = v / (1 - beta2 ** iteration)
+            w = np.clip(w - learning_rate * m_hat / (np.sqrt(v_hat) + 1e-8), *WEIGHT_BOUNDS)
+
+            logging.debug(f"FSRS fit iteration {iteration}: loss {loss:.5f}")
+
+        (final_loss,), _ = evaluate([w])
+        logging.info(f"Fitted FSRS parameters: loss {initial_loss:.5f} -> {final_loss:.5f}")
+
+        # 拟合没有改善时保留原参数
+        if final_loss > initial_loss:
+            w, final_loss = np.array(base['w'], dtype=np.float64), initial_loss
+
+        return {
+            'w': w.tolist(),
+            'initial_loss': float(initial_loss),
+            'loss': float(final_loss),
+            'review_count': scored,
+            'row_count': row_count,
+            'request_retention': base.get('request_retention', FSRS_PARAMETERS['request_retention']),
+            'maximum_interval': base.get('maximum_interval', FSRS_PARAMETERS['maximum_interval'])
+        }
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -0,0 +1,307 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import chain
+import numpy as np
+from db import get_read_connection
+from db.stats import DAY_MS
+from models.fsrs import STATES, get_fsrs_parameters
+from models.fsrs_kernel import review_batch
+from utils.process_utils import get_process_context
+
+# 默认比较的目标记忆保持率
+RETENTION_GRID = tuple(round(0.70 + 0.02 * i, 2) for i in range(14))
+
+# 记住时评分为困难、良好、简单的默认比例，复习日志为空时使用
+DEFAULT_RECALL_RATINGS = (0.2, 0.7, 0.1)
+
+# 新卡片和学习中的卡片答对的概率
+LEARNING_RECALL = 0.9
+
+# 模拟时抽样的最大卡片数
+MAX_SIMULATED_CARDS = 500
+
+# 模拟读取的记录列
+SIMULATION_COLUMNS = ('state', 'difficulty', 'stability', 'reps', 'lapses', 'scheduled_days', 'next_review', 'last_review')
+
+# 后台模拟任务共用的进程数
+SIMULATION_WORKERS = min(os.cpu_count() or 1, len(RETENTION_GRID))
+
+_simulation_pool = None
+_simulation_pool_lock = threading.Lock()
+
+def get_simulation_pool():
+    """
+    Get the process pool shared by background simulation jobs, creating it on first use.
+
+    Workers are not forked from the multithreaded server process, see
+    ``utils.process_utils.get_process_context``.
+
+    Returns:
+        ProcessPoolExecutor: The simulation pool.
+    """
+    global _simulation_pool
+    if _simulation_pool is None:
+        with _simulation_pool_lock:
+            if _simulation_pool is None:
+                _simulation_pool = ProcessPoolExecutor(max_workers=SIMULATION_WORKERS, mp_context=get_process_context())
+    return _simulation_pool
+
+def load_simulation_deck(deck_id, max_cards=MAX_SIMULATED_CARDS, new_per_day=20, seed=0, now=None):
+    """
+    Sample the cards of a deck as the starting point of a simulation.
+
+    Cards keep their current FSRS state. New cards are introduced in ID order,
+    ``new_per_day`` per day, so a sampled new card starts on the day it would
+    be reached in the full deck.
+
+    Args:
+        deck_id (int): The ID of the deck.
+        max_cards (int, optional): Maximum number of cards to sample.
+        new_per_day (int, optional): Number of new cards learned per day.
+        seed (int, optional): Seed of the card sample.
+        now (int, optional): The current time as a millisecond timestamp.
+
+    Returns:
+        dict or None: One array per column of ``SIMULATION_COLUMNS``, the
+                      ``due_day`` and ``last_day`` of each sampled card (days
+                      relative to today), the ``scale`` from the sample to the
+                      deck, the deck size and the ``rating_probs`` of recalled
+                      reviews; None if the deck has no cards.
+    """
+    if now is None:
+        now = int(datetime.now().timestamp() * 1000)
+
+    conn = get_read_connection()
+    try:
+        c = conn.cursor()
+        c.row_factory = None  # 直接返回元组，读取大量记录时更快
+
+        c.execute(f'SELECT {", ".join(SIMULATION_COLUMNS)} FROM srs_records WHERE deck_id = ? ORDER BY id', (deck_id,))
+        rows = c.fetchall()
+
+        # 根据复习日志估计记住时各评分的比例
+        c.execute('SELECT rating, COUNT(*) FROM review_log WHERE deck_id = ? AND rating > 1 GROUP BY rating', (deck_id,))
+        rating_counts = dict(c.fetchall())
+    finally:
+        conn.close()
+
+    total = len(rows)
+    if total == 0:
+        return None
+
+    values = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=total * len(SIMULATION_COLUMNS))
+    columns = dict(zip(SIMULATION_COLUMNS, values.reshape(-1, len(SIMULATION_COLUMNS)).T))
+    rows = None
+
+    is_new = columns['state'] == STATES['NEW']
+    new_rank = np.cumsum(is_new) - 1
+
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(total, size=min(total, max_cards), replace=False))
+
+    deck = {name: column[sample] for name, column in columns.items()}
+    for name in ('state', 'reps', 'lapses', 'scheduled_days'):
+        deck[name] = deck[name].astype(np.int64)
+
+    sampled_new = is_new[sample]
+    due_day = np.maximum(np.ceil((deck['next_review'] - now) / DAY_MS), 0)
+    # 每天不学新卡片时，新卡片不会进入模拟
+    intro_day = new_rank[sample] // new_per_day if new_per_day > 0 else np.inf
+    deck['due_day'] = np.where(sampled_new, intro_day, due_day)
+    deck['last_day'] = np.where(deck['last_review'] > 0, (deck['last_review'] - now) / DAY_MS, np.nan)
+    deck['scale'] = total / len(sample)
+    deck['cards'] = total
+
+    recalled = sum(rating_counts.get(rating, 0) for rating in (2, 3, 4))
+    deck['rating_probs'] = (
+        tuple(rating_counts.get(rating, 0) / recalled for rating in (2, 3, 4)) if recalled else DEFAULT_RECALL_RATINGS
+    )
+    return deck
+
+def simulate_retention(deck, parameters, request_retention, learners=200, days=365, seed=0):
+    """
+    Simulate virtual learners reviewing a deck with one target retention.
+
+    Every learner starts from the same sampled cards. Each day, all due cards
+    are reviewed at once with the vectorized FSRS kernel. A card in the review
+    state is recalled with probability ``0.9 ** (elapsed_days / stability)``,
+    other cards with ``LEARNING_RECALL``; recalled cards are rated 2-4 in the
+    deck's observed proportions.
+
+    Args:
+        deck (dict): The sampled deck, as returned by ``load_simulation_deck``.
+        parameters (dict): FSRS parameters.
+        request_retention (float): The target retention to schedule with.
+        learners (int, optional): Number of virtual learners.
+        days (int, optional): Number of days to simulate.
+        seed (int, optional): Seed of the simulated answers.
+
+    Returns:
+        dict: The average daily review load, the expected number of memorized
+              cards and the average retention at the end, the memorized cards
+              per review, and the ``daily_reviews`` curve, scaled to the deck.
+    """
+    parameters = dict(parameters, request_retention=request_retention)
+    rng = np.random.default_rng(seed)
+
+    def tiled(name):
+        return np.tile(deck[name], learners)
+
+    state = tiled('state')
+    difficulty = tiled('difficulty')
+    stability = tiled('stability')
+    reps = tiled('reps')
+    lapses = tiled('lapses')
+    scheduled_days = tiled('scheduled_days')
+    due_day = tiled('due_day')
+    last_day = tiled('last_day')
+
+    scale = deck['scale'] / learners
+    daily_reviews = np.zeros(days)
+
+    for day in range(days):
+        cards = np.flatnonzero(due_day <= day)
+        if cards.size == 0:
+            continue
+
+        card_state = state[cards]
+        card_stability = stability[cards]
+
+        # 复习状态的卡片按遗忘曲线计算答对概率
+        in_review = (card_state == STATES['REVIEW']) & (card_stability > 0)
+        elapsed = day - last_day[cards]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            probability = np.where(in_review, np.power(0.9, elapsed / np.where(in_review, card_stability, 1)), LEARNING_RECALL)
+
+        recalled = rng.random(cards.size) < probability
+        rating = np.where(recalled, rng.choice((2, 3, 4), size=cards.size, p=deck['rating_probs']), 1)
+
+        result = review_batch(
+            card_state, difficulty[cards], card_stability, reps[cards],
+            lapses[cards], scheduled_days[cards], rating, parameters
+        )
+        state[cards] = result['state']
+        difficulty[cards] = result['difficulty']
+        stability[cards] = result['stability']
+        reps[cards] = result['reps']
+        lapses[cards] = result['lapses']
+        scheduled_days[cards] = result['scheduled_days']
+
+        # 立即复习的卡片安排到第二天
+        last_day[cards] = day
+        due_day[cards] = day + np.maximum(result['scheduled_days'], 1)
+        daily_reviews[day] = cards.size
+
+    # 模拟结束时每张学过的卡片的可提取性
+    learned = ~np.isnan(last_day) & (stability > 0)
+    recall = np.zeros_like(stability)
+    recall[learned] = np.power(0.9, (days - last_day[learned]) / stability[learned])
+    started = ~np.isnan(last_day)
+
+    total_reviews = daily_reviews.sum() * scale
+    memorized = recall.sum() * scale
+    return {
+        'request_retention': request_retention,
+        'reviews_per_day': float(total_reviews / days),
+        'memorized': float(memorized),
+        'retention': float(recall[started].mean()) if started.any() else 0.0,
+        'memorized_per_review': float(memorized / total_reviews) if total_reviews else 0.0,
+        'daily_reviews': np.round(daily_reviews * scale, 2).tolist()
+    }
+
+def _simulate_task(args):
+    return simulate_retention(*args)
+
+def _map_tasks(executor, tasks, job):
+    futures = [executor.submit(_simulate_task, task) for task in tasks]
+    try:
+        results = []
+        for future in futures:
+            results.append(future.result())
+            if job is not None:
+                job.add_simulated(1)
+                if job.cancelled:
+                    return None
+        return results
+    finally:
+        # 取消或出错时放弃尚未开始的模拟
+        for future in futures:
+            future.cancel()
+
+def simulate_retentions(deck_id, retentions=RETENTION_GRID, learners=200, days=365, new_per_day=20,
+                        max_cards=MAX_SIMULATED_CARDS, workers=None, seed=0,
+                        parameters=None, executor=None, job=None):
+    """
+    Compare target retentions on a deck and pick the most efficient one.
+
+    Each retention is simulated in a worker process with the same seed, so all
+    retentions see the same random answers. The optimal retention is the one
+    that keeps the most cards memorized per review.
+
+    Args:
+        deck_id (int): The ID of the deck.
+        retentions (iterable, optional): Target retentions to compare. Defaults to ``RETENTION_GRID``.
+        learners (int, optional): Number of virtual learners. Defaults to 200.
+        days (int, optional): Number of days to simulate. Defaults to 365.
+        new_per_day (int, optional): Number of new cards learned per day. Defaults to 20.
+        max_cards (int, optional): Maximum number of cards to sample. Defaults to ``MAX_SIMULATED_CARDS``.
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        seed (int, optional): Random seed. Defaults to 0.
+        parameters (dict, optional): FSRS parameters. Defaults to those in effect for the deck.
+        executor (ProcessPoolExecutor, optional): A pool to run the simulations in
+                                                  instead of starting ``workers`` processes.
+        job (RetentionJob, optional): A background simulation job to report progress
+                                      to. If it is cancelled, the simulation stops
+                                      after the current retention.
+
+    Returns:
+        dict or None: The simulation settings, one result per retention (see
+                      ``simulate_retention``) and the ``optimal_retention``;
+                      None if the deck has no cards or the job was cancelled.
+    """
+    deck = load_simulation_deck(deck_id, max_cards, new_per_day, seed)
+    if deck is None:
+        logging.warning(f"No cards to simulate in deck {deck_id}")
+        return None
+
+    if parameters is None:
+        conn = get_read_connection()
+        try:
+            parameters = get_fsrs_parameters(conn.cursor(), deck_id)
+        finally:
+            conn.close()
+
+    retentions = sorted(float(retention) for retention in retentions)
+    tasks = [(deck, parameters, retention, learners, days, seed) for retention in retentions]
+
+    if executor is not None:
+        logging.info(f"Simulating {len(tasks)} target retentions on deck {deck_id}")
+        results = _map_tasks(executor, tasks, job)
+    else:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+        logging.info(f"Simulating {len(tasks)} target retentions on deck {deck_id} with {workers} workers")
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=get_process_context()) as executor:
+                results = _map_tasks(executor, tasks, job)
+        else:
+            results = [_simulate_task(task) for task in tasks]
+
+    if results is None:
+        logging.info(f"Simulation of deck {deck_id} cancelled")
+        return None
+
+    optimal = max(results, key=lambda result: result['memorized_per_review'])
+    return {
+        'deck_id': deck_id,
+        'cards': deck['cards'],
+        'sampled_cards': len(deck['state']),
+        'learners': learners,
+        'days': days,
+        'new_per_day': new_per_day,
+        'current_retention': parameters['request_retention'],
+        'optimal_retention': optimal['request_retention'],
+        'results': results
+    }
@@ -0,0 +1,268 @@
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from db import execute_write, get_read_connection, submit_write
+from models.importer import import_word_files, summarize_import
+from utils.upload_utils import close_files
+
+# 同时运行的导入任务数
+IMPORT_JOB_WORKERS = 2
+
+# 排队和运行中的导入任务数上限
+MAX_ACTIVE_JOBS = 16
+
+# 后台导入每个事务的单词数，较小的事务让复习请求的写入不必久等
+JOB_CHUNK_SIZE = 5000
+
+# 已结束的任务保留时间（毫秒）
+JOB_RETENTION_MS = 7 * 24 * 60 * 60 * 1000
+
+# 已结束的任务状态
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+
+_executor = None
+_executor_lock = threading.Lock()
+_active_jobs = threading.BoundedSemaphore(MAX_ACTIVE_JOBS)
+
+def _now():
+    return int(datetime.now().timestamp() * 1000)
+
+class ImportJob:
+    """
+    Progress reporting and cancellation for a running import job.
+
+    Passed to ``import_word_files`` and ``import_word_rows``, which call
+    ``add_parsed`` / ``add_inserted`` as work completes and stop at the next
+    chunk once ``cancelled`` is True.
+    """
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self._cancelled = False
+
+    def _increment(self, assignments, params):
+        def increment(c):
+            c.execute(f'''
+                UPDATE import_jobs SET {assignments}, updated_at = ?
+                WHERE id = ?
+            ''', (*params, _now(), self.id))
+
+        # 进度更新不必等待提交，与后续写入一起提交
+        submit_write(increment)
+
+    def add_parsed(self, rows, errors):
+        """
+        Record parsed rows.
+
+        Args:
+            rows (int): Number of rows parsed.
+            errors (int): Number of invalid rows.
+        """
+        self._increment('rows_parsed = rows_parsed + ?, error_count = error_count + ?', (rows, errors))
+
+    def add_inserted(self, rows):
+        """
+        Record words committed to the database. Duplicate rows skipped by the
+        unique indexes are not counted.
+
+        Args:
+            rows (int): Number of words inserted.
+        """
+        self._increment('rows_inserted = rows_inserted + ?', (rows,))
+
+    @property
+    def cancelled(self):
+        """
+        bool: Whether cancellation of the job has been requested.
+        """
+        if not self._cancelled:
+            conn = get_read_connection()
+            try:
+                row = conn.execute('SELECT cancel_requested FROM import_jobs WHERE id = ?', (self.id,)).fetchone()
+                self._cancelled = bool(row and row[0])
+            finally:
+                conn.close()
+        return self._cancelled
+
+def get_job_executor():
+    """
+    Get the bounded thread pool that runs import jobs, creating it on first use.
+
+    Returns:
+        ThreadPoolExecutor: The import job executor.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=IMPORT_JOB_WORKERS, thread_name_prefix='import-job')
+    return _executor
+
+def submit_import_job(files):
+    """
+    Queue an import of uploaded files as a background job.
+
+    Args:
+        files (list): ``(filename, file)`` pairs of the uploaded files buffered by
+                      ``spool_upload``. The job takes ownership of the files and
+                      closes them when it finishes, or right away if it is rejected.
+
+    Returns:
+        str or None: The job ID, or None if too many jobs are already active.
+    """
+    if not _active_jobs.acquire(blocking=False):
+        logging.warning("Too many active import jobs, rejecting new job")
+        close_files(f for _, f in files)
+        return None
+
+    job_id = uuid.uuid4().hex
+    now = _now()
+
+    def insert(c):
+        # 清理过期的已结束任务
+        c.execute(f'''
+            DELETE FROM import_jobs
+            WHERE status IN ({', '.join('?' * len(FINISHED_STATUSES))}) AND updated_at < ?
+        ''', (*FINISHED_STATUSES, now - JOB_RETENTION_MS))
+
+        c.execute('''
+            INSERT INTO import_jobs (id, status, files, created_at, updated_at)
+            VALUES (?, 'queued', ?, ?, ?)
+        ''', (job_id, json.dumps([filename for filename, _ in files], ensure_ascii=False), now, now))
+
+    try:
+        execute_write(insert)
+    except Exception:
+        _active_jobs.release()
+        close_files(f for _, f in files)
+        raise
+
+    get_job_executor().submit(_run_import_job, job_id, files)
+    logging.info(f"Queued import job {job_id} with {len(files)} files")
+    return job_id
+
+def _finish_job(job_id, status, result):
+    def finish(c):
+        c.execute('''
+            UPDATE import_jobs SET status = ?, result = ?, updated_at = ?
+            WHERE id = ?
+        ''', (status, json.dumps(result, ensure_ascii=False), _now(), job_id))
+
+    execute_write(finish)
+
+def _run_import_job(job_id, files):
+    """
+    Run an import job on the job executor.
+
+    Args:
+        job_id (str): The job ID.
+        files (list): ``(filename, file)`` pairs of buffered uploads, closed when the job ends.
+    """
+    try:
+        def start(c):
+            c.execute('''
+                UPDATE import_jobs SET status = 'running', updated_at = ?
+                WHERE id = ? AND status = 'queued'
+            ''', (_now(), job_id))
+            return c.rowcount == 1
+
+        started = execute_write(start)
+
+        if not started:
+            # 任务在开始前已被取消
+            logging.info(f"Import job {job_id} was cancelled before it started")
+            return
+
+        job = ImportJob(job_id)
+        results = import_word_files(files, job, JOB_CHUNK_SIZE)
+
+        result = summarize_import(results)
+        if job.cancelled:
+            status = 'cancelled'
+        elif 'error' in result:
+            status = 'failed'
+        else:
+            status = 'done'
+
+        _finish_job(job_id, status, result)
+        logging.info(f"Import job {job_id} finished with status {status}")
+
+    except Exception as e:
+        logging.error(f"Error running import job {job_id}: {str(e)}")
+        _finish_job(job_id, 'failed', {'error': f'导入词单时发生错误: {str(e)}'})
+
+    finally:
+        close_files(f for _, f in files)
+        _active_jobs.release()
+
+def get_import_job(job_id):
+    """
+    Get the state of an import job.
+
+    Args:
+        job_id (str): The job ID.
+
+    Returns:
+        dict or None: The job status, file names, progress counters and, once
+                      finished, the import result. None if the job does not exist.
+    """
+    conn = get_read_connection()
+    try:
+        row = conn.execute('''
+            SELECT id, status, files, rows_parsed, rows_inserted, error_count,
+                   result, cancel_requested, created_at, updated_at
+            FROM import_jobs WHERE id = ?
+        ''', (job_id,)).fetchone()
+    finally:
+        conn.close()
+
+    if not row:
+        return None
+
+    return {
+        'job_id': row['id'],
+        'status': row['status'],
+        'files': json.loads(row['files']),
+        'rows_parsed': row['rows_parsed'],
+        'rows_inserted': row['rows_inserted'],
+        'error_count': row['error_count'],
+        'result': json.loads(row['result']) if row['result'] else None,
+        'cancel_requested': bool(row['cancel_requested']),
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at']
+    }
+
+def cancel_import_job(job_id):
+    """
+    Request cancellation of an import job.
+
+    A queued job is cancelled immediately. A running job stops before its next
+    insert chunk; words already committed stay in their decks.
+
+    Args:
+        job_id (str): The job ID.
+
+    Returns:
+        bool: True if the job exists and had not finished yet.
+    """
+    def cancel(c):
+        c.execute('''
+            UPDATE import_jobs SET cancel_requested = 1, updated_at = ?
+            WHERE id = ? AND status IN ('queued', 'running')
+        ''', (_now(), job_id))
+        found = c.rowcount == 1
+
+        c.execute('''
+            UPDATE import_jobs SET status = 'cancelled', result = ?
+            WHERE id = ? AND status = 'queued'
+        ''', (json.dumps({'error': '导入已取消'}, ensure_ascii=False), job_id))
+        return found
+
+    found = execute_write(cancel)
+
+    if found:
+        logging.info(f"Cancellation requested for import job {job_id}")
+    return found
@@ -0,0 +1,229 @@
+import logging
+import os
+import threading
+from collections import deque
+from itertools import chain
+from models.deck import add_deck
+from models.word import IMPORT_CHUNK_SIZE, import_word_rows
+from utils.file_utils import WordFileParser, iter_file_chunks, parse_word_batch
+from utils.process_utils import get_process_context
+
+# 解析单词文件的进程数
+PARSE_WORKERS = min(os.cpu_count() or 1, 8)
+
+# 已提交解析但尚未写入数据库的批次数上限，用于限制内存中的解析结果
+MAX_PENDING_BATCHES = PARSE_WORKERS * 2
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+def get_parse_pool():
+    """
+    Get the process pool used to parse word files, creating it on first use.
+
+    Workers are not forked from the multithreaded server process, see
+    ``utils.process_utils.get_process_context``.
+
+    Returns:
+        ProcessPoolExecutor: The parse pool.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        # 首次导入时才加载 multiprocessing，不拖慢服务启动
+        from concurrent.futures import ProcessPoolExecutor
+
+        with _parse_pool_lock:
+            if _parse_pool is None:
+                _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=get_process_context())
+    return _parse_pool
+
+def import_word_files(files, job=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import word files into decks, one deck per file.
+
+    Files are imported one after another. Each file is split into batches of
+    records that are parsed in parallel in a process pool, while the calling
+    thread inserts the parsed rows in order through the database writer. At
+    most ``MAX_PENDING_BATCHES`` batches are in flight, so memory use does not
+    grow with the file size and nothing is written to temporary files.
+
+    Args:
+        files (iterable): ``(filename, file)`` pairs of the word list files, opened in binary mode.
+        job (ImportJob, optional): A background import job to report progress to
+                                   and to check for cancellation.
+        chunk_size (int, optional): Number of rows per insert transaction.
+
+    Returns:
+        list: One result dictionary per file, in upload order, with the file name,
+              deck ID, number of words inserted (duplicate rows are skipped),
+              parse errors and an error message if the import failed.
+    """
+    results = []
+    for filename, f in files:
+        if not filename:
+            continue
+
+        result = {
+            'file': filename,
+            'deck_id': None,
+            'words': 0,
+            'error': None,
+            'parse_errors': [],
+            'error_count': 0
+        }
+        results.append(result)
+
+        if job is not None and job.cancelled:
+            result['error'] = '已取消'
+            continue
+
+        try:
+            _import_word_file(result, iter_file_chunks(f), job, chunk_size)
+        except Exception as e:
+            logging.error(f"Error importing file {filename}: {str(e)}")
+            result['error'] = f'导入错误: {str(e)}'
+
+    return results
+
+def _iter_parsed_rows(parser, chunks, job):
+    """
+    Parse a word file in the process pool and yield its rows in file order.
+
+    Args:
+        parser (WordFileParser): Splits the file and collects row counts and errors.
+        chunks (iterable): The file content as byte chunks.
+        job (ImportJob): The background import job, or None.
+
+    Returns:
+        generator: ``(japanese, kana, chinese, is_kana)`` tuples.
+    """
+    pool = get_parse_pool()
+    pending = deque()
+
+    def collect():
+        result = pending.popleft().result()
+        parser.add_batch(result)
+        if job is not None:
+            job.add_parsed(len(result['rows']), result['error_count'])
+        return result['rows']
+
+    try:
+        for first_line, text in parser.iter_batches(chunks):
+            pending.append(pool.submit(parse_word_batch, text, parser.delimiter, first_line))
+            if len(pending) >= MAX_PENDING_BATCHES:
+                yield from collect()
+        while pending:
+            yield from collect()
+    finally:
+        # 导入提前结束（取消或出错）时放弃尚未开始的解析任务
+        for future in pending:
+            future.cancel()
+
+def _import_word_file(result, chunks, job, chunk_size):
+    """
+    Create the deck for a word file and insert its words.
+
+    Args:
+        result (dict): The result dictionary of the file, updated in place.
+        chunks (iterable): The file content as byte chunks.
+        job (ImportJob): The background import job, or None.
+        chunk_size (int): Number of rows per insert transaction.
+    """
+    filename = result['file']
+    parser = WordFileParser()
+    rows = _iter_parsed_rows(parser, chunks, job)
+    try:
+        # 有单词时才创建词单
+        first_row = next(rows, None)
+        if first_row is None:
+            logging.warning(f"No words found in file: {filename}")
+            result['error'] = '没有找到单词'
+            return
+
+        if job is not None and job.cancelled:
+            result['error'] = '已取消'
+            return
+
+        # 获取词单名称（使用文件名，去掉扩展名）
+        deck_name = os.path.splitext(filename)[0]
+
+        # 添加词单
+        deck_id = add_deck(deck_name)
+        if not deck_id:
+            logging.error(f"Failed to create deck: {deck_name}")
+            result['error'] = '创建词单失败'
+            return
+
+        result['deck_id'] = deck_id
+        logging.info(f"Created deck: {deck_name}, ID: {deck_id}")
+
+        # 添加单词到词单，解析与写入同时进行
+        word_count = import_word_rows(deck_id, chain([first_row], rows), chunk_size, job)
+        if word_count is None:
+            logging.error(f"Failed to add words to deck: {deck_name}")
+            result['error'] = '添加单词失败'
+            return
+
+        result['words'] = word_count
+        if job is not None and job.cancelled:
+            # 任务在导入过程中被取消，已提交的单词保留
+            result['error'] = f'已取消（已导入 {word_count} 个单词）'
+            return
+
+        logging.info(f"Successfully added {word_count} words to deck: {deck_name}")
+
+    finally:
+        rows.close()
+        result['parse_errors'] = parser.errors
+        result['error_count'] = parser.error_count
+        if parser.error_count:
+            logging.warning(f"Skipped {parser.error_count} invalid rows in file: {filename}")
+
+def summarize_import(results):
+    """
+    Build the ``/import_decks`` response from per-file import results.
+
+    Args:
+        results (list): The result dictionaries returned by ``import_word_files``.
+
+    Returns:
+        dict: Success count, total words, per-file results, failed files and
+              parse errors, or an ``error`` entry if no file was imported.
+    """
+    if not results:
+        return {'error': '没有选择文件'}
+
+    success_count = 0
+    total_words = 0
+    failed_files = []
+    parse_errors = []
+
+    for result in results:
+        if result['error']:
+            failed_files.append(f"{result['file']} ({result['error']})")
+        else:
+            success_count += 1
+            total_words += result['words']
+
+        # 记录无法解析的行
+        parse_errors.extend(dict(error, file=result['file']) for error in result['parse_errors'])
+
+    if success_count == 0:
+        error_message = '所有词单导入失败'
+        if failed_files:
+            error_message += f": {', '.join(failed_files)}"
+        return {'error': error_message}
+
+    summary = {
+        'success_count': success_count,
+        'total_words': total_words,
+        'files': results
+    }
+
+    if failed_files:
+        summary['failed_files'] = failed_files
+
+    if parse_errors:
+        summary['parse_errors'] = parse_errors
+
+    return summary
@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from db.stats import DAY_MS
+from models.fsrs import RATING_MAP
+from models.fsrs_kernel import review_batch
+
+# 最多缓存的卡片预览数
+MAX_CACHED_PREVIEWS = 50000
+
+# 评分对应的难度级别名称
+RATING_LABELS = {rating: label for label, rating in RATING_MAP.items()}
+
+# 预览中包含的字段，也是确认评分时直接写入的字段
+PREVIEW_FIELDS = ('state', 'difficulty', 'stability', 'retrievability', 'reps', 'lapses', 'scheduled_days')
+
+def card_fingerprint(record, parameters):
+    """
+    Identify the scheduling state of a card under a parameter set.
+
+    A cached preview is only used if the card and the parameters still have
+    the fingerprint it was computed for.
+
+    Args:
+        record: The FSRS record, indexable by column name.
+        parameters (dict): FSRS parameters.
+
+    Returns:
+        tuple: The fingerprint.
+    """
+    return (
+        record['state'], record['difficulty'], record['stability'],
+        record['reps'], record['lapses'], record['scheduled_days'], record['last_review'],
+        parameters['request_retention'], parameters['maximum_interval'], tuple(parameters['w'])
+    )
+
+def compute_previews(records, parameters, now):
+    """
+    Compute the outcome of every rating for a batch of cards in one vectorized pass.
+
+    Args:
+        records (list): FSRS records as dictionaries.
+        parameters (dict): FSRS parameters.
+        now (int): The current time as a millisecond timestamp.
+
+    Returns:
+        list: One dictionary per record, mapping each rating (1-4) to the new
+              ``PREVIEW_FIELDS`` and the resulting ``next_review``.
+    """
+    if not records:
+        return []
+
+    ratings = np.array(sorted(RATING_LABELS))
+
+    def column(name, dtype):
+        return np.repeat(np.array([record[name] for record in records], dtype=dtype), len(ratings))
+
+    result = review_batch(
+        column('state', np.int64),
+        column('difficulty', np.float64),
+        column('stability', np.float64),
+        column('reps', np.int64),
+        column('lapses', np.int64),
+        column('scheduled_days', np.int64),
+        np.tile(ratings, len(records)),
+        parameters
+    )
+    result = {name: result[name].reshape(len(records), len(ratings)).tolist() for name in PREVIEW_FIELDS}
+
+    previews = []
+    for i in range(len(records)):
+        outcomes = {}
+        for j, rating in enumerate(ratings.tolist()):
+            outcome = {name: result[name][i][j] for name in PREVIEW_FIELDS}
+            outcome['next_review'] = now + outcome['scheduled_days'] * DAY_MS
+            outcomes[rating] = outcome
+        previews.append(outcomes)
+    return previews
+
+class PreviewCache:
+    """
+    A process-local LRU cache of the rating previews sent to the client.
+
+    When a rating arrives for a card whose state has not changed since its
+    preview was computed, the review uses the precomputed outcome instead of
+    running the scheduler again.
+    """
+
+    def __init__(self, max_size=MAX_CACHED_PREVIEWS):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def store(self, deck_id, record_id, fingerprint, outcomes):
+        """
+        Cache the previews of a card.
+
+        Args:
+            deck_id (int): The ID of the deck.
+            record_id (int): The ID of the FSRS record.
+            fingerprint (tuple): The card fingerprint, from ``card_fingerprint``.
+            outcomes (dict): The previews, as returned by ``compute_previews``.
+        """
+        key = (int(deck_id), int(record_id))
+        with self._lock:
+            self._entries[key] = (fingerprint, outcomes)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def take(self, deck_id, record_id, rating, fingerprint):
+        """
+        Remove the previews of a card and return the outcome of a rating.
+
+        Args:
+            deck_id (int): The ID of the deck.
+            record_id (int): The ID of the FSRS record.
+            rating (int): The rating (1-4).
+            fingerprint (tuple): The current card fingerprint.
+
+        Returns:
+            dict or None: The precomputed outcome, or None if there is no preview
+                          for the card's current state.
+        """
+        with self._lock:
+            entry = self._entries.pop((int(deck_id), int(record_id)), None)
+            if entry is None or entry[0] != fingerprint:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1].get(rating)
+
+    def clear(self):
+        """
+        Drop all cached previews.
+        """
+        with self._lock:
+            self._entries.clear()
+
+# 进程内共享的缓存实例
+preview_cache = PreviewCache()
@@ -0,0 +1,333 @@
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from db import execute_write, get_read_connection, submit_write
+from models.fsrs import get_fsrs_parameters
+
+# 同时运行的模拟任务数，每个任务的模拟已在共用的进程池中并行
+RETENTION_JOB_WORKERS = 1
+
+# 排队和运行中的模拟任务数上限
+MAX_ACTIVE_JOBS = 8
+
+# 模拟规模上限
+MAX_SIMULATED_LEARNERS = 1000
+MAX_SIMULATED_DAYS = 3650
+
+# 失败和取消的任务保留时间（毫秒），完成的任务保留到有更新的结果为止
+JOB_RETENTION_MS = 7 * 24 * 60 * 60 * 1000
+
+# 任务状态查询读取的列
+JOB_COLUMNS = '''
+    id, deck_id, status, learners, days, new_per_day, retentions_done,
+    retentions_total, result, cancel_requested, created_at, updated_at
+'''
+
+_executor = None
+_executor_lock = threading.Lock()
+_active_jobs = threading.BoundedSemaphore(MAX_ACTIVE_JOBS)
+
+def _now():
+    return int(datetime.now().timestamp() * 1000)
+
+def _load_parameters(deck_id):
+    conn = get_read_connection()
+    try:
+        parameters = get_fsrs_parameters(conn.cursor(), deck_id)
+    finally:
+        conn.close()
+
+    # 参数以规范的 JSON 保存，用于查找相同参数下的结果
+    return parameters, json.dumps(parameters, sort_keys=True)
+
+class RetentionJob:
+    """
+    Progress reporting and cancellation for a running simulation job.
+
+    Passed to ``simulate_retentions``, which calls ``add_simulated`` after each
+    target retention and stops once ``cancelled`` is True.
+    """
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self._cancelled = False
+
+    def add_simulated(self, retentions):
+        """
+        Record simulated target retentions.
+
+        Args:
+            retentions (int): Number of target retentions simulated.
+        """
+        def increment(c):
+            c.execute('''
+                UPDATE retention_jobs SET retentions_done = retentions_done + ?, updated_at = ?
+                WHERE id = ?
+            ''', (retentions, _now(), self.id))
+
+        # 进度更新不必等待提交
+        submit_write(increment)
+
+    @property
+    def cancelled(self):
+        """
+        bool: Whether cancellation of the job has been requested.
+        """
+        if not self._cancelled:
+            conn = get_read_connection()
+            try:
+                row = conn.execute('SELECT cancel_requested FROM retention_jobs WHERE id = ?', (self.id,)).fetchone()
+                self._cancelled = bool(row and row[0])
+            finally:
+                conn.close()
+        return self._cancelled
+
+def get_job_executor():
+    """
+    Get the thread pool that runs simulation jobs, creating it on first use.
+
+    Returns:
+        ThreadPoolExecutor: The simulation job executor.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=RETENTION_JOB_WORKERS, thread_name_prefix='retention-job')
+    return _executor
+
+def submit_retention_job(deck_id, learners=200, days=365, new_per_day=20):
+    """
+    Queue a simulation of target retentions for a deck as a background job.
+
+    A job already queued or running for the same deck, settings and FSRS
+    parameters is reused instead of starting another one.
+
+    Args:
+        deck_id (int): The ID of the deck.
+        learners (int, optional): Number of virtual learners. Defaults to 200.
+        days (int, optional): Number of days to simulate. Defaults to 365.
+        new_per_day (int, optional): Number of new cards learned per day. Defaults to 20.
+
+    Returns:
+        str or None: The job ID, or None if too many jobs are already active.
+    """
+    from models.fsrs_simulator import RETENTION_GRID
+
+    parameters, parameters_json = _load_parameters(deck_id)
+    job_id = uuid.uuid4().hex
+    now = _now()
+
+    def insert(c):
+        c.execute('''
+            SELECT id FROM retention_jobs
+            WHERE deck_id = ? AND learners = ? AND days = ? AND new_per_day = ? AND parameters = ?
+              AND status IN ('queued', 'running') AND cancel_requested = 0
+            LIMIT 1
+        ''', (deck_id, learners, days, new_per_day, parameters_json))
+        row = c.fetchone()
+        if row:
+            return row[0]
+
+        # 清理过期的失败和取消的任务
+        c.execute('''
+            DELETE FROM retention_jobs
+            WHERE status IN ('failed', 'cancelled') AND updated_at < ?
+        ''', (now - JOB_RETENTION_MS,))
+
+        c.execute('''
+            INSERT INTO retention_jobs (
+                id, deck_id, status, learners, days, new_per_day, parameters,
+                retentions_total, created_at, updated_at
+            )
+            VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?, ?)
+        ''', (job_id, deck_id, learners, days, new_per_day, parameters_json, len(RETENTION_GRID), now, now))
+        return job_id
+
+    if not _active_jobs.acquire(blocking=False):
+        logging.warning("Too many active simulation jobs, rejecting new job")
+        return None
+
+    try:
+        existing_id = execute_write(insert)
+    except Exception:
+        _active_jobs.release()
+        raise
+
+    if existing_id != job_id:
+        _active_jobs.release()
+        logging.info(f"Reusing simulation job {existing_id} for deck {deck_id}")
+        return existing_id
+
+    get_job_executor().submit(_run_retention_job, job_id, deck_id, learners, days, new_per_day, parameters)
+    logging.info(f"Queued simulation job {job_id} for deck {deck_id}")
+    return job_id
+
+def _finish_job(job_id, status, result):
+    def finish(c):
+        c.execute('''
+            UPDATE retention_jobs SET status = ?, result = ?, updated_at = ?
+            WHERE id = ?
+        ''', (status, json.dumps(result, ensure_ascii=False), _now(), job_id))
+
+        if status == 'done':
+            # 只保留每个词单、模拟设置和 FSRS 参数下的最新结果
+            c.execute('''
+                DELETE FROM retention_jobs
+                WHERE id != ? AND status = 'done'
+                  AND (deck_id, learners, days, new_per_day, parameters) IN (
+                      SELECT deck_id, learners, days, new_per_day, parameters
+                      FROM retention_jobs WHERE id = ?
+                  )
+            ''', (job_id, job_id))
+
+    execute_write(finish)
+
+def _run_retention_job(job_id, deck_id, learners, days, new_per_day, parameters):
+    """
+    Run a simulation job on the job executor.
+
+    Args:
+        job_id (str): The job ID.
+        deck_id (int): The ID of the deck.
+        learners (int): Number of virtual learners.
+        days (int): Number of days to simulate.
+        new_per_day (int): Number of new cards learned per day.
+        parameters (dict): The FSRS parameters to simulate with.
+    """
+    try:
+        def start(c):
+            c.execute('''
+                UPDATE retention_jobs SET status = 'running', updated_at = ?
+                WHERE id = ? AND status = 'queued'
+            ''', (_now(), job_id))
+            return c.rowcount == 1
+
+        if not execute_write(start):
+            # 任务在开始前已被取消
+            logging.info(f"Simulation job {job_id} was cancelled before it started")
+            return
+
+        # 用到时才加载 NumPy 和模拟器，不拖慢服务启动
+        from models.fsrs_simulator import get_simulation_pool, simulate_retentions
+
+        job = RetentionJob(job_id)
+        result = simulate_retentions(
+            deck_id, learners=learners, days=days, new_per_day=new_per_day,
+            parameters=parameters, executor=get_simulation_pool(), job=job
+        )
+
+        if job.cancelled:
+            _finish_job(job_id, 'cancelled', {'error': '模拟已取消'})
+        elif result is None:
+            _finish_job(job_id, 'failed', {'error': '词单中没有可模拟的卡片'})
+        else:
+            _finish_job(job_id, 'done', result)
+        logging.info(f"Simulation job {job_id} for deck {deck_id} finished")
+
+    except Exception as e:
+        logging.error(f"Error running simulation job {job_id}: {str(e)}")
+        _finish_job(job_id, 'failed', {'error': f'模拟记忆保持率时发生错误: {str(e)}'})
+
+    finally:
+        _active_jobs.release()
+
+def _job_from_row(row):
+    return {
+        'job_id': row['id'],
+        'deck_id': row['deck_id'],
+        'status': row['status'],
+        'learners': row['learners'],
+        'days': row['days'],
+        'new_per_day': row['new_per_day'],
+        'retentions_done': row['retentions_done'],
+        'retentions_total': row['retentions_total'],
+        'result': json.loads(row['result']) if row['result'] else None,
+        'cancel_requested': bool(row['cancel_requested']),
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at']
+    }
+
+def get_retention_job(job_id):
+    """
+    Get the state of a simulation job.
+
+    Args:
+        job_id (str): The job ID.
+
+    Returns:
+        dict or None: The job status, simulation settings, progress and, once
+                      finished, the simulation result. None if the job does not exist.
+    """
+    conn = get_read_connection()
+    try:
+        row = conn.execute(f'SELECT {JOB_COLUMNS} FROM retention_jobs WHERE id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+
+    return _job_from_row(row) if row else None
+
+def get_latest_retention(deck_id, learners=200, days=365, new_per_day=20):
+    """
+    Get the latest finished simulation of a deck under its current FSRS parameters.
+
+    Args:
+        deck_id (int): The ID of the deck.
+        learners (int, optional): Number of virtual learners. Defaults to 200.
+        days (int, optional): Number of days simulated. Defaults to 365.
+        new_per_day (int, optional): Number of new cards learned per day. Defaults to 20.
+
+    Returns:
+        dict or None: The finished job (see ``get_retention_job``), or None if
+                      there is no result for these settings and parameters.
+    """
+    _, parameters_json = _load_parameters(deck_id)
+
+    conn = get_read_connection()
+    try:
+        row = conn.execute(f'''
+            SELECT {JOB_COLUMNS} FROM retention_jobs
+            WHERE deck_id = ? AND learners = ? AND days = ? AND new_per_day = ? AND parameters = ?
+              AND status = 'done'
+            ORDER BY updated_at DESC
+            LIMIT 1
+        ''', (deck_id, learners, days, new_per_day, parameters_json)).fetchone()
+    finally:
+        conn.close()
+
+    return _job_from_row(row) if row else None
+
+def cancel_retention_job(job_id):
+    """
+    Request cancellation of a simulation job.
+
+    A queued job is cancelled immediately. A running job stops after the
+    target retention it is simulating.
+
+    Args:
+        job_id (str): The job ID.
+
+    Returns:
+        bool: True if the job exists and had not finished yet.
+    """
+    def cancel(c):
+        c.execute('''
+            UPDATE retention_jobs SET cancel_requested = 1, updated_at = ?
+            WHERE id = ? AND status IN ('queued', 'running')
+        ''', (_now(), job_id))
+        found = c.rowcount == 1
+
+        c.execute('''
+            UPDATE retention_jobs SET status = 'cancelled', result = ?
+            WHERE id = ? AND status = 'queued'
+        ''', (json.dumps({'error': '模拟已取消'}, ensure_ascii=False), job_id))
+        return found
+
+    found = execute_write(cancel)
+
+    if found:
+        logging.info(f"Cancellation requested for simulation job {job_id}")
+    return found
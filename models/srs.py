@@ -1,4 +1,5 @@
-from db import get_db_connection
+import logging
+from db import execute_write
 
 def update_srs_data(srs_record_id, srs_info, deck_id):
     """
@@ -12,8 +13,6 @@ def update_srs_data(srs_record_id, srs_info, deck_id):
     Returns:
         bool: True if the SRS data was updated successfully.
     """
-    import logging
-
     # 记录传入的参数
     logging.info(f"Updating SRS data: record_id={srs_record_id}, deck_id={deck_id}, srs_info={srs_info}")
 
@@ -22,27 +21,25 @@ def update_srs_data(srs_record_id, srs_info, deck_id):
         logging.error("Invalid SRS record ID")
         return False
 
-    conn = get_db_connection()
-    c = conn.cursor()
-
-    try:
+    def update(c):
         # 检查记录是否存在
-        c.execute(f"SELECT id FROM srs_records_{deck_id} WHERE id = ?", (srs_record_id,))
+        c.execute("SELECT id FROM srs_records WHERE id = ? AND deck_id = ?", (srs_record_id, deck_id))
         if not c.fetchone():
             logging.error(f"SRS record with ID {srs_record_id} not found in deck {deck_id}")
             return False
 
         # 更新记录
-        c.execute(f'''
-            UPDATE srs_records_{deck_id}
+        c.execute('''
+            UPDATE srs_records
             SET next_review = ?, interval = ?, ease = ?, last_review = ?
-            WHERE id = ?
+            WHERE id = ? AND deck_id = ?
         ''', (
             srs_info['nextReview'],
             srs_info['interval'],
             srs_info['ease'],
             srs_info['lastReview'],
-            srs_record_id
+            srs_record_id,
+            deck_id
         ))
 
         # 检查是否有行被更新
@@ -51,10 +48,10 @@ def update_srs_data(srs_record_id, srs_info, deck_id):
         else:
             logging.info(f"Updated SRS record {srs_record_id} in deck {deck_id}")
 
-        conn.commit()
         return True
+
+    try:
+        return execute_write(update)
     except Exception as e:
         logging.error(f"Error updating SRS data: {str(e)}")
         return False
-    finally:
-        conn.close()
@@ -1,5 +1,25 @@
-from db import get_db_connection
-from models.fsrs import initialize_fsrs_record, get_fsrs_records_for_review
+from itertools import islice
+import logging
+import time
+from datetime import datetime
+from db import execute_write, get_read_connection
+from db.functions import retrievability
+from db.stats import update_deck_stats
+from models.due_cache import due_cache
+from models.forecast import forecast_cache
+from models.fsrs import (
+    STATES, get_fsrs_parameters, get_fsrs_records_for_review, get_fsrs_records_for_review_all_decks
+)
+from models.previews import RATING_LABELS, card_fingerprint, compute_previews, preview_cache
+from utils import metrics
+
+# 每个事务导入的单词数
+IMPORT_CHUNK_SIZE = 50000
+
+IMPORT_ROWS = metrics.counter('nekowords_import_rows_total', 'Words inserted by imports.')
+IMPORT_CHUNK_SECONDS = metrics.histogram(
+    'nekowords_import_chunk_seconds', 'Time to write one import chunk, including the wait for the writer.'
+)
 
 def add_words_to_deck(deck_id, words):
     """
@@ -7,160 +27,334 @@ def add_words_to_deck(deck_id, words):
 
     Args:
         deck_id (int): The ID of the deck.
-        words (list): A list of dictionaries containing word information.
+        words (iterable): Dictionaries containing word information.
 
     Returns:
         bool: True if the words were added successfully, False otherwise.
     """
-    import time
-    import logging
-    import sqlite3
-
-    # 批量处理的大小
-    BATCH_SIZE = 50
-
-    max_retries = 5
-    retry_delay = 0.1  # 初始延迟时间（秒）
-
-    for attempt in range(max_retries):
-        conn = None
-        try:
-            conn = get_db_connection()
-            c = conn.cursor()
-
-            # 将单词列表分成多个批次
-            total_words = len(words)
-            processed_count = 0
-            batch_count = 0
-
-            logging.info(f"Processing {total_words} words in batches of {BATCH_SIZE}")
-
-            for i, word in enumerate(words):
-                # 检查单词是否已存在
-                c.execute(f'''
-                    SELECT id FROM words_{deck_id}
-                    WHERE japanese = ? AND kana = ? AND chinese = ?
-                ''', (word['japanese'], word['kana'], word['chinese']))
-
-                existing_word = c.fetchone()
-                if existing_word:
-                    word_id = existing_word[0]
-                    logging.debug(f"Word already exists: {word['japanese']}, using existing ID: {word_id}")
-                else:
-                    # 插入新单词
-                    c.execute(f'''
-                        INSERT INTO words_{deck_id} (japanese, kana, chinese, is_kana)
-                        VALUES (?, ?, ?, ?)
-                    ''', (word['japanese'], word['kana'], word['chinese'], word['is_kana']))
-                    word_id = c.lastrowid
-                    logging.debug(f"Added new word: {word['japanese']}, ID: {word_id}")
-
-                # 为每个单词创建FSRS记录
-                questions = []
-
-                # 如果中文和日文相同，只存储一次
-                if word['japanese'] == word['chinese']:
-                    questions.append(word['japanese'])  # 只存储一次日文/中文
-                else:
-                    questions.append(word['japanese'])  # 日文题目
-                    questions.append(word['chinese'])   # 中文题目
-
-                # 如果不是全假名单词，添加假名题目
-                if not word['is_kana']:
-                    questions.append(word['kana'])      # 假名题目
-
-                # 在FSRS表中存储不重复的问题
-                for question in questions:
-                    record_id = initialize_fsrs_record(word_id, question, deck_id, conn)
-                    if not record_id:
-                        logging.warning(f"Failed to initialize FSRS record for word {word_id}, question: {question}")
-
-                processed_count += 1
-
-                # 每处理一批数据就提交一次事务
-                if (i + 1) % BATCH_SIZE == 0 or i == total_words - 1:
-                    conn.commit()
-                    batch_count += 1
-                    logging.info(f"Committed batch {batch_count}, processed {processed_count}/{total_words} words")
-
-                    # 短暂暂停，让其他连接有机会访问数据库
-                    time.sleep(0.01)
-
-            logging.info(f"Successfully added {processed_count} words to deck {deck_id} in {batch_count} batches")
-            return True
-
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                # 数据库锁定，等待一段时间后重试
-                wait_time = retry_delay * (2 ** attempt)  # 指数退避策略
-                logging.warning(f"Database is locked, retrying in {wait_time:.2f} seconds (attempt {attempt+1}/{max_retries})")
-                time.sleep(wait_time)
-            else:
-                logging.error(f"Error adding words after {attempt+1} attempts: {str(e)}")
-                return False
-
-        except Exception as e:
-            logging.error(f"Error adding words: {str(e)}")
-            return False
-
-        finally:
-            if conn:
-                conn.close()
-
-def get_deck_words(deck_id, limit=20):
+    rows = ((word['japanese'], word['kana'], word['chinese'], word['is_kana']) for word in words)
+    return import_word_rows(deck_id, rows) is not None
+
+def import_word_rows(deck_id, rows, chunk_size=IMPORT_CHUNK_SIZE, job=None):
+    """
+    Bulk import words into a deck.
+
+    Rows are staged in a temporary table and inserted set-based with
+    ``INSERT OR IGNORE``, relying on the deck's unique indexes to skip words and
+    FSRS records that already exist. Each chunk of rows is one transaction.
+    Rows skipped as duplicates are processed but not counted as inserted.
+
+    Args:
+        deck_id (int): The ID of the deck.
+        rows (iterable): ``(japanese, kana, chinese, is_kana)`` tuples.
+        chunk_size (int, optional): Number of rows per transaction.
+        job (ImportJob, optional): A background import job to report progress to.
+                                   If it is cancelled, the import stops before the
+                                   next chunk; chunks already committed are kept.
+
+    Returns:
+        int or None: The number of words inserted, or None if the import failed.
+    """
+    try:
+        processed_count = 0
+        inserted_count = 0
+        batch_count = 0
+        rows = iter(rows)
+
+        while True:
+            if job is not None and job.cancelled:
+                logging.info(f"Import into deck {deck_id} cancelled after {processed_count} words")
+                break
+
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            # 每个分块由写线程在一个事务中写入
+            start = time.perf_counter()
+            inserted = execute_write(_import_chunk, deck_id, chunk)
+            IMPORT_CHUNK_SECONDS.observe(time.perf_counter() - start)
+            IMPORT_ROWS.inc(inserted)
+
+            # 把新增的卡片加入复习队列缓存，并重新计算复习量预测
+            due_cache.add_new_records(deck_id)
+            forecast_cache.invalidate(deck_id)
+
+            processed_count += len(chunk)
+            inserted_count += inserted
+            batch_count += 1
+            logging.info(f"Committed batch {batch_count}, processed {processed_count} words")
+
+            if job is not None:
+                job.add_inserted(inserted)
+
+        logging.info(
+            f"Successfully added {inserted_count} of {processed_count} words to deck {deck_id} in {batch_count} batches"
+        )
+        return inserted_count
+
+    except Exception as e:
+        logging.error(f"Error adding words: {str(e)}")
+        return None
+
+def _import_chunk(c, deck_id, chunk):
+    """
+    Write task of ``import_word_rows``: stage and insert one chunk of rows.
+
+    Args:
+        c (sqlite3.Cursor): The cursor of the database writer.
+        deck_id (int): The ID of the deck.
+        chunk (list): ``(japanese, kana, chinese, is_kana)`` tuples.
+
+    Returns:
+        int: The number of words inserted.
+    """
+    # 暂存表在写线程的连接上，只对该连接可见
+    c.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS import_staging (
+            japanese TEXT,
+            kana TEXT,
+            chinese TEXT,
+            is_kana BOOLEAN,
+            word_id INTEGER
+        )
+    ''')
+    c.execute('DELETE FROM import_staging')
+    c.executemany('INSERT INTO import_staging (japanese, kana, chinese, is_kana) VALUES (?, ?, ?, ?)', chunk)
+    inserted = insert_staged_words(c, deck_id)
+    c.execute('DELETE FROM import_staging')
+    return inserted
+
+def insert_staged_words(c, deck_id):
+    """
+    Insert the rows of the ``import_staging`` table into a deck.
+
+    Each word gets FSRS records for its Japanese, Chinese (if different from
+    the Japanese) and kana (if not an all-kana word) questions. The deck
+    statistics are updated with the same cursor, so this must run inside the
+    caller's transaction.
+
+    Args:
+        c (sqlite3.Cursor): The cursor to execute the statements with.
+        deck_id (int): The ID of the deck.
+
+    Returns:
+        int: The number of words inserted; rows matching an existing word are skipped.
+    """
+    # 单词 ID 在所有词单间递增，大于该值的都是本次插入的新单词
+    c.execute('SELECT COALESCE(MAX(id), 0) FROM words')
+    last_word_id = c.fetchone()[0]
+
+    # 插入新单词，已存在的单词由唯一索引忽略
+    c.execute('''
+        INSERT OR IGNORE INTO words (deck_id, japanese, kana, chinese, is_kana)
+        SELECT ?, japanese, kana, chinese, is_kana FROM import_staging
+    ''', (deck_id,))
+    new_words = c.rowcount
+
+    # 查出每一行对应的单词ID
+    c.execute('''
+        UPDATE import_staging SET word_id = (
+            SELECT w.id FROM words w
+            WHERE w.deck_id = ?
+              AND w.japanese = import_staging.japanese
+              AND w.kana = import_staging.kana
+              AND w.chinese = import_staging.chinese
+        )
+    ''', (deck_id,))
+
+    # 已存在的单词在词单中的最早到期时间
+    due_times_sql = '''
+        SELECT word_id, MIN(next_review)
+        FROM srs_records
+        WHERE deck_id = ? AND word_id IN (SELECT word_id FROM import_staging WHERE word_id <= ?)
+        GROUP BY word_id
+    '''
+    c.execute(due_times_sql, (deck_id, last_word_id))
+    due_before = dict(c.fetchall())
+
+    # 为每个单词创建FSRS记录：日文题目、与日文不同的中文题目、非全假名单词的假名题目
+    c.execute('''
+        INSERT OR IGNORE INTO srs_records (
+            deck_id, word_id, question, state, difficulty, stability,
+            retrievability, reps, lapses, scheduled_days,
+            next_review, last_review
+        )
+        SELECT ?, word_id, question, ?, 3.0, 0.0, 1.0, 0, 0, 0, 0, 0
+        FROM (
+            SELECT rowid AS pos, 1 AS ord, word_id, japanese AS question
+            FROM import_staging
+            UNION ALL
+            SELECT rowid, 2, word_id, chinese
+            FROM import_staging WHERE japanese != chinese
+            UNION ALL
+            SELECT rowid, 3, word_id, kana
+            FROM import_staging WHERE NOT is_kana
+        )
+        ORDER BY pos, ord
+    ''', (deck_id, STATES['NEW']))
+    new_cards = c.rowcount
+
+    c.execute(due_times_sql, (deck_id, last_word_id))
+    due_after = dict(c.fetchall())
+
+    # 新单词至少有一条刚插入的记录，最早到期时间为 0
+    c.execute('SELECT id FROM words WHERE deck_id = ? AND id > ?', (deck_id, last_word_id))
+    due_after.update((word_id, 0) for (word_id,) in c.fetchall())
+
+    # 在同一事务中更新词单统计（新卡片的状态均为 NEW）
+    update_deck_stats(
+        c, deck_id,
+        words=new_words,
+        states={STATES['NEW']: new_cards},
+        due_before=due_before,
+        due_after=due_after
+    )
+
+    return new_words
+
+def get_deck_words(deck_id, limit=20, order='due'):
     """
     Get words and FSRS data for a deck that need to be reviewed.
 
+    Each question carries the outcome of every rating, computed in one
+    vectorized pass with the deck's active parameters. The outcomes are cached
+    so that submitting a rating applies the shown outcome without recomputing it.
+
     Args:
         deck_id (int): The ID of the deck.
         limit (int, optional): Maximum number of questions to return. Defaults to 20.
+        order (str, optional): 'due' (earliest due first) or 'retrievability'
+                               (lowest current retrievability first).
 
     Returns:
         list: A list of dictionaries containing word and FSRS information.
     """
-    # 使用FSRS获取需要复习的记录
-    fsrs_records = get_fsrs_records_for_review(deck_id, limit)
+    # 按到期时间排序时优先从复习队列缓存获取，词单无法缓存时查询数据库
+    fsrs_records = due_cache.get_due(deck_id, limit) if order == 'due' else None
+    if fsrs_records is None:
+        fsrs_records = get_fsrs_records_for_review(deck_id, limit, order)
 
     # 如果没有需要复习的记录，返回空列表
     if not fsrs_records:
         return []
 
+    conn = get_read_connection()
+    try:
+        parameters = get_fsrs_parameters(conn.cursor(), deck_id)
+    finally:
+        conn.close()
+
+    # 一次性计算所有卡片在各评分下的结果
+    now = int(datetime.now().timestamp() * 1000)
+    previews = compute_previews(fsrs_records, parameters, now)
+
     # 组织数据
     questions = []
+    for record, outcomes in zip(fsrs_records, previews):
+        question = _build_question(deck_id, record, outcomes, parameters, now)
+        if question is not None:
+            questions.append(question)
+
+    return questions
+
+def _build_question(deck_id, record, outcomes, parameters, now):
+    """
+    Turn a due FSRS record into a question and cache its rating previews.
+
+    Args:
+        deck_id (int): The ID of the deck.
+        record (dict): The FSRS record joined with its word.
+        outcomes (dict): The outcome of each rating, from ``compute_previews``.
+        parameters (dict): The FSRS parameters the outcomes were computed with.
+        now (int): The current time as a millisecond timestamp.
+
+    Returns:
+        dict or None: The question, or None if its type cannot be determined.
+    """
+    # 根据问题类型确定题目类型
+    question_type = None
+    if record['question'] == record['japanese']:
+        question_type = 'japanese_to_others'
+    elif record['question'] == record['kana'] and not record['is_kana']:
+        question_type = 'kana_to_others'
+    elif record['question'] == record['chinese'] and record['japanese'] != record['chinese']:
+        question_type = 'chinese_to_others'
+    else:
+        # 如果无法确定题目类型，跳过
+        return None
+
+    preview_cache.store(deck_id, record['id'], card_fingerprint(record, parameters), outcomes)
+
+    return {
+        'question': record['question'],
+        'answer': record['question'],
+        'type': question_type,
+        'japanese': record['japanese'],
+        'kana': record['kana'],
+        'chinese': record['chinese'],
+        'is_kana': record['is_kana'],
+        'fsrs_info': {
+            'record_id': record['id'],
+            'state': record['state'],
+            'difficulty': record['difficulty'],
+            'stability': record['stability'],
+            'retrievability': record['retrievability'],
+            'current_retrievability': record['current_retrievability'] if 'current_retrievability' in record
+                                      else retrievability(record['stability'], record['last_review'], now),
+            'reps': record['reps'],
+            'lapses': record['lapses'],
+            'scheduled_days': record['scheduled_days'],
+            'next_review': record['next_review'],
+            'last_review': record['last_review'],
+            'previews': {RATING_LABELS[rating]: outcome for rating, outcome in outcomes.items()}
+        }
+    }
+
+def get_due_words(limit=20):
+    """
+    Get the most urgent questions across all decks.
+
+    The due records of all decks are read in one query and ordered by due
+    time. Previews are computed with one vectorized pass per deck, since decks
+    may have different FSRS parameters.
+
+    Args:
+        limit (int, optional): Maximum number of questions to return. Defaults to 20.
+
+    Returns:
+        list: A list of dictionaries containing word and FSRS information,
+              each with the ``deck_id`` to submit its review to.
+    """
+    fsrs_records = get_fsrs_records_for_review_all_decks(limit)
+    if not fsrs_records:
+        return []
+
+    # 按词单分组，每个词单使用自己的 FSRS 参数
+    deck_records = {}
+    for record in fsrs_records:
+        deck_records.setdefault(record['deck_id'], []).append(record)
+
+    conn = get_read_connection()
+    try:
+        c = conn.cursor()
+        parameters = {deck_id: get_fsrs_parameters(c, deck_id) for deck_id in deck_records}
+    finally:
+        conn.close()
+
+    now = int(datetime.now().timestamp() * 1000)
+    outcomes = {}
+    for deck_id, records in deck_records.items():
+        for record, record_outcomes in zip(records, compute_previews(records, parameters[deck_id], now)):
+            outcomes[(deck_id, record['id'])] = record_outcomes
+
+    # 保持跨词单的到期顺序
+    questions = []
     for record in fsrs_records:
-        # 根据问题类型确定题目类型
-        question_type = None
-        if record['question'] == record['japanese']:
-            question_type = 'japanese_to_others'
-        elif record['question'] == record['kana'] and not record['is_kana']:
-            question_type = 'kana_to_others'
-        elif record['question'] == record['chinese'] and record['japanese'] != record['chinese']:
-            question_type = 'chinese_to_others'
-        else:
-            # 如果无法确定题目类型，跳过
-            continue
-
-        # 添加题目
-        questions.append({
-            'question': record['question'],
-            'answer': record['question'],
-            'type': question_type,
-            'japanese': record['japanese'],
-            'kana': record['kana'],
-            'chinese': record['chinese'],
-            'is_kana': record['is_kana'],
-            'fsrs_info': {
-                'record_id': record['id'],
-                'state': record['state'],
-                'difficulty': record['difficulty'],
-                'stability': record['stability'],
-                'retrievability': record['retrievability'],
-                'reps': record['reps'],
-                'lapses': record['lapses'],
-                'scheduled_days': record['scheduled_days'],
-                'next_review': record['next_review'],
-                'last_review': record['last_review']
-            }
-        })
+        deck_id = record['deck_id']
+        question = _build_question(deck_id, record, outcomes[(deck_id, record['id'])], parameters[deck_id], now)
+        if question is not None:
+            question['deck_id'] = deck_id
+            questions.append(question)
 
     return questions
@@ -1,10 +1,9 @@
 from flask import Blueprint, jsonify, request
-import os
-import time
 import logging
-from models.deck import get_decks, add_deck, delete_deck
-from models.word import add_words_to_deck
-from utils.file_utils import load_words_from_file
+from models.deck import get_decks, delete_deck
+from models.forecast import get_forecast
+from models.import_jobs import submit_import_job, get_import_job, cancel_import_job
+from utils.upload_utils import close_files, iter_uploaded_files, spool_upload
 
 # Create a Blueprint for deck routes
 deck_bp = Blueprint('deck_bp', __name__)
@@ -23,96 +22,107 @@ def get_decks_route():
 @deck_bp.route('/import_decks', methods=['POST'])
 def import_decks():
     """
-    Import decks from files.
+    Import decks from files as a background job.
+
+    Each uploaded file is buffered and handed to an import job, and the
+    response returns immediately with the job ID. Uploads stay in memory
+    unless they are larger than ``SPOOL_MAX_MEMORY``. Poll
+    ``/import_jobs/<job_id>`` for progress and the final result.
 
     Returns:
-        flask.Response: A JSON response containing import results.
+        flask.Response: A JSON response containing the job ID.
     """
-    import logging
-
     try:
-        if 'files' not in request.files:
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
             return jsonify({'error': '没有选择文件'})
 
-        files = request.files.getlist('files')
-        if not files or all(file.filename == '' for file in files):
+        # 导入任务在请求结束后才读取文件，所以先缓存上传的文件，大文件才写入磁盘
+        files = []
+        try:
+            for filename, chunks in iter_uploaded_files(request.stream, boundary, 'files'):
+                if filename:
+                    files.append((filename, spool_upload(chunks)))
+        except Exception:
+            close_files(f for _, f in files)
+            raise
+
+        if not files:
             return jsonify({'error': '没有选择文件'})
 
-        success_count = 0
-        total_words = 0
-        failed_files = []
-
-        for file in files:
-            # 获取词单名称（使用文件名，去掉扩展名）
-            deck_name = os.path.splitext(file.filename)[0]
-            logging.info(f"Importing deck: {deck_name}")
-
-            # 保存上传的文件到临时目录
-            temp_dir = os.path.join(os.getcwd(), 'temp')
-            file_path = os.path.join(temp_dir, f"{int(time.time())}_{file.filename}")
-            file.save(file_path)
-            logging.info(f"Saved file to {file_path}")
-
-            try:
-                # 读取单词
-                words = load_words_from_file(file_path)
-
-                if not words:
-                    logging.warning(f"No words found in file: {file.filename}")
-                    failed_files.append(f"{file.filename} (没有找到单词)")
-                    continue
-
-                logging.info(f"Found {len(words)} words in file: {file.filename}")
-
-                # 添加词单
-                deck_id = add_deck(deck_name)
-                if not deck_id:
-                    logging.error(f"Failed to create deck: {deck_name}")
-                    failed_files.append(f"{file.filename} (创建词单失败)")
-                    continue
-
-                logging.info(f"Created deck: {deck_name}, ID: {deck_id}")
-
-                # 添加单词到词单
-                if add_words_to_deck(deck_id, words):
-                    success_count += 1
-                    total_words += len(words)
-                    logging.info(f"Successfully added {len(words)} words to deck: {deck_name}")
-                else:
-                    logging.error(f"Failed to add words to deck: {deck_name}")
-                    failed_files.append(f"{file.filename} (添加单词失败)")
-            except Exception as e:
-                logging.error(f"Error importing deck {deck_name}: {str(e)}")
-                failed_files.append(f"{file.filename} (导入错误: {str(e)})")
-            finally:
-                # 清理临时文件
-                try:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        logging.info(f"Removed temporary file: {file_path}")
-                except Exception as e:
-                    logging.error(f"Error cleaning up temporary file: {str(e)}")
-
-        if success_count == 0:
-            error_message = '所有词单导入失败'
-            if failed_files:
-                error_message += f": {', '.join(failed_files)}"
-            return jsonify({'error': error_message})
-
-        response = {
-            'success_count': success_count,
-            'total_words': total_words
-        }
-
-        if failed_files:
-            response['failed_files'] = failed_files
-
-        return jsonify(response)
+        # 文件交由导入任务负责关闭
+
+        job_id = submit_import_job(files)
+        if not job_id:
+            return jsonify({'error': '导入任务过多，请稍后再试'}), 429
+
+        return jsonify({'job_id': job_id, 'status': 'queued'}), 202
 
     except Exception as e:
         logging.error(f"Unexpected error in import_decks: {str(e)}")
         return jsonify({'error': f'导入词单时发生错误: {str(e)}'})
 
+@deck_bp.route('/forecast', methods=['GET'])
+def forecast_route():
+    """
+    Get the number of reviews due on each of the next days.
+
+    Query parameters: ``deck_id`` (optional, defaults to all decks) and
+    ``days`` (defaults to 30, at most 365).
+
+    Returns:
+        flask.Response: A JSON response containing the first day, the new and
+                        overdue card counts and the daily due counts.
+    """
+    try:
+        deck_id = request.args.get('deck_id', type=int)
+        days = request.args.get('days', 30, type=int)
+        if days < 1:
+            return jsonify({'error': '预测天数必须大于0'})
+
+        forecast = get_forecast(deck_id, days)
+        if forecast is None:
+            return jsonify({'error': '词单不存在'}), 404
+
+        return jsonify(forecast)
+    except Exception as e:
+        logging.error(f"Error in forecast: {str(e)}")
+        return jsonify({'error': f'获取复习量预测时发生错误: {str(e)}'})
+
+@deck_bp.route('/import_jobs/<job_id>', methods=['GET'])
+def get_import_job_route(job_id):
+    """
+    Get the progress of an import job.
+
+    Args:
+        job_id (str): The job ID.
+
+    Returns:
+        flask.Response: A JSON response containing the job status, progress
+                        counters and, once finished, the import result.
+    """
+    job = get_import_job(job_id)
+    if not job:
+        return jsonify({'error': '导入任务不存在'}), 404
+
+    return jsonify(job)
+
+@deck_bp.route('/import_jobs/<job_id>/cancel', methods=['POST'])
+def cancel_import_job_route(job_id):
+    """
+    Cancel an import job. Words already imported are kept.
+
+    Args:
+        job_id (str): The job ID.
+
+    Returns:
+        flask.Response: A JSON response indicating success or failure.
+    """
+    if cancel_import_job(job_id):
+        return jsonify({'success': True})
+    else:
+        return jsonify({'error': '导入任务不存在或已结束'})
+
 @deck_bp.route('/delete_deck', methods=['POST'])
 def delete_deck_route():
     """
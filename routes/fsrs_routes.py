@@ -1,10 +1,23 @@
 from flask import Blueprint, jsonify, request
-from models.fsrs import update_fsrs_data
+from models.fsrs import (
+    update_fsrs_data, update_fsrs_batch, reschedule_deck,
+    list_fsrs_parameters, activate_fsrs_parameters, deactivate_fsrs_parameters
+)
+from models.retention_jobs import (
+    MAX_SIMULATED_DAYS, MAX_SIMULATED_LEARNERS,
+    submit_retention_job, get_retention_job, get_latest_retention, cancel_retention_job
+)
 import logging
 
 # Create a Blueprint for FSRS routes
 fsrs_bp = Blueprint('fsrs_bp', __name__)
 
+# 每次请求都会执行的日志使用模块日志器，可以按日志器采样（见 utils.log_utils）
+logger = logging.getLogger(__name__)
+
+# 单次批量提交的最大评分数
+MAX_BATCH_REVIEWS = 500
+
 @fsrs_bp.route('/update_fsrs', methods=['POST'])
 def update_fsrs():
     """
@@ -15,7 +28,7 @@ def update_fsrs():
     """
     try:
         data = request.json
-        logging.info(f"Received update_fsrs request: {data}")
+        logger.info("Received update_fsrs request: %s", data)
         
         record_id = data.get('record_id')
         difficulty = data.get('difficulty')
@@ -36,7 +49,7 @@ def update_fsrs():
         
         # 更新FSRS数据
         if update_fsrs_data(record_id, difficulty, deck_id):
-            logging.info(f"Successfully updated FSRS data for record {record_id} in deck {deck_id}")
+            logger.info("Successfully updated FSRS data for record %s in deck %s", record_id, deck_id)
             return jsonify({'success': True})
         else:
             logging.error(f"Failed to update FSRS data for record {record_id} in deck {deck_id}")
@@ -44,3 +57,218 @@ def update_fsrs():
     except Exception as e:
         logging.error(f"Error in update_fsrs: {str(e)}")
         return jsonify({'error': f'更新FSRS数据时发生错误: {str(e)}'})
+
+@fsrs_bp.route('/update_fsrs_batch', methods=['POST'])
+def update_fsrs_batch_route():
+    """
+    Update FSRS data for a batch of reviews in one transaction.
+
+    The request body is ``{"reviews": [...]}``, an ordered list of objects with
+    ``deck_id``, ``record_id``, ``rating`` and ``reviewed_at``.
+
+    Returns:
+        flask.Response: A JSON response containing one result per review.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        reviews = data.get('reviews')
+
+        # 检查参数
+        if not isinstance(reviews, list) or not reviews:
+            return jsonify({'error': '缺少评分记录'})
+
+        if len(reviews) > MAX_BATCH_REVIEWS:
+            return jsonify({'error': f'单次最多提交{MAX_BATCH_REVIEWS}条评分记录'})
+
+        if not all(isinstance(review, dict) for review in reviews):
+            return jsonify({'error': '评分记录格式错误'})
+
+        results = update_fsrs_batch(reviews)
+        if results is None:
+            return jsonify({'error': '更新FSRS数据失败'})
+
+        return jsonify({
+            'success': all(result.get('success') for result in results),
+            'results': results
+        })
+    except Exception as e:
+        logging.error(f"Error in update_fsrs_batch: {str(e)}")
+        return jsonify({'error': f'更新FSRS数据时发生错误: {str(e)}'})
+
+@fsrs_bp.route('/reschedule_deck', methods=['POST'])
+def reschedule_deck_route():
+    """
+    Recompute the schedule of every card in a deck with the current FSRS parameters.
+
+    Returns:
+        flask.Response: A JSON response containing the number of rescheduled cards.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        deck_id = data.get('deck_id')
+        if not deck_id:
+            return jsonify({'error': '缺少词单ID'})
+
+        changed = reschedule_deck(int(deck_id))
+        if changed is None:
+            return jsonify({'error': '重新安排复习时间失败'})
+
+        return jsonify({'success': True, 'rescheduled': changed})
+    except Exception as e:
+        logging.error(f"Error in reschedule_deck: {str(e)}")
+        return jsonify({'error': f'重新安排复习时间时发生错误: {str(e)}'})
+
+def _simulation_settings(values):
+    """
+    Read and check the settings of a retention simulation.
+
+    Args:
+        values (dict): ``deck_id`` and optionally ``learners``, ``days`` and ``new_per_day``.
+
+    Returns:
+        tuple or None: ``(deck_id, learners, days, new_per_day)``, or None if a value is invalid.
+    """
+    try:
+        deck_id = int(values.get('deck_id'))
+        learners = int(values.get('learners', 200))
+        days = int(values.get('days', 365))
+        new_per_day = int(values.get('new_per_day', 20))
+    except (TypeError, ValueError):
+        return None
+
+    if not 0 < learners <= MAX_SIMULATED_LEARNERS or not 0 < days <= MAX_SIMULATED_DAYS or new_per_day < 0:
+        return None
+    return deck_id, learners, days, new_per_day
+
+@fsrs_bp.route('/optimal_retention', methods=['POST'])
+def start_optimal_retention_route():
+    """
+    Simulate a deck with a range of target retentions as a background job.
+
+    The request body contains ``deck_id``, and optionally ``learners`` (default
+    200), ``days`` (default 365) and ``new_per_day`` (default 20). Poll
+    ``/retention_jobs/<job_id>`` for progress and the result.
+
+    Returns:
+        flask.Response: A JSON response containing the job ID.
+    """
+    try:
+        settings = _simulation_settings(request.get_json(silent=True) or {})
+        if settings is None:
+            return jsonify({'error': '模拟参数超出范围'}), 400
+
+        job_id = submit_retention_job(*settings)
+        if not job_id:
+            return jsonify({'error': '模拟任务过多，请稍后再试'}), 429
+
+        return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+    except Exception as e:
+        logging.error(f"Error in optimal_retention: {str(e)}")
+        return jsonify({'error': f'模拟记忆保持率时发生错误: {str(e)}'})
+
+@fsrs_bp.route('/optimal_retention', methods=['GET'])
+def get_optimal_retention_route():
+    """
+    Get the latest simulation result of a deck under its current FSRS parameters.
+
+    Query parameters are the same as for starting a simulation with POST.
+
+    Returns:
+        flask.Response: A JSON response containing the finished job with the
+                        optimal retention and the simulated review load and
+                        retention of every target.
+    """
+    try:
+        settings = _simulation_settings(request.args)
+        if settings is None:
+            return jsonify({'error': '模拟参数超出范围'}), 400
+
+        job = get_latest_retention(*settings)
+        if not job:
+            return jsonify({'error': '还没有模拟结果'}), 404
+
+        return jsonify(job)
+    except Exception as e:
+        logging.error(f"Error in optimal_retention: {str(e)}")
+        return jsonify({'error': f'获取模拟结果时发生错误: {str(e)}'})
+
+@fsrs_bp.route('/retention_jobs/<job_id>', methods=['GET'])
+def get_retention_job_route(job_id):
+    """
+    Get the progress of a simulation job.
+
+    Args:
+        job_id (str): The job ID.
+
+    Returns:
+        flask.Response: A JSON response containing the job status, progress
+                        and, once finished, the simulation result.
+    """
+    job = get_retention_job(job_id)
+    if not job:
+        return jsonify({'error': '模拟任务不存在'}), 404
+
+    return jsonify(job)
+
+@fsrs_bp.route('/retention_jobs/<job_id>/cancel', methods=['POST'])
+def cancel_retention_job_route(job_id):
+    """
+    Cancel a simulation job.
+
+    Args:
+        job_id (str): The job ID.
+
+    Returns:
+        flask.Response: A JSON response indicating success or failure.
+    """
+    if cancel_retention_job(job_id):
+        return jsonify({'success': True})
+    else:
+        return jsonify({'error': '模拟任务不存在或已结束'})
+
+@fsrs_bp.route('/fsrs_parameters', methods=['GET'])
+def list_fsrs_parameters_route():
+    """
+    List the stored FSRS parameter sets.
+
+    Query parameters:
+        deck_id (int, optional): Only list the sets of this deck and the global sets.
+
+    Returns:
+        flask.Response: A JSON response containing the parameter sets.
+    """
+    try:
+        return jsonify(list_fsrs_parameters(request.args.get('deck_id', type=int)))
+    except Exception as e:
+        logging.error(f"Error listing FSRS parameters: {str(e)}")
+        return jsonify({'error': f'获取FSRS参数时发生错误: {str(e)}'})
+
+@fsrs_bp.route('/fsrs_parameters/<int:parameter_id>/activate', methods=['POST'])
+def activate_fsrs_parameters_route(parameter_id):
+    """
+    Activate an FSRS parameter set. Takes effect from the next review.
+
+    Args:
+        parameter_id (int): The ID of the parameter set.
+
+    Returns:
+        flask.Response: A JSON response indicating success or failure.
+    """
+    if activate_fsrs_parameters(parameter_id):
+        return jsonify({'success': True})
+    else:
+        return jsonify({'error': '启用FSRS参数失败'})
+
+@fsrs_bp.route('/fsrs_parameters/deactivate', methods=['POST'])
+def deactivate_fsrs_parameters_route():
+    """
+    Deactivate the active parameter set of a deck, or the global one.
+
+    Returns:
+        flask.Response: A JSON response indicating success or failure.
+    """
+    data = request.get_json(silent=True) or {}
+    if deactivate_fsrs_parameters(data.get('deck_id')):
+        return jsonify({'success': True})
+    else:
+        return jsonify({'error': '停用FSRS参数失败'})
@@ -0,0 +1,58 @@
+from flask import Blueprint, Response, g, request
+import time
+from models.due_cache import due_cache
+from models.forecast import forecast_cache
+from models.previews import preview_cache
+from utils import metrics
+
+# Create a Blueprint for the metrics endpoint
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+REQUEST_SECONDS = metrics.histogram(
+    'nekowords_http_request_seconds', 'Latency of HTTP requests, by route, method and status code.',
+    ('route', 'method', 'status')
+)
+
+def _cache_metric(key):
+    def collect():
+        due = due_cache.stats()
+        return [
+            (('due',), due[key]),
+            (('preview',), getattr(preview_cache, key)),
+            (('forecast',), getattr(forecast_cache, key))
+        ]
+    return collect
+
+metrics.collector('nekowords_cache_hits_total', 'Cache hits, by cache.', 'counter', ('cache',), _cache_metric('hits'))
+metrics.collector('nekowords_cache_misses_total', 'Cache misses, by cache.', 'counter', ('cache',), _cache_metric('misses'))
+metrics.collector(
+    'nekowords_due_cache_records', 'FSRS records held in the due-queue cache.', 'gauge', (),
+    lambda: [((), due_cache.stats()['records'])]
+)
+
+@metrics_bp.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@metrics_bp.after_app_request
+def record_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # 以路由规则而不是实际路径作为标签，避免标签数量无限增长
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route, request.method, response.status_code)
+    return response
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics_route():
+    """
+    Expose request latency, query timing, database writer, import and cache
+    metrics in the Prometheus text format.
+
+    Under ``flask serve`` the metrics of all worker processes are added up,
+    see ``utils.metrics.enable_multiprocess``.
+
+    Returns:
+        flask.Response: The metrics of this process, or of all workers.
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -1,4 +1,5 @@
 from flask import Blueprint, jsonify, request
+import logging
 from models.srs import update_srs_data
 
 # Create a Blueprint for SRS routes
@@ -12,8 +13,6 @@ def update_srs():
     Returns:
         flask.Response: A JSON response indicating success or failure.
     """
-    import logging
-
     try:
         data = request.json
         logging.info(f"Received update_srs request: {data}")
@@ -1,10 +1,35 @@
 from flask import Blueprint, jsonify, request, send_file
+import logging
 import tempfile
-from models.word import get_deck_words
+from models.word import get_deck_words, get_due_words
+from models.due_cache import due_cache, verify_due_cache
 
 # Create a Blueprint for word routes
 word_bp = Blueprint('word_bp', __name__)
 
+# 每次请求都会执行的日志使用模块日志器，可以按日志器采样（见 utils.log_utils）
+logger = logging.getLogger(__name__)
+
+# 单次请求最多返回的题目数
+MAX_REVIEW_LIMIT = 500
+
+def _parse_limit(data):
+    """
+    Read the batch size of a review request.
+
+    Args:
+        data (dict): The request body.
+
+    Returns:
+        int or None: The ``limit`` (default 20) clamped to 1..``MAX_REVIEW_LIMIT``,
+                     or None if it is not an integer.
+    """
+    try:
+        limit = int(data.get('limit', 20))
+    except (TypeError, ValueError):
+        return None
+    return max(1, min(limit, MAX_REVIEW_LIMIT))
+
 @word_bp.route('/get_deck_words', methods=['POST'])
 def get_deck_words_route():
     """
@@ -13,22 +38,27 @@ def get_deck_words_route():
     Returns:
         flask.Response: A JSON response containing word information.
     """
-    import logging
-
     try:
         deck_id = request.json.get('deck_id')
         if not deck_id:
             return jsonify({'error': '缺少词单ID'})
 
         # 获取批次大小参数
-        limit = request.json.get('limit', 20)
+        limit = _parse_limit(request.json)
+        if limit is None:
+            return jsonify({'error': '批次大小必须是整数'}), 400
 
-        logging.info(f"Getting deck words for deck {deck_id} with limit {limit}")
+        # 获取排序方式：due（按到期时间）或 retrievability（按当前可提取性）
+        order = request.json.get('order', 'due')
+        if order not in ('due', 'retrievability'):
+            return jsonify({'error': '不支持的排序方式'})
+
+        logger.info("Getting deck words for deck %s with limit %s, order %s", deck_id, limit, order)
 
         # 获取需要复习的题目
-        questions = get_deck_words(deck_id, limit)
+        questions = get_deck_words(deck_id, limit, order)
 
-        logging.info(f"Found {len(questions)} questions for review")
+        logger.info("Found %d questions for review", len(questions))
 
         # 返回题目
         return jsonify(questions)
@@ -36,6 +66,62 @@ def get_deck_words_route():
         logging.error(f"Error getting deck words: {str(e)}")
         return jsonify({'error': f'获取词单单词时发生错误: {str(e)}'})
 
+@word_bp.route('/get_due_words', methods=['POST'])
+def get_due_words_route():
+    """
+    Get the most urgent words to review across all decks.
+
+    Returns:
+        flask.Response: A JSON response containing word information. Each question
+                        has the ``deck_id`` to submit its review to.
+    """
+    try:
+        # 获取批次大小参数，限制为 1 到 MAX_REVIEW_LIMIT，每个词单最多读取 limit 条
+        limit = _parse_limit(request.get_json(silent=True) or {})
+        if limit is None:
+            return jsonify({'error': '批次大小必须是整数'}), 400
+
+        logger.info("Getting due words across all decks with limit %s", limit)
+
+        questions = get_due_words(limit)
+
+        logger.info("Found %d questions for review across all decks", len(questions))
+
+        return jsonify(questions)
+    except Exception as e:
+        logging.error(f"Error getting due words: {str(e)}")
+        return jsonify({'error': f'获取待复习单词时发生错误: {str(e)}'})
+
+@word_bp.route('/due_cache/verify', methods=['GET'])
+def verify_due_cache_route():
+    """
+    Compare the due-queue cache of this process with the database.
+
+    Query parameters:
+        deck_id (int, optional, repeatable): The decks to check. Defaults to all cached decks.
+
+    Returns:
+        flask.Response: A JSON response containing the differences per deck and cache counters.
+    """
+    try:
+        deck_ids = request.args.getlist('deck_id', type=int) or None
+        report = verify_due_cache(deck_ids)
+        consistent = all(
+            not deck.get('error') and not deck.get('missing') and not deck.get('extra') and not deck.get('mismatched')
+            for deck in report.values()
+        )
+        if not consistent:
+            logging.warning(f"Due cache differs from the database: {report}")
+
+        return jsonify({
+            'consistent': consistent,
+            'decks': {str(deck_id): deck for deck_id, deck in report.items()},
+            'stats': due_cache.stats()
+        })
+    except Exception as e:
+        logging.error(f"Error verifying due cache: {str(e)}")
+        return jsonify({'error': f'校验复习队列缓存时发生错误: {str(e)}'})
+
 @word_bp.route('/export_wrong_answers', methods=['POST'])
 def export_wrong_answers():
     """
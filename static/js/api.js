@@ -83,6 +83,30 @@ export async function updateFSRSData(recordId, difficulty, deckId) {
     }
 }
 
+/**
+ * Submit a batch of ratings to the server in one request
+ *
+ * @param {Array} reviews - Ordered review objects with deck_id, record_id, rating and reviewed_at
+ * @param {boolean} [keepalive=false] - Let the request outlive the page (used when leaving it)
+ * @returns {Promise<Object>} - Promise resolving to a response object with one result per review
+ */
+export async function updateFSRSBatch(reviews, keepalive = false) {
+    try {
+        const response = await fetch('/update_fsrs_batch', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ reviews: reviews }),
+            keepalive: keepalive
+        });
+        return await response.json();
+    } catch (error) {
+        console.error('批量更新FSRS数据失败:', error);
+        throw new Error('更新FSRS数据失败，请重试');
+    }
+}
+
 /**
  * Delete a deck on the server
  *
@@ -105,13 +129,20 @@ export async function deleteDeck(deckId) {
     }
 }
 
+// 导入任务进度的轮询间隔（毫秒）
+const IMPORT_POLL_INTERVAL = 500;
+
 /**
  * Import decks from files
  *
+ * The server imports the files in a background job; this polls the job until
+ * it has finished and resolves to the import result.
+ *
  * @param {FileList} files - Files to import
+ * @param {Function} [onProgress] - Called with the job state on every poll
  * @returns {Promise<Object>} - Promise resolving to a response object
  */
-export async function importDecks(files) {
+export async function importDecks(files, onProgress) {
     try {
         const formData = new FormData();
         for (const file of files) {
@@ -122,13 +153,59 @@ export async function importDecks(files) {
             method: 'POST',
             body: formData
         });
-        return await response.json();
+        const data = await response.json();
+        if (!data.job_id) {
+            return data;
+        }
+
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, IMPORT_POLL_INTERVAL));
+            const job = await getImportJob(data.job_id);
+            if (job.error) {
+                return job;
+            }
+            if (onProgress) {
+                onProgress(job);
+            }
+            if (job.result) {
+                return job.result;
+            }
+        }
     } catch (error) {
         console.error('导入词单失败:', error);
         throw new Error('导入词单失败，请重试');
     }
 }
 
+/**
+ * Get the progress of an import job
+ *
+ * @param {string} jobId - ID of the import job
+ * @returns {Promise<Object>} - Promise resolving to the job state
+ */
+export async function getImportJob(jobId) {
+    const response = await fetch(`/import_jobs/${jobId}`);
+    return await response.json();
+}
+
+/**
+ * Cancel an import job
+ *
+ * @param {string} jobId - ID of the import job
+ * @returns {Promise<Object>} - Promise resolving to a response object
+ */
+export async function cancelImportJob(jobId) {
+    try {
+        const response = await fetch(`/import_jobs/${jobId}/cancel`, {
+            method: 'POST'
+        });
+        return await response.json();
+    } catch (error) {
+        console.error('取消导入失败:', error);
+        throw new Error('取消导入失败，请重试');
+    }
+}
+
 /**
  * Export wrong answers to a CSV file
  *
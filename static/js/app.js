@@ -4,7 +4,7 @@
 
 import { loadAndRenderDecks, handleFileUpload } from './deck.js';
 import { showHomeScreen } from './ui.js';
-import { resetFlashcardState, flipFlashcard, getFlashcardState, handleDifficultyRating } from './flashcard.js';
+import { resetFlashcardState, flipFlashcard, getFlashcardState, handleDifficultyRating, flushPendingReviews } from './flashcard.js';
 import { resetQuizState, exportWrongAnswers } from './quiz.js';
 
 // Current mode ('input' or 'flashcard')
@@ -155,7 +155,10 @@ function handleModeChange(e) {
 /**
  * Go back to home screen
  */
-function backToHome() {
+async function backToHome() {
+    // 提交尚未提交的评分，使词单统计是最新的
+    await flushPendingReviews();
+
     // Reset state
     resetFlashcardState();
     resetQuizState();
@@ -113,7 +113,15 @@ export async function handleFileUpload(event) {
             throw new Error(response.error);
         }
 
-        alert(`成功导入 ${response.success_count} 个词单，共 ${response.total_words} 个单词`);
+        let message = `成功导入 ${response.success_count} 个词单，共 ${response.total_words} 个单词`;
+        if (response.parse_errors && response.parse_errors.length > 0) {
+            const details = response.parse_errors
+                .slice(0, 5)
+                .map(error => `${error.file} 第${error.line}行: ${error.error}`)
+                .join('\n');
+            message += `\n\n以下行无法解析，已跳过:\n${details}`;
+        }
+        alert(message);
         event.target.value = ''; // 清空文件选择
         await loadAndRenderDecks();
     } catch (error) {
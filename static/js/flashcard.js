@@ -2,7 +2,7 @@
  * Flashcard mode functionality
  */
 
-import { loadDeckWords, updateFSRSData } from './api.js';
+import { loadDeckWords, updateFSRSBatch } from './api.js';
 import { showFlashcardScreen, showHomeScreen } from './ui.js';
 
 // State variables
@@ -14,6 +14,11 @@ let currentQuestionIndex = 0;
 let isLoadingQuestions = false;
 let isProcessingDifficulty = false;
 
+// 尚未提交的评分，攒够一批或需要最新复习数据时一次性提交
+const REVIEW_BATCH_SIZE = 10;
+let pendingReviews = [];
+let flushPromise = null;
+
 /**
  * Start flashcard mode with a specific deck
  *
@@ -141,6 +146,8 @@ export async function nextFlashcard() {
     // 如果已经显示完当前批次的所有题目，重新加载题目
     if (currentQuestionIndex >= allQuestions.length) {
         console.log('All current questions shown, loading new questions...');
+        // 先提交评分，保证新加载的题目基于最新的复习时间
+        await flushPendingReviews();
         await loadQuestions();
 
         // 如果加载后仍然没有题目，则结束学习
@@ -226,6 +233,7 @@ export function flipFlashcard() {
 
         const difficultyButtons = document.getElementById('difficultyButtons');
         if (difficultyButtons) {
+            showIntervalPreviews(difficultyButtons);
             difficultyButtons.style.visibility = 'visible';
         }
 
@@ -233,6 +241,41 @@ export function flipFlashcard() {
     }
 }
 
+/**
+ * Show the interval each rating would schedule, as computed by the server
+ *
+ * @param {HTMLElement} container - Element containing the difficulty buttons
+ */
+function showIntervalPreviews(container) {
+    const previews = currentQuestion?.fsrs_info?.previews || {};
+
+    container.querySelectorAll('.difficulty-btn').forEach(btn => {
+        // 按钮文字用作评分，不能修改，间隔显示在提示中
+        const label = btn.textContent.replace(/\([A-D]\)$/, '').trim();
+        const preview = previews[label];
+        btn.title = preview ? `${formatInterval(preview.scheduled_days)}后复习` : '';
+    });
+}
+
+/**
+ * Format an interval in days for display
+ *
+ * @param {number} days - Interval in days
+ * @returns {string} - Formatted interval
+ */
+function formatInterval(days) {
+    if (days < 1) {
+        return '马上';
+    }
+    if (days < 30) {
+        return `${days}天`;
+    }
+    if (days < 365) {
+        return `${Math.round(days / 30)}个月`;
+    }
+    return `${(days / 365).toFixed(1)}年`;
+}
+
 // 用于防止重复处理的标志
 // isProcessingDifficulty 已在文件顶部声明
 
@@ -263,13 +306,17 @@ export async function handleDifficultyRating(e) {
 
         const recordId = currentQuestion.fsrs_info.record_id;
 
-        // Save FSRS data to server
-        try {
-            const response = await updateFSRSData(recordId, difficulty, currentDeckId);
-            console.log('FSRS data update response:', response);
+        // 记录评分，攒够一批后再提交到服务器
+        pendingReviews.push({
+            deck_id: currentDeckId,
+            record_id: recordId,
+            rating: difficulty,
+            reviewed_at: Date.now()
+        });
 
-            if (response.error) {
-                throw new Error(response.error);
+        try {
+            if (pendingReviews.length >= REVIEW_BATCH_SIZE) {
+                flushPendingReviews();
             }
 
             await nextFlashcard(); // 使用await等待nextFlashcard完成
@@ -294,6 +341,51 @@ export function getFlashcardState() {
     return flashcardState;
 }
 
+/**
+ * Submit all pending ratings in one batch
+ *
+ * Ratings the server could not be reached for are put back in the queue and
+ * sent with the next batch.
+ *
+ * @param {boolean} [keepalive=false] - Let the request outlive the page
+ * @returns {Promise<void>} - Promise resolving when the batch has been submitted
+ */
+export async function flushPendingReviews(keepalive = false) {
+    // 等待正在进行的提交，保证评分按顺序到达服务器
+    while (flushPromise) {
+        await flushPromise;
+    }
+
+    if (pendingReviews.length === 0) {
+        return;
+    }
+
+    const reviews = pendingReviews;
+    pendingReviews = [];
+
+    flushPromise = (async () => {
+        try {
+            const response = await updateFSRSBatch(reviews, keepalive);
+            console.log('FSRS batch update response:', response);
+
+            if (response.error) {
+                throw new Error(response.error);
+            }
+
+            response.results
+                .filter(result => result.error)
+                .forEach(result => console.error(`Failed to update FSRS record ${result.record_id}:`, result.error));
+        } catch (error) {
+            console.error('Failed to update FSRS data:', error);
+            pendingReviews = reviews.concat(pendingReviews);
+        } finally {
+            flushPromise = null;
+        }
+    })();
+
+    await flushPromise;
+}
+
 /**
  * Reset flashcard mode state
  */
@@ -305,3 +397,10 @@ export function resetFlashcardState() {
     currentQuestionIndex = 0;
     isLoadingQuestions = false;
 }
+
+// 离开页面时提交剩余的评分
+if (typeof window !== 'undefined') {
+    window.addEventListener('pagehide', () => {
+        flushPendingReviews(true);
+    });
+}
@@ -1,44 +1,230 @@
-def load_words_from_file(file_path):
+import codecs
+import csv
+import io
+import re
+from itertools import chain
+from utils.upload_utils import iter_text_lines
+
+# 每次从文件中读取的字节数
+FILE_CHUNK_SIZE = 64 * 1024
+
+# 用于识别编码和分隔符的样本大小（字节）
+SNIFF_SIZE = 64 * 1024
+
+# 支持的分隔符，按优先级排列
+DELIMITERS = [',', '\t', ';', '|']
+
+# 全部由平假名或片假名组成
+KANA_RE = re.compile(r'[\u3040-\u309F\u30A0-\u30FF]*')
+
+# 最多保留的行错误数
+MAX_REPORTED_ERRORS = 100
+
+# 每个解析任务的行数
+PARSE_BATCH_LINES = 10000
+
+def detect_encoding(sample):
     """
-    Load words from a file.
-    
+    Detect the text encoding of a file from its first bytes.
+
     Args:
-        file_path (str): The path to the file.
-        
+        sample (bytes): The beginning of the file.
+
     Returns:
-        list: A list of dictionaries containing word information.
+        str: 'utf-16' or 'utf-8-sig' if the sample starts with a BOM, 'utf-8' if
+             it decodes as UTF-8, otherwise 'gb18030' (common for files saved by
+             Excel on Chinese systems).
     """
-    words = []
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            # 跳过第一行（表头）
-            next(f)
-            
-            for line in f:
-                line = line.strip()
-                if not line:  # 跳过空行
-                    continue
-                
-                # 尝试不同的分隔符
-                for sep in [',', '\t', ';', '|']:
-                    parts = line.split(sep)
-                    if len(parts) >= 2:  # 至少需要日文和中文
-                        japanese = parts[0].strip()
-                        chinese = parts[1].strip()
-                        
-                        # 检查是否为全假名单词
-                        is_kana = all(0x3040 <= ord(c) <= 0x309F or 0x30A0 <= ord(c) <= 0x30FF for c in japanese)
-                        
-                        # 如果有第三列，则认为是假名
-                        kana = parts[2].strip() if len(parts) >= 3 else japanese
-                        
-                        words.append({
-                            'japanese': japanese,
-                            'kana': kana,
-                            'chinese': chinese,
-                            'is_kana': is_kana
-                        })
-                        break
-    except Exception as e:
-        print(f"Error reading file {file_path}: {str(e)}")
-    return words
+        # 样本末尾可能截断了一个多字节字符，所以不作为最终输入解码
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'gb18030'
+
+def detect_delimiter(text):
+    """
+    Detect the column delimiter of a word list from a text sample.
+
+    Args:
+        text (str): The beginning of the file, decoded.
+
+    Returns:
+        str: One of ``DELIMITERS``. Defaults to ',' if nothing matches.
+    """
+    try:
+        return csv.Sniffer().sniff(text, delimiters=''.join(DELIMITERS)).delimiter
+    except csv.Error:
+        pass
+
+    # 识别失败时，选择出现在最多行中的分隔符
+    lines = [line for line in text.splitlines()[:50] if line.strip()]
+    counts = [sum(1 for line in lines if delimiter in line) for delimiter in DELIMITERS]
+    best = max(range(len(DELIMITERS)), key=lambda i: (counts[i], -i))
+    return DELIMITERS[best] if counts[best] else ','
+
+class WordFileParser:
+    """
+    Incremental parser for word list files.
+
+    The encoding and delimiter are detected once from the first bytes of the
+    file. ``iter_batches`` then splits the file into batches of whole records,
+    which ``parse_word_batch`` turns into rows, possibly in a process pool.
+    Each data row needs Japanese and Chinese columns and may have a third kana
+    column. The first record is a header and is skipped.
+
+    Rows that cannot be used are reported in ``errors`` as dictionaries with
+    the line number, an error message and the raw row, once the batch results
+    are passed to ``add_batch``.
+    """
+
+    def __init__(self, max_errors=MAX_REPORTED_ERRORS):
+        self.max_errors = max_errors
+        self.encoding = None
+        self.delimiter = None
+        self.row_count = 0
+        self.error_count = 0
+        self.errors = []
+
+    def iter_batches(self, chunks, batch_lines=PARSE_BATCH_LINES):
+        """
+        Split a word list into batches of whole records.
+
+        Quoted fields may span lines, so a batch only ends after a line where
+        the quotes read so far are balanced.
+
+        Args:
+            chunks (iterable): The file content as byte chunks.
+            batch_lines (int, optional): Number of lines per batch.
+
+        Returns:
+            generator: ``(first_line, text)`` pairs, where ``first_line`` is the
+                       line number of the first line of ``text``. Parse them with
+                       ``parse_word_batch`` using ``delimiter``.
+        """
+        chunks = iter(chunks)
+
+        # 读取样本，识别编码和分隔符
+        sample = b''
+        for chunk in chunks:
+            sample += chunk
+            if len(sample) >= SNIFF_SIZE:
+                break
+        if not sample:
+            return
+
+        self.encoding = detect_encoding(sample)
+        sample_text = codecs.getincrementaldecoder(self.encoding)(errors='ignore').decode(sample)
+        self.delimiter = detect_delimiter(sample_text)
+
+        lines = iter_text_lines(chain([sample], chunks), self.encoding, newline='')
+
+        batch = []
+        first_line = 1
+        in_quotes = False
+        header = True
+        for line_number, line in enumerate(lines, 1):
+            batch.append(line)
+            if line.count('"') % 2:
+                in_quotes = not in_quotes
+            if in_quotes:
+                continue
+
+            if header:
+                # 跳过第一条记录（表头）
+                header = False
+            elif len(batch) < batch_lines:
+                continue
+            else:
+                yield first_line, ''.join(batch)
+            batch = []
+            first_line = line_number + 1
+
+        if batch and not header:
+            yield first_line, ''.join(batch)
+
+    def add_batch(self, result):
+        """
+        Collect the row count and errors of a parsed batch.
+
+        Args:
+            result (dict): The result of ``parse_word_batch``.
+        """
+        self.row_count += len(result['rows'])
+        self.error_count += result['error_count']
+        self.errors.extend(result['errors'][:self.max_errors - len(self.errors)])
+
+def parse_word_batch(text, delimiter, first_line=1, max_errors=MAX_REPORTED_ERRORS):
+    """
+    Parse a batch of word list records from ``WordFileParser.iter_batches``.
+
+    This is a plain module-level function so it can run in a process pool.
+
+    Args:
+        text (str): Whole records, without the header.
+        delimiter (str): The column delimiter.
+        first_line (int, optional): The line number of the first line of ``text``.
+        max_errors (int, optional): Maximum number of row errors to report.
+
+    Returns:
+        dict: The ``(japanese, kana, chinese, is_kana)`` rows, the row errors and
+              the total number of invalid rows.
+    """
+    rows = []
+    errors = []
+    error_count = 0
+
+    def add_error(message, row):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < max_errors:
+            errors.append({
+                'line': first_line - 1 + reader.line_num,
+                'error': message,
+                'text': delimiter.join(row)
+            })
+
+    reader = csv.reader(io.StringIO(text, newline=''), delimiter=delimiter)
+    kana_match = KANA_RE.fullmatch
+
+    for row in reader:
+        if len(row) < 2:
+            if row and row[0].strip():
+                add_error('至少需要日文和中文两列', row)
+            continue  # 跳过空行
+
+        japanese = row[0].strip()
+        chinese = row[1].strip()
+        if not japanese or not chinese:
+            if japanese or chinese or any(column.strip() for column in row[2:]):
+                add_error('日文或中文为空', row)
+            continue
+
+        # 如果有第三列，则认为是假名
+        kana = row[2].strip() if len(row) >= 3 else ''
+
+        rows.append((japanese, kana or japanese, chinese, kana_match(japanese) is not None))
+
+    return {'rows': rows, 'errors': errors, 'error_count': error_count}
+
+def iter_file_chunks(f, chunk_size=FILE_CHUNK_SIZE):
+    """
+    Read a binary file object as byte chunks, up to the end of the file.
+
+    Args:
+        f (file-like): The file, opened in binary mode.
+        chunk_size (int, optional): Number of bytes per chunk.
+
+    Returns:
+        generator: Byte chunks of the file.
+    """
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
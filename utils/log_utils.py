@@ -0,0 +1,170 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+from utils import metrics
+
+# 日志格式
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 日志文件轮转大小（字节）和保留的旧文件数
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# 日志队列长度上限，队列满时丢弃新日志而不是阻塞请求
+LOG_QUEUE_SIZE = 10000
+
+# 热点路径日志器的采样率：每个调用位置每 N 条 INFO 及以下级别的日志保留 1 条
+LOG_SAMPLE_EVERY = {
+    'models.fsrs': 10,
+    'routes.fsrs_routes': 10,
+    'routes.word_routes': 10
+}
+
+DROPPED_RECORDS = metrics.counter('nekowords_log_dropped_total', 'Log records dropped because the log queue was full.')
+SAMPLED_OUT_RECORDS = metrics.counter(
+    'nekowords_log_sampled_out_total', 'Log records skipped by sampling, by logger.', ('logger',)
+)
+
+_listener = None
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep one of every N records below WARNING from each call site of the
+    configured loggers.
+
+    The first record of a call site is always kept, so rare messages are not
+    lost; warnings and errors are never sampled.
+    """
+
+    def __init__(self, sample_every):
+        """
+        Args:
+            sample_every (dict): Sampling interval N by logger name.
+        """
+        super().__init__()
+        self.sample_every = dict(sample_every)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        every = self.sample_every.get(record.name, 1)
+        if every <= 1:
+            return True
+
+        key = (record.name, record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+
+        if count % every == 0:
+            return True
+        SAMPLED_OUT_RECORDS.inc(1, record.name)
+        return False
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A queue handler that never blocks the logging thread.
+
+    Records are put on a bounded queue without waiting and dropped (and
+    counted) when it is full. Unlike ``QueueHandler``, records are not
+    formatted here: the message, arguments and traceback are formatted by the
+    handlers on the listener thread, so log arguments must not be mutated
+    after the call.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_RECORDS.inc()
+
+def setup_logging(level=logging.INFO, log_file='app.log', max_bytes=LOG_MAX_BYTES,
+                  backup_count=LOG_BACKUP_COUNT, sample_every=LOG_SAMPLE_EVERY):
+    """
+    Send log records through a queue to a listener thread that writes them to
+    the console and a size-rotated log file.
+
+    Calling it again replaces the previous configuration.
+
+    Args:
+        level (int, optional): The root log level. Defaults to INFO.
+        log_file (str, optional): The log file path, or None to log to the console
+                                  only. Defaults to 'app.log'.
+        max_bytes (int, optional): Size at which the log file is rotated.
+        backup_count (int, optional): Number of rotated files to keep.
+        sample_every (dict, optional): Sampling interval by logger name, see ``SamplingFilter``.
+
+    Returns:
+        logging.handlers.QueueListener: The running listener.
+    """
+    global _listener
+    stop_logging()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file is not None:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    # 在请求线程中先采样，被丢弃的日志不会入队也不会被格式化
+    queue_handler.addFilter(SamplingFilter(sample_every))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def setup_console_logging(level=logging.INFO):
+    """
+    Log straight to the console, without a queue or listener thread.
+
+    Used by a pre-forking server's master process, which must not carry a
+    listener thread into its workers but still logs (e.g. the background
+    integrity check). Stops the queue listener if one is running.
+
+    Args:
+        level (int, optional): The root log level. Defaults to INFO.
+    """
+    stop_logging()
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+        old_handler.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+
+def stop_logging():
+    """
+    Write out the queued log records and stop the listener thread.
+    """
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+# 退出前写完队列中的日志
+atexit.register(stop_logging)
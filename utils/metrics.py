@@ -0,0 +1,379 @@
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+# 延迟直方图的默认分桶上限（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 多进程模式下工作进程写入指标快照的间隔（秒）
+SNAPSHOT_SECONDS = 5
+
+# 多进程模式下保存各工作进程指标快照的目录，None 表示只导出本进程的指标
+_snapshot_dir = None
+_snapshot_lock = threading.Lock()
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+class Counter:
+    """
+    A monotonically increasing counter, optionally split by labels.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text.
+            labelnames (tuple, optional): Names of the labels.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        """
+        Increase the counter.
+
+        Args:
+            amount (float, optional): The increment. Defaults to 1.
+            *labels: One value per label name.
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self.labelnames, labels, value) for labels, value in sorted(values)]
+
+class Histogram:
+    """
+    A histogram of observed values with fixed bucket bounds, optionally split by labels.
+
+    Observing a value is a binary search and a few additions under a lock,
+    cheap enough for every query and request.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text.
+            labelnames (tuple, optional): Names of the labels.
+            buckets (tuple, optional): Sorted upper bounds of the buckets, without ``+Inf``.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        """
+        Record an observation.
+
+        Args:
+            value (float): The observed value.
+            *labels: One value per label name.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # 每个桶的计数（不累计），最后一个为 +Inf 桶，以及总和
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+
+        bucket_labelnames = self.labelnames + ('le',)
+        samples = []
+        for labels, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', bucket_labelnames, labels + (_format_value(bound),), cumulative))
+            samples.append((f'{self.name}_sum', self.labelnames, labels, total))
+            samples.append((f'{self.name}_count', self.labelnames, labels, cumulative))
+        return samples
+
+class Collector:
+    """
+    Metrics read from a callback at scrape time, for values that are already
+    counted elsewhere (pool, writer and cache statistics).
+    """
+
+    def __init__(self, name, documentation, type, labelnames, collect):
+        """
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text.
+            type (str): ``gauge`` or ``counter``.
+            labelnames (tuple): Names of the labels.
+            collect (callable): Returns ``(label_values, value)`` pairs.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self._collect = collect
+
+    def samples(self):
+        return [(self.name, self.labelnames, tuple(labels), value) for labels, value in self._collect()]
+
+class Registry:
+    """
+    A set of metrics rendered together in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        Add a metric, or return the already registered metric with the same name.
+
+        Args:
+            metric: A ``Counter``, ``Histogram`` or ``Collector``.
+
+        Returns:
+            The registered metric.
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def snapshot(self):
+        """
+        Read the current samples of all metrics.
+
+        Returns:
+            dict: The type, help text and ``[name, labelnames, labels, value]``
+                  samples of each metric, by metric name. Serializable as JSON.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        return {
+            metric.name: {
+                'type': metric.type,
+                'documentation': metric.documentation,
+                'samples': [
+                    [name, list(labelnames), [str(label) for label in labels], value]
+                    for name, labelnames, labels, value in metric.samples()
+                ]
+            }
+            for metric in metrics
+        }
+
+    def render(self):
+        """
+        Render all metrics.
+
+        Returns:
+            str: The metrics in the Prometheus text exposition format.
+        """
+        return _render_snapshot(self.snapshot())
+
+def _render_snapshot(snapshot):
+    lines = []
+    for metric_name, metric in snapshot.items():
+        lines.append(f'# HELP {metric_name} {metric["documentation"]}')
+        lines.append(f'# TYPE {metric_name} {metric["type"]}')
+        for name, labelnames, labels, value in metric['samples']:
+            lines.append(f'{name}{_format_labels(labelnames, labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+# 进程内共享的指标注册表
+REGISTRY = Registry()
+
+def counter(name, documentation, labelnames=()):
+    """
+    Create and register a counter.
+
+    Returns:
+        Counter: The registered counter.
+    """
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    """
+    Create and register a histogram.
+
+    Returns:
+        Histogram: The registered histogram.
+    """
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+def collector(name, documentation, type, labelnames, collect):
+    """
+    Create and register a callback metric.
+
+    Returns:
+        Collector: The registered collector.
+    """
+    return REGISTRY.register(Collector(name, documentation, type, labelnames, collect))
+
+def enable_multiprocess(directory):
+    """
+    Export the metrics of all worker processes of a pre-forking server.
+
+    Call in the master before it forks. Each worker writes a snapshot of its
+    metrics to ``directory`` (see ``start_snapshots``) and ``render`` sums the
+    snapshots, so every scrape sees the same totals whichever worker serves it.
+    Counters and histograms of exited workers are kept (see ``retire_worker``),
+    so totals never go backwards. Gauges are per process and get a ``pid``
+    label instead of being summed.
+
+    Args:
+        directory (str): An empty directory private to this server.
+    """
+    global _snapshot_dir
+    _snapshot_dir = directory
+
+def write_snapshot():
+    """
+    Write the snapshot of this process in multiprocess mode; does nothing otherwise.
+    """
+    if _snapshot_dir is None:
+        return
+
+    path = os.path.join(_snapshot_dir, f'{os.getpid()}.json')
+    with _snapshot_lock:
+        # 先写临时文件再替换，读取方不会读到写了一半的快照
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(REGISTRY.snapshot(), f)
+        os.replace(f'{path}.tmp', path)
+
+def start_snapshots(interval=SNAPSHOT_SECONDS):
+    """
+    Write the snapshot of this process every ``interval`` seconds in a daemon thread.
+
+    Args:
+        interval (float, optional): Seconds between snapshots.
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot()
+            except Exception as e:
+                logging.error(f"Failed to write metrics snapshot: {str(e)}")
+
+    threading.Thread(target=run, name='metrics-snapshot', daemon=True).start()
+
+def retire_worker(pid):
+    """
+    Keep the counters of an exited worker. Called in the master.
+
+    The snapshot is renamed in one step, so a concurrent scrape reads it
+    either under its old or its new name.
+
+    Args:
+        pid (int): The process ID of the worker.
+    """
+    if _snapshot_dir is None:
+        return
+
+    try:
+        os.replace(os.path.join(_snapshot_dir, f'{pid}.json'), os.path.join(_snapshot_dir, f'exited-{pid}.json'))
+    except FileNotFoundError:
+        pass
+
+def _read_snapshot(directory, filename):
+    names = [filename]
+    if not filename.startswith('exited-'):
+        # 读取前工作进程可能已退出，快照已改名
+        names.append(f'exited-{filename}')
+
+    for name in names:
+        try:
+            with open(os.path.join(directory, name)) as f:
+                return name, json.load(f)
+        except FileNotFoundError:
+            continue
+    return None, None
+
+def render():
+    """
+    Render the metrics of this process, or of all worker processes in
+    multiprocess mode (see ``enable_multiprocess``).
+
+    Returns:
+        str: The metrics in the Prometheus text exposition format.
+    """
+    directory = _snapshot_dir
+    if directory is None:
+        return REGISTRY.render()
+
+    write_snapshot()
+
+    merged = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+
+        name, snapshot = _read_snapshot(directory, filename)
+        if snapshot is None:
+            continue
+        pid = None if name.startswith('exited-') else name[:-len('.json')]
+
+        for metric_name, metric in snapshot.items():
+            target = merged.setdefault(metric_name, {
+                'type': metric['type'],
+                'documentation': metric['documentation'],
+                'samples': {}
+            })
+            gauge = metric['type'] == 'gauge'
+            if gauge and pid is None:
+                # 已退出进程的瞬时值没有意义
+                continue
+
+            for sample_name, labelnames, labels, value in metric['samples']:
+                if gauge:
+                    labelnames = labelnames + ['pid']
+                    labels = labels + [pid]
+                key = (sample_name, tuple(labelnames), tuple(labels))
+                target['samples'][key] = target['samples'].get(key, 0) + value
+
+    return _render_snapshot({
+        metric_name: {
+            'type': metric['type'],
+            'documentation': metric['documentation'],
+            'samples': [[*key, value] for key, value in metric['samples'].items()]
+        }
+        for metric_name, metric in merged.items()
+    })
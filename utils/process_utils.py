@@ -0,0 +1,18 @@
+def get_process_context():
+    """
+    Get the multiprocessing context for worker process pools.
+
+    The server and command line processes already run several threads (the
+    database writer, the log listener, job executors). A child forked from
+    such a process can deadlock on a lock one of those threads held at fork
+    time, so workers are started with ``forkserver`` where it is available
+    and ``spawn`` elsewhere (Windows).
+
+    Returns:
+        multiprocessing.context.BaseContext: The context to pass as ``mp_context``.
+    """
+    # 用到时才加载 multiprocessing，不拖慢服务启动
+    import multiprocessing
+
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
@@ -0,0 +1,152 @@
+import io
+import tempfile
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NEED_DATA
+
+# 每次从请求流中读取的字节数
+READ_CHUNK_SIZE = 64 * 1024
+
+# 上传文件超过该大小（字节）时才写入磁盘临时文件
+SPOOL_MAX_MEMORY = 4 * 1024 * 1024
+
+class ChunkReader(io.RawIOBase):
+    """
+    A read-only binary stream over an iterable of byte chunks.
+
+    Wrap it in ``io.TextIOWrapper`` to decode and split lines incrementally.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            self._buffer = next(self._chunks, None)
+            if self._buffer is None:
+                self._buffer = b''
+                return 0
+
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+def iter_text_lines(chunks, encoding='utf-8-sig', newline=None):
+    """
+    Decode byte chunks incrementally and yield text lines.
+
+    Args:
+        chunks (iterable): Byte chunks.
+        encoding (str, optional): The text encoding. Defaults to 'utf-8-sig'.
+        newline (str, optional): Newline handling as for ``open()``; pass '' for
+                                 the ``csv`` module.
+
+    Returns:
+        io.TextIOWrapper: A text stream whose iteration yields lines.
+    """
+    return io.TextIOWrapper(io.BufferedReader(ChunkReader(chunks)), encoding=encoding, newline=newline)
+
+def spool_upload(chunks, max_memory=SPOOL_MAX_MEMORY):
+    """
+    Buffer an uploaded file so it can be read after the request has ended.
+
+    Files up to ``max_memory`` bytes stay in memory; larger files roll over to
+    an anonymous temporary file, which the operating system removes once it is
+    closed.
+
+    Args:
+        chunks (iterable): Byte chunks.
+        max_memory (int, optional): Size in bytes above which the file is moved to disk.
+
+    Returns:
+        tempfile.SpooledTemporaryFile: The file, positioned at the start. The
+                                       caller must close it, see ``close_files``.
+    """
+    f = tempfile.SpooledTemporaryFile(max_size=max_memory, prefix='nekowords-upload-')
+    try:
+        for chunk in chunks:
+            f.write(chunk)
+        f.seek(0)
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+def close_files(files):
+    """
+    Close buffered uploads, see ``spool_upload``.
+
+    Args:
+        files (iterable): File objects.
+    """
+    for f in files:
+        f.close()
+
+def iter_uploaded_files(stream, boundary, field_name='files', chunk_size=READ_CHUNK_SIZE):
+    """
+    Parse a multipart/form-data request body as it is read.
+
+    Yields one ``(filename, chunks)`` pair per uploaded file, where ``chunks``
+    is a generator of the file's bytes. Files arrive one after another in the
+    body, so ``chunks`` must be consumed (or abandoned) before advancing to
+    the next file; anything left unread is skipped. Nothing is buffered beyond
+    a single read chunk.
+
+    Args:
+        stream (file-like): The request body stream.
+        boundary (str): The multipart boundary from the Content-Type header.
+        field_name (str, optional): Only file parts of this form field are yielded.
+        chunk_size (int, optional): Number of bytes read from the stream at a time.
+
+    Returns:
+        generator: ``(filename, chunks)`` pairs.
+    """
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    eof = False
+
+    def next_event():
+        nonlocal eof
+        while True:
+            event = decoder.next_event()
+            if event is not NEED_DATA:
+                return event
+            if eof:
+                raise ValueError('Unexpected end of multipart body')
+
+            data = stream.read(chunk_size)
+            if data:
+                decoder.receive_data(data)
+            else:
+                decoder.receive_data(None)
+                eof = True
+
+    def iter_part_data():
+        while True:
+            event = next_event()
+            if not isinstance(event, Data):
+                raise ValueError('Malformed multipart body')
+            if event.data:
+                yield event.data
+            if not event.more_data:
+                return
+
+    while True:
+        event = next_event()
+        if isinstance(event, Epilogue):
+            return
+
+        if isinstance(event, File) and event.name == field_name:
+            part = iter_part_data()
+            yield event.filename, part
+        elif isinstance(event, (Field, File)):
+            # 跳过其他表单字段
+            part = iter_part_data()
+        else:
+            continue
+
+        # 跳过调用方没有读完的数据
+        for _ in part:
+            pass